@@ -0,0 +1,31 @@
+#!/bin/bash
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+export LANG=en_US.UTF-8
+export PYTHONPATH=.:$PYTHONPATH
+for benchmark in *benchmark.py; do
+    echo "###### ${benchmark}"
+    python3 ${benchmark}
+done
@@ -0,0 +1,74 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os import system  # DO_NOT_DISTRIBUTE
+from seecrdeps import includeParentAndDeps  # DO_NOT_DISTRIBUTE
+includeParentAndDeps(__file__)  # DO_NOT_DISTRIBUTE
+
+from sys import argv
+from time import time
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from meresco.fetch.harvester import _Events
+from meresco.fetch._eventstore import openEventLog, writeEventBlock, formatEvent
+
+
+class UnbufferedEvents(_Events):
+    def markEvent(self, identifier, uploadData=None, delete=False):
+        _Events.markEvent(self, identifier, uploadData=uploadData, delete=delete)
+        with openEventLog(self._currentEventsPath) as fp:
+            writeEventBlock(fp, [formatEvent(*event) for event in self._pending])
+        self._addCurrent(self._pending)
+        self._pending = []
+
+
+def markEvents(eventsClass, nrOfRecords, batchSize, **kwargs):
+    tempdir = mkdtemp()
+    try:
+        events = eventsClass(tempdir, **kwargs)
+        events.markHarvestStart()
+        t0 = time()
+        for i in range(nrOfRecords):
+            events.markEvent('oai:example.org:%08d' % i, uploadData='<record>%s</record>' % i)
+            if (i + 1) % batchSize == 0:
+                events.flush()
+        events.markHarvestReady()
+        return nrOfRecords / (time() - t0)
+    finally:
+        rmtree(tempdir)
+
+
+def main(nrOfRecords=200000, batchSize=200):
+    print("%d records, %d records per batch" % (nrOfRecords, batchSize))
+    for name, eventsClass, kwargs in [
+            ('open/append/close per record', UnbufferedEvents, {}),
+            ('buffered, flush per batch', _Events, {}),
+            ('buffered, flush and fsync per batch', _Events, {'fsync': True}),
+        ]:
+        print("%-40s %10.0f records/second" % (name, markEvents(eventsClass, nrOfRecords, batchSize, **kwargs)))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:]])
@@ -0,0 +1,108 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os import system  # DO_NOT_DISTRIBUTE
+from seecrdeps import includeParentAndDeps  # DO_NOT_DISTRIBUTE
+includeParentAndDeps(__file__)  # DO_NOT_DISTRIBUTE
+
+from sys import argv
+from os import remove
+from os.path import join
+from time import time
+from tempfile import mkdtemp
+from shutil import rmtree
+from hashlib import md5
+from tracemalloc import start, stop, get_traced_memory
+
+from meresco.fetch.harvester import _Events
+
+
+def writePrevious(stateDir, nrOfRecords):
+    with open(join(stateDir, 'previous'), 'w') as fp:
+        for i in range(nrOfRecords):
+            identifier = 'oai:repository.example.org:record/%08d' % i
+            if i % 10 == 0:
+                fp.write('%s\tD\t\n' % identifier)
+            else:
+                fp.write('%s\tA\t%s\n' % (identifier, md5(identifier.encode()).hexdigest()))
+
+
+def loadPrevious(stateDir, compact):
+    start()
+    try:
+        t0 = time()
+        events = _Events(stateDir, compact=compact)
+        loadTime = time() - t0
+        size, _ = get_traced_memory()
+    finally:
+        stop()
+    return events, loadTime, size
+
+
+def markCurrent(stateDir, compact, nrOfRecords):
+    events = _Events(stateDir, compact=compact)
+    events.markHarvestStart()
+    start()
+    try:
+        t0 = time()
+        for i in range(nrOfRecords):
+            events.markEvent('oai:repository.example.org:record/%08d' % ((i * 7919) % nrOfRecords), uploadData='data')
+            if i % 1000 == 0:
+                events.flush()
+        events.flush()
+        markTime = time() - t0
+        size, _ = get_traced_memory()
+    finally:
+        stop()
+        events.close()
+    return markTime, size
+
+
+def main(nrOfRecords=1000000):
+    stateDir = mkdtemp()
+    try:
+        writePrevious(stateDir, nrOfRecords)
+        print("%d identifiers in previous" % nrOfRecords)
+        sizes = {}
+        for compact in [False, True]:
+            events, loadTime, sizes[compact] = loadPrevious(stateDir, compact)
+            t0 = time()
+            for i in range(0, nrOfRecords, 7):
+                events.alreadyAdded('oai:repository.example.org:record/%08d' % i, 'data')
+            lookups = len(range(0, nrOfRecords, 7)) / (time() - t0)
+            del events
+            print("%-8s load %6.2fs, %8.1f MB, %6.1f bytes/identifier, %10.0f lookups/second" % (
+                'compact' if compact else 'dict', loadTime, sizes[compact] / 2.0 ** 20, sizes[compact] / float(nrOfRecords), lookups))
+        print("memory reduction: %.1fx" % (sizes[False] / float(sizes[True])))
+        for compact in [False, True]:
+            markTime, size = markCurrent(stateDir, compact, nrOfRecords)
+            remove(join(stateDir, 'current'))
+            print("%-8s current harvest %6.2fs, %8.1f MB, %6.1f bytes/identifier" % (
+                'compact' if compact else 'dict', markTime, size / 2.0 ** 20, size / float(nrOfRecords)))
+    finally:
+        rmtree(stateDir)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:]])
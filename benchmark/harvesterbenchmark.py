@@ -0,0 +1,193 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os import system  # DO_NOT_DISTRIBUTE
+from seecrdeps import includeParentAndDeps  # DO_NOT_DISTRIBUTE
+includeParentAndDeps(__file__)  # DO_NOT_DISTRIBUTE
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from json import dumps
+from multiprocessing import get_context
+from resource import getrusage, RUSAGE_SELF
+from tempfile import mkdtemp
+from time import time
+from shutil import rmtree
+from sys import platform
+
+from meresco.fetch.harvester import Harvester, BatchProtocol, RecordProtocol
+
+
+class SyntheticSource(object):
+    def __init__(self, nrOfRecords, batchSize, payloadSize, changed=lambda i: False, deleted=lambda i: False, missing=lambda i: False):
+        self._nrOfRecords = nrOfRecords
+        self._batchSize = batchSize
+        self._payload = 'x' * payloadSize
+        self._changed = changed
+        self._deleted = deleted
+        self._missing = missing
+        self.uploads = self.deletes = 0
+        self.metrics = None
+        self.lastBatchDone = None
+
+    def downloadBatch(self, resumptionAttributes):
+        start = resumptionAttributes.get('start', 0)
+        end = min(start + self._batchSize, self._nrOfRecords)
+        batch = SyntheticBatch(end, end >= self._nrOfRecords)
+        batch.records = [SyntheticRecord(i, self._payload, changed=self._changed(i), deleted=self._deleted(i)) for i in range(start, end) if not self._missing(i)]
+        return batch
+
+    def convert(self, record):
+        return '<record id="%s">%s%s</record>' % (record.identifier, record.payload, '.changed' if record.changed else '')
+
+    def uploadRecord(self, identifier, data):
+        self.uploads += 1
+
+    def deleteRecord(self, identifier):
+        self.deletes += 1
+
+    def flushUploads(self):
+        pass
+
+    def batchDone(self, batch):
+        self.lastBatchDone = time()
+
+    def harvestMetrics(self, metrics):
+        self.metrics = metrics
+
+
+class SyntheticBatch(BatchProtocol):
+    __slots__ = ('next',)
+
+    def __init__(self, next, harvestingReady):
+        BatchProtocol.__init__(self)
+        self.next = next
+        self.harvestingReady = harvestingReady
+
+    def resumptionAttributes(self):
+        return {'start': self.next}
+
+
+class SyntheticRecord(RecordProtocol):
+    __slots__ = ('payload', 'changed', 'deleted')
+
+    def __init__(self, i, payload, changed, deleted):
+        self.identifier = 'oai:synthetic.example.org:%010d' % i
+        self.payload = payload
+        self.changed = changed
+        self.deleted = deleted
+
+    def mustAdd(self):
+        return not self.deleted
+
+    def mustDelete(self):
+        return self.deleted
+
+
+def ratio(fraction):
+    if fraction <= 0:
+        return lambda i: False
+    step = max(1, int(round(1 / fraction)))
+    return lambda i: i % step == 0
+
+
+def syntheticSource(options, secondHarvest):
+    if not secondHarvest:
+        return SyntheticSource(options.records, options.batchSize, options.payloadSize)
+    deleted = ratio(options.deleteRatio / 2)
+    changeRatio = ratio(options.changeRatio)
+    missing = lambda i: not deleted(i) and deleted(i + 1)
+    changed = lambda i: changeRatio(i + 2)
+    return SyntheticSource(options.records, options.batchSize, options.payloadSize, changed=changed, deleted=deleted, missing=missing)
+
+
+def harvestInSubprocess(*args, **kwargs):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:  # a fresh process, so its peak RSS is this harvest's
+        return executor.submit(harvest, *args, **kwargs).result()
+
+
+def harvest(statePath, options, secondHarvest=False, **kwargs):
+    source = syntheticSource(options, secondHarvest)
+    t0 = time()
+    harvester = Harvester(statePath, metricsInterval=24 * 60 * 60, **kwargs)
+    loadTime = time() - t0
+    harvester.addObserver(source)
+    t0 = time()
+    harvester.harvest()
+    end = time()
+    metrics = source.metrics['harvest']
+    return {
+        'eventsLoadSeconds': round(loadTime, 3),
+        'harvestSeconds': round(end - t0, 3),
+        'deletionSeconds': round(end - source.lastBatchDone, 3),
+        'records': metrics['records'],
+        'recordsPerSecond': metrics['recordsPerSecond'],
+        'stageRecordsPerSecond': dict((phase, round(metrics['records'] / seconds) if seconds else None) for phase, seconds in sorted(metrics['phases'].items())),
+        'uploads': source.uploads,
+        'deletes': source.deletes,
+        'peakRssMB': round(peakRss() / 2.0 ** 20, 1),
+    }
+
+
+def peakRss():
+    maxrss = getrusage(RUSAGE_SELF).ru_maxrss
+    return maxrss if platform == 'darwin' else maxrss * 1024
+
+
+def main():
+    parser = ArgumentParser(description='Harvester throughput and memory with a synthetic source.')
+    parser.add_argument('--records', type=int, default=100000, help='10^4 up to 10^7')
+    parser.add_argument('--batchSize', type=int, default=1000)
+    parser.add_argument('--payloadSize', type=int, default=1000, help='bytes per converted record')
+    parser.add_argument('--changeRatio', type=float, default=0.1, help='fraction of records changed in the second harvest')
+    parser.add_argument('--deleteRatio', type=float, default=0.05, help='fraction of records deleted in, and missing from, the second harvest')
+    parser.add_argument('--compactEvents', action='store_true')
+    parser.add_argument('--eventStore', default='files', choices=['files', 'sqlite'])
+    parser.add_argument('--output', default='harvesterbenchmark.jsonl', help='results are appended as one JSON line')
+    options = parser.parse_args()
+
+    statePath = mkdtemp()
+    try:
+        kwargs = dict(compactEvents=options.compactEvents, eventStore=options.eventStore)
+        initial = harvestInSubprocess(statePath, options, **kwargs)
+        second = harvestInSubprocess(statePath, options, secondHarvest=True, harvestInterval=0, **kwargs)
+    finally:
+        rmtree(statePath)
+
+    result = dict(
+        timestamp=time(),
+        options=vars(options),
+        initialHarvest=initial,
+        secondHarvest=second,
+    )
+    with open(options.output, 'a') as fp:
+        fp.write(dumps(result, sort_keys=True) + '\n')
+    for name, stats in [('initial harvest', initial), ('second harvest', second)]:
+        print("%-16s %8.0f records/second, events load %6.2fs, deletion %6.2fs, peak RSS %7.1f MB" % (
+            name, stats['recordsPerSecond'], stats['eventsLoadSeconds'], stats['deletionSeconds'], stats['peakRssMB']))
+        print("%-16s %s" % ('', ', '.join('%s %s/s' % (phase, rate) for phase, rate in stats['stageRecordsPerSecond'].items())))
+
+
+if __name__ == '__main__':
+    main()
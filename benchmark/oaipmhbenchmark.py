@@ -0,0 +1,120 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os import system  # DO_NOT_DISTRIBUTE
+from seecrdeps import includeParentAndDeps  # DO_NOT_DISTRIBUTE
+includeParentAndDeps(__file__)  # DO_NOT_DISTRIBUTE
+
+from argparse import ArgumentParser
+from json import dumps
+from os import devnull
+from tempfile import mkdtemp
+from time import time
+from shutil import rmtree
+
+from meresco.fetch import Harvester, OaiPmhDownload, Upload
+
+from standinservers import OaiPmhServer, SruUpdateServer
+
+
+class Convert(object):
+    def convert(self, record):
+        return record.asString()
+
+
+def percentiles(values, ps=(50, 90, 99)):
+    values = sorted(values)
+    if not values:
+        return dict(('p%s' % p, None) for p in ps)
+    return dict(('p%s' % p, round(values[min(len(values) - 1, int(len(values) * p / 100.0))] * 1000, 2)) for p in ps)
+
+
+def serverStats(server, seconds):
+    durations = [duration for duration, _ in server.requests]
+    nrOfBytes = sum(nrOfBytes for _, nrOfBytes in server.requests)
+    return dict(
+        requests=len(server.requests),
+        requestsPerSecond=round(len(server.requests) / seconds, 1),
+        bytes=nrOfBytes,
+        bytesPerSecond=round(nrOfBytes / seconds),
+        latencyMs=percentiles(durations),
+    )
+
+
+def main():
+    parser = ArgumentParser(description='End-to-end OaiPmhDownload -> Harvester -> Upload against local stand-in servers.')
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--pageSize', type=int, default=200)
+    parser.add_argument('--payloadSize', type=int, default=500, help='bytes of metadata per record')
+    parser.add_argument('--deleteRatio', type=float, default=0.01)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every OAI-PMH response')
+    parser.add_argument('--uploadLatency', type=float, default=0.0, help='seconds added to every SRU update response')
+    parser.add_argument('--uploadConcurrency', type=int, default=4)
+    parser.add_argument('--batchUpload', action='store_true')
+    parser.add_argument('--prefetch', action='store_true')
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--output', default='oaipmhbenchmark.jsonl', help='results are appended as one JSON line')
+    options = parser.parse_args()
+
+    oaiServer = OaiPmhServer(options.records, pageSize=options.pageSize, deleteRatio=options.deleteRatio, latency=options.latency, payloadSize=options.payloadSize).start()
+    sruServer = SruUpdateServer(latency=options.uploadLatency).start()
+    statePath = mkdtemp()
+    try:
+        with open(devnull, 'w') as log:
+            harvester = Harvester(statePath, log=log, prefetch=options.prefetch, batchUpload=options.batchUpload)
+            harvester.addObserver(OaiPmhDownload(
+                repositories=[{'baseurl': oaiServer.url('/oai'), 'metadataPrefix': 'oai_dc', 'repositoryGroupId': 'standin'}],
+                log=log,
+                streaming=options.streaming))
+            harvester.addObserver(Convert())
+            harvester.addObserver(Upload(baseUrl=sruServer.url('/update'), log=log, concurrency=options.uploadConcurrency, bulk=options.batchUpload))
+            t0 = time()
+            harvester.harvest()
+            seconds = time() - t0
+    finally:
+        oaiServer.stop()
+        sruServer.stop()
+        rmtree(statePath)
+
+    download = serverStats(oaiServer, seconds)
+    upload = serverStats(sruServer, seconds)
+    result = dict(
+        timestamp=time(),
+        options=vars(options),
+        seconds=round(seconds, 3),
+        recordsPerSecond=round(options.records / seconds),
+        download=download,
+        upload=upload,
+    )
+    with open(options.output, 'a') as fp:
+        fp.write(dumps(result, sort_keys=True) + '\n')
+    print("%d records in %.2fs, %.0f records/second" % (options.records, seconds, options.records / seconds))
+    for name, stats in [('download', download), ('upload', upload)]:
+        print("%-8s %6d requests, %8.1f requests/second, %8.1f KB/second, latency ms p50 %s p90 %s p99 %s" % (
+            name, stats['requests'], stats['requestsPerSecond'], stats['bytesPerSecond'] / 1024.0,
+            stats['latencyMs']['p50'], stats['latencyMs']['p90'], stats['latencyMs']['p99']))
+
+
+if __name__ == '__main__':
+    main()
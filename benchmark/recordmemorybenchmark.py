@@ -0,0 +1,88 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os import system  # DO_NOT_DISTRIBUTE
+from seecrdeps import includeParentAndDeps  # DO_NOT_DISTRIBUTE
+includeParentAndDeps(__file__)  # DO_NOT_DISTRIBUTE
+
+from sys import argv
+from tracemalloc import start, stop, get_traced_memory
+
+from meresco.fetch.oaipmhdownload import _Batch, Record
+
+
+class DictRecord(object):
+    def __init__(self, batch, item):
+        self.batch = batch
+        self.item = item
+        self.repositoryGroupId = batch.repositoryGroupId
+        self.repositoryId = batch.repositoryId
+        self.setSpec = batch.setSpec
+        self.metadataPrefix = batch.metadataPrefix
+        self.baseurl = batch.baseurl
+        self.recordIdentifier = item.identifier
+        self.identifier = "%s:%s" % (batch.repositoryGroupId, self.recordIdentifier)
+
+
+class Item(object):
+    __slots__ = ('identifier', 'deleted')
+
+    def __init__(self, identifier):
+        self.identifier = identifier
+        self.deleted = False
+
+
+class OaiBatch(object):
+    def __init__(self):
+        self.resumptionToken = 'token'
+        self.baseurl = 'http://repository.example.org/oai'
+        self.request = self
+
+
+def recordsSize(recordClass, items, batchSize):
+    repository = {'repositoryGroupId': 'group', 'repositoryId': 'repository', 'setSpec': 'set', 'metadataPrefix': 'oai_dc'}
+    start()
+    try:
+        records = []
+        for i in range(0, len(items), batchSize):
+            batch = _Batch(OaiBatch(), repositoriesRemaining=[repository])
+            records.extend(recordClass(batch, item) for item in items[i:i + batchSize])
+        size, _ = get_traced_memory()
+    finally:
+        stop()
+    return size
+
+
+def main(nrOfRecords=100000, batchSize=1000):
+    items = [Item('oai:repository.example.org:record/%08d' % i) for i in range(nrOfRecords)]
+    print("%d records in batches of %d" % (nrOfRecords, batchSize))
+    sizes = {}
+    for name, recordClass in [('dict', DictRecord), ('slots', Record)]:
+        sizes[name] = recordsSize(recordClass, items, batchSize)
+        print("%-6s %8.1f MB, %6.1f bytes/record" % (name, sizes[name] / 2.0 ** 20, sizes[name] / float(nrOfRecords)))
+    print("memory reduction: %.1fx" % (sizes['dict'] / float(sizes['slots'])))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:]])
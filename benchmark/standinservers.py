@@ -0,0 +1,157 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from time import sleep, perf_counter
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handlerClass):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), handlerClass)
+        self._lock = Lock()
+        self.requests = []
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%s%s' % (self.server_address[1], path)
+
+    def logRequest(self, seconds, nrOfBytes):
+        with self._lock:
+            self.requests.append((seconds, nrOfBytes))
+
+
+class OaiPmhServer(_StandInServer):
+    def __init__(self, nrOfRecords, pageSize=200, deleteRatio=0.0, latency=0.0, payloadSize=500):
+        _StandInServer.__init__(self, _OaiPmhHandler)
+        self.nrOfRecords = nrOfRecords
+        self.pageSize = pageSize
+        self.deleteEvery = int(round(1 / deleteRatio)) if deleteRatio > 0 else 0
+        self.latency = latency
+        self.payload = escape('x' * payloadSize)
+
+    def response(self, arguments):
+        verb = arguments.get('verb')
+        if verb == 'Identify':
+            return IDENTIFY
+        if verb != 'ListRecords':
+            return OAI_ERROR % dict(code='badVerb', message='Unsupported verb')
+        start = int(arguments.get('resumptionToken') or 0)
+        end = min(start + self.pageSize, self.nrOfRecords)
+        return LIST_RECORDS % dict(
+            records=''.join(self._record(i) for i in range(start, end)),
+            resumptionToken=end if end < self.nrOfRecords else '')
+
+    def _record(self, i):
+        if self.deleteEvery and i % self.deleteEvery == 0:
+            return DELETED_RECORD % dict(identifier=i)
+        return RECORD % dict(identifier=i, payload=self.payload)
+
+
+class SruUpdateServer(_StandInServer):
+    def __init__(self, latency=0.0):
+        _StandInServer.__init__(self, _SruUpdateHandler)
+        self.latency = latency
+
+
+class _OaiPmhHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        t0 = perf_counter()
+        if self.server.latency:
+            sleep(self.server.latency)
+        arguments = dict((key, values[0]) for key, values in parse_qs(urlparse(self.path).query).items())
+        body = self.server.response(arguments).encode()
+        _respond(self, body)
+        self.server.logRequest(perf_counter() - t0, len(body))
+
+    def log_message(self, *args):
+        pass
+
+
+class _SruUpdateHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        t0 = perf_counter()
+        nrOfBytes = int(self.headers['Content-Length'])
+        self.rfile.read(nrOfBytes)
+        if self.server.latency:
+            sleep(self.server.latency)
+        _respond(self, SRU_UPDATE_RESPONSE)
+        self.server.logRequest(perf_counter() - t0, nrOfBytes)
+
+    def log_message(self, *args):
+        pass
+
+
+def _respond(handler, body):
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'text/xml; charset=utf-8')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+OAI_PMH = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+<responseDate>2026-01-01T00:00:00Z</responseDate>
+<request>http://127.0.0.1/oai</request>
+%s
+</OAI-PMH>"""
+
+LIST_RECORDS = OAI_PMH % """<ListRecords>%(records)s
+<resumptionToken>%(resumptionToken)s</resumptionToken>
+</ListRecords>"""
+
+RECORD = """
+<record><header><identifier>oai:standin:%(identifier)s</identifier><datestamp>2026-01-01T00:00:00Z</datestamp></header>
+<metadata><dc xmlns="http://purl.org/dc/elements/1.1/"><identifier>%(identifier)s</identifier><description>%(payload)s</description></dc></metadata></record>"""
+
+DELETED_RECORD = """
+<record><header status="deleted"><identifier>oai:standin:%(identifier)s</identifier><datestamp>2026-01-01T00:00:00Z</datestamp></header></record>"""
+
+IDENTIFY = OAI_PMH % """<Identify><repositoryName>Stand-in</repositoryName><baseURL>http://127.0.0.1/oai</baseURL><protocolVersion>2.0</protocolVersion>
+<earliestDatestamp>2026-01-01T00:00:00Z</earliestDatestamp><deletedRecord>persistent</deletedRecord><granularity>YYYY-MM-DDThh:mm:ssZ</granularity></Identify>"""
+
+OAI_ERROR = OAI_PMH % """<error code="%(code)s">%(message)s</error>"""
+
+SRU_UPDATE_RESPONSE = b"""<srw:updateResponse xmlns:srw="http://www.loc.gov/zing/srw/" xmlns:ucp="info:lc/xmlns/update-v1">
+    <srw:version>1.0</srw:version>
+    <ucp:operationStatus>success</ucp:operationStatus>
+</srw:updateResponse>"""
@@ -30,6 +30,8 @@
 ## end license ##
 
 from .harvester import Harvester, SkipRecordException
-from .upload import Upload
-from .oaipmhdownload import OaiPmhDownload
+from .asyncharvester import AsyncHarvester
+from .upload import Upload, AsyncUpload
+from .oaipmhdownload import OaiPmhDownload, AsyncOaiPmhDownload
 from .onbatchdone import OnBatchDone
+from .scheduler import Scheduler
@@ -0,0 +1,107 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from gzip import open as gzipOpen
+from hashlib import md5
+from os import listdir, makedirs, remove, rename, stat
+from os.path import join, isdir, isfile
+from time import time
+
+
+class BatchCache(object):
+    def __init__(self, directory, maxAge=None, maxBytes=None):
+        self._directory = directory
+        self._maxAge = maxAge
+        self._maxBytes = maxBytes
+        if not isdir(directory):
+            makedirs(directory)
+
+    def store(self, request, response):
+        return _Tee(response, self._path(request), onComplete=self.prune)
+
+    def open(self, request):
+        path = self._path(request)
+        if not isfile(path):
+            raise IOError("Batch not in cache: %s" % request.buildUrl())
+        return gzipOpen(path, 'rb')
+
+    def prune(self, keep=None):
+        now = time()
+        entries = []
+        for name in listdir(self._directory):
+            if not name.endswith(EXTENSION):
+                continue
+            path = join(self._directory, name)
+            s = stat(path)
+            if path != keep and self._maxAge is not None and now - s.st_mtime > self._maxAge:
+                remove(path)
+                continue
+            entries.append((s.st_mtime, path, s.st_size))
+        if self._maxBytes is None:
+            return
+        totalSize = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if totalSize <= self._maxBytes:
+                break
+            if path != keep:
+                remove(path)
+                totalSize -= size
+
+    def _path(self, request):
+        return join(self._directory, md5('|'.join(str(part) for part in request.cacheKey()).encode()).hexdigest() + EXTENSION)
+
+
+class _Tee(object):
+    def __init__(self, response, path, onComplete):
+        self._response = response
+        self._path = path
+        self._onComplete = onComplete
+        self._file = gzipOpen(path + '.tmp', 'wb')
+
+    def read(self, size=-1):
+        data = self._response.read(size)
+        self._file.write(data)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        complete = False
+        try:
+            if exc_type is None:
+                while self.read(READ_SIZE):
+                    pass
+                complete = True
+        finally:
+            self._response.close()
+            self._file.close()
+            if not complete:
+                remove(self._path + '.tmp')
+        if complete:
+            rename(self._path + '.tmp', self._path)
+            self._onComplete(keep=self._path)
+
+EXTENSION = '.xml.gz'
+READ_SIZE = 64 * 1024
@@ -0,0 +1,296 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from array import array
+from functools import reduce
+
+from ._externalsort import mergeJoin
+
+
+class CompactIndex(object):
+    def __init__(self, keys=b'', blockOffsets=None, actions=b'', digests=b'', fingerprints=b''):
+        self._keys = keys
+        self._blockOffsets = array('I') if blockOffsets is None else blockOffsets
+        self._actions = actions
+        self._digests = digests
+        self._fingerprints = fingerprints
+
+    @classmethod
+    def fromEvents(cls, events):
+        builder = _Builder()
+        unsorted = None
+        for identifier, action, dataHash, *fingerprintHash in events:
+            key = identifier.encode()
+            packed = _pack(action, dataHash, *fingerprintHash)
+            if unsorted is None:
+                if builder.append(key, packed):
+                    continue
+                unsorted = dict(builder.build()._packedItems())
+            unsorted[key] = packed
+        if unsorted is not None:
+            builder = _Builder()
+            for key in sorted(unsorted):
+                builder.appendPacked(key, unsorted.pop(key))
+        return builder.build()
+
+    def get(self, identifier, default=None):
+        index = self._find(identifier.encode())
+        if index is None:
+            return default
+        return self._entry(index)
+
+    def __contains__(self, identifier):
+        return self._find(identifier.encode()) is not None
+
+    def __len__(self):
+        return len(self._actions)
+
+    def items(self):
+        for index, key in enumerate(self._iterKeys(0, len(self._keys))):
+            yield key.decode(), self._entry(index)
+
+    def _packedItems(self):
+        for index, key in enumerate(self._iterKeys(0, len(self._keys))):
+            yield key, self._packed(index)
+
+    def _find(self, key):
+        lo, hi = 0, len(self._blockOffsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._blockHead(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        block = lo - 1
+        if block < 0:
+            return None
+        end = self._blockOffsets[block + 1] if block + 1 < len(self._blockOffsets) else len(self._keys)
+        for index, blockKey in enumerate(self._iterKeys(self._blockOffsets[block], end), start=block * BLOCK_SIZE):
+            if blockKey == key:
+                return index
+            if blockKey > key:
+                break
+        return None
+
+    def _blockHead(self, block):
+        offset = self._blockOffsets[block]
+        _, offset = _readVarint(self._keys, offset)
+        length, offset = _readVarint(self._keys, offset)
+        return self._keys[offset:offset + length]
+
+    def _iterKeys(self, offset, end):
+        keys = self._keys
+        key = b''
+        while offset < end:
+            shared, offset = _readVarint(keys, offset)
+            length, offset = _readVarint(keys, offset)
+            key = key[:shared] + keys[offset:offset + length]
+            offset += length
+            yield key
+
+    def _digest(self, index):
+        return self._digests[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE]
+
+    def _fingerprint(self, index):
+        return self._fingerprints[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE]
+
+    def _packed(self, index):
+        return self._actions[index:index + 1] + self._digest(index) + self._fingerprint(index)
+
+    def _entry(self, index):
+        return _unpack(self._packed(index))
+
+
+class PendingIndex(object):
+    def __init__(self, bufferSize=100000):
+        self._bufferSize = bufferSize
+        self._buffer = {}
+        self._runs = []
+
+    def __setitem__(self, identifier, event):
+        self._buffer[identifier.encode()] = _pack(*event)
+        if len(self._buffer) >= self._bufferSize:
+            self._freezeBuffer()
+
+    def get(self, identifier, default=None):
+        packed = self._findPacked(identifier.encode())
+        return default if packed is None else _unpack(packed)
+
+    def __contains__(self, identifier):
+        return self._findPacked(identifier.encode()) is not None
+
+    def items(self):
+        for key, packed in self._packedItems():
+            yield key.decode(), _unpack(packed)
+
+    def mergedInto(self, index):
+        builder = _Builder()
+        for key, packed in _newest(index._packedItems(), self._packedItems()):
+            builder.appendPacked(key, packed)
+        return builder.build()
+
+    def _findPacked(self, key):
+        packed = self._buffer.get(key)
+        if packed is None:
+            hashed = hash(key)
+            for run in reversed(self._runs):
+                packed = run.findPacked(key, hashed)
+                if packed is not None:
+                    break
+        return packed
+
+    def _packedItems(self):
+        return reduce(_newest, [run.index._packedItems() for run in self._runs] + [sorted(self._buffer.items())])
+
+    def _freezeBuffer(self):
+        run = _Run(sorted(self._buffer.items()))
+        self._buffer = {}
+        while self._runs and len(self._runs[-1].index) <= len(run.index):
+            run = _Run(_newest(self._runs.pop().index._packedItems(), run.index._packedItems()))
+        self._runs.append(run)
+
+
+class _Run(object):
+    def __init__(self, packedItems):
+        builder = _Builder()
+        hashes = array('q')
+        for key, packed in packedItems:
+            builder.appendPacked(key, packed)
+            hashes.append(hash(key))
+        self.index = builder.build()
+        self._mask = (1 << max(3, (len(hashes) * FILTER_BITS_PER_KEY - 1).bit_length())) - 1
+        self._filter = bytearray((self._mask + 1) // 8)
+        for hashed in hashes:
+            for bit in self._bits(hashed):
+                self._filter[bit >> 3] |= 1 << (bit & 7)
+
+    def findPacked(self, key, hashed):
+        for bit in self._bits(hashed):
+            if not self._filter[bit >> 3] & (1 << (bit & 7)):
+                return None
+        index = self.index._find(key)
+        return None if index is None else self.index._packed(index)
+
+    def _bits(self, hashed):
+        step = (hashed >> 32) | 1
+        return ((hashed + i * step) & self._mask for i in range(FILTER_HASHES))
+
+
+class _Builder(object):
+    def __init__(self):
+        self._keys = bytearray()
+        self._blockOffsets = array('Q')
+        self._actions = bytearray()
+        self._digests = bytearray()
+        self._fingerprints = bytearray()
+        self._lastKey = None
+
+    def append(self, key, packed):
+        if self._lastKey is not None and key <= self._lastKey:
+            return False
+        self.appendPacked(key, packed)
+        return True
+
+    def appendPacked(self, key, packed):
+        if len(self._actions) % BLOCK_SIZE == 0:
+            self._blockOffsets.append(len(self._keys))
+            shared = 0
+        else:
+            shared = _sharedPrefixLength(self._lastKey, key)
+        self._keys += _varint(shared) + _varint(len(key) - shared) + key[shared:]
+        fingerprint = packed[1 + DIGEST_SIZE:]
+        if fingerprint and fingerprint != NO_DIGEST:
+            self._fingerprints += bytes(len(self._digests) - len(self._fingerprints)) + fingerprint
+        self._actions += packed[:1]
+        self._digests += packed[1:1 + DIGEST_SIZE]
+        self._lastKey = key
+
+    def build(self):
+        blockOffsets = self._blockOffsets
+        if len(self._keys) < 2 ** 32:
+            blockOffsets = array('I', blockOffsets)
+        return CompactIndex(
+            keys=bytes(self._keys),
+            blockOffsets=blockOffsets,
+            actions=bytes(self._actions),
+            digests=bytes(self._digests),
+            fingerprints=bytes(self._fingerprints) + bytes(len(self._digests) - len(self._fingerprints)) if self._fingerprints else b'')
+
+
+def _pack(action, dataHash, fingerprintHash=None):
+    return action.encode() + _digest(dataHash) + (b'' if fingerprintHash is None else _digest(fingerprintHash))
+
+def _unpack(packed):
+    action = chr(packed[0])
+    if action == 'D':
+        return [action, '', None]
+    fingerprint = packed[1 + DIGEST_SIZE:]
+    return [action, packed[1:1 + DIGEST_SIZE].hex(), fingerprint.hex() if fingerprint and fingerprint != NO_DIGEST else None]
+
+def _newest(older, newer):
+    for key, previous, current in mergeJoin(older, newer):
+        yield key, (current or previous)[1]
+
+def _digest(hexHash):
+    try:
+        digest = bytes.fromhex(hexHash or '')
+    except ValueError:
+        digest = b''
+    return digest if len(digest) == DIGEST_SIZE else NO_DIGEST
+
+def _sharedPrefixLength(a, b):
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _varint(value):
+    if value < 0x80:
+        return bytes((value,))
+    result = bytearray()
+    while value >= 0x80:
+        result.append((value & 0x7f) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+def _readVarint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+BLOCK_SIZE = 16
+DIGEST_SIZE = 16
+NO_DIGEST = bytes(DIGEST_SIZE)
+FILTER_BITS_PER_KEY = 8
+FILTER_HASHES = 3
@@ -0,0 +1,83 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class SerialConvert(object):
+    lookahead = 0
+
+    def __init__(self, convert):
+        self._convert = convert
+
+    def submit(self, record):
+        return _Deferred(lambda: self._convert(record=record))
+
+    def close(self):
+        pass
+
+
+class PoolConvert(object):
+    def __init__(self, convert, workers, executorClass, arguments):
+        self._convert = convert
+        self._workers = workers
+        self._executorClass = executorClass
+        self._arguments = arguments
+        self._executor = None
+        self.lookahead = 2 * workers
+
+    def submit(self, record):
+        if self._executor is None:
+            self._executor = self._executorClass(max_workers=self._workers)
+        return self._executor.submit(self._convert, **self._arguments(record))
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+class _Deferred(object):
+    def __init__(self, f):
+        self._f = f
+
+    def result(self):
+        return self._f()
+
+    def cancel(self):
+        pass
+
+
+def convertStage(convert, workers=0, processConvert=None):
+    if processConvert is not None:
+        return PoolConvert(processConvert, workers or 1, ProcessPoolExecutor, arguments=_picklableArguments)
+    if workers:
+        return PoolConvert(convert, workers, ThreadPoolExecutor, arguments=_recordArgument)
+    return SerialConvert(convert)
+
+def _recordArgument(record):
+    return dict(record=record)
+
+def _picklableArguments(record):
+    return dict(identifier=record.identifier, data=record.asString())  # records may hold unpicklable parsed XML
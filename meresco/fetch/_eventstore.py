@@ -0,0 +1,151 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os import rename
+from os.path import isfile, getsize
+from hashlib import md5
+from struct import Struct
+from zlib import compress, decompress, error as ZlibError
+
+
+class EventStoreProtocol(object):
+    def markHarvestStart(self):
+        pass
+
+    def markEvent(self, identifier, uploadData=None, delete=False, sourceFingerprint=None):
+        pass
+
+    def markSourceUnchanged(self, identifier):
+        'mark the previous event for identifier again'
+
+    def flush(self):
+        'persist the events marked since the previous flush'
+
+    def discard(self):
+        'forget the events marked since the previous flush'
+
+    def close(self):
+        pass
+
+    def alreadyAdded(self, identifier, uploadData):
+        return False
+
+    def alreadyDeleted(self, identifier):
+        return False
+
+    def sourceUnchanged(self, identifier, sourceFingerprint):
+        return False
+
+    def toBeDeleted(self):
+        return 'sorted identifiers added in the previous harvest without an event in the current one'
+
+    def remainingAdds(self):
+        return 'sorted identifiers for which the last event was an add'
+
+    def markHarvestReady(self, merge=False):
+        'current events become the previous ones; with merge they only replace the previous events for the same identifiers'
+
+    def _makeHash(self, data):
+        return md5(data.encode()).hexdigest()
+
+
+LOG_MAGIC = b'MFEVLOG1'
+SORTED_MAGIC = b'MFEVSRT1'
+BLOCK_HEADER = Struct('>I')
+COMPACT_BLOCK_SIZE = 4096
+
+def iterEvents(eventsFilePath):
+    if not isfile(eventsFilePath):
+        return
+    with open(eventsFilePath, 'rb') as fp:
+        magic = fp.read(len(LOG_MAGIC))
+        if magic in (LOG_MAGIC, SORTED_MAGIC):
+            for block in _iterBlocks(fp):
+                for line in block.decode().split('\n'):
+                    if line:
+                        yield split(line, '\t', 4)
+            return
+    with open(eventsFilePath) as fp:
+        for line in fp:
+            line = line.strip()
+            if line:
+                yield split(line, '\t', 4)
+
+def isSortedEventLog(eventsFilePath):
+    if not isfile(eventsFilePath):
+        return False
+    with open(eventsFilePath, 'rb') as fp:
+        return fp.read(len(SORTED_MAGIC)) == SORTED_MAGIC
+
+def openEventLog(eventsFilePath, magic=LOG_MAGIC):
+    fp = open(eventsFilePath, 'ab')
+    if fp.tell() == 0:
+        fp.write(magic)
+    return fp
+
+def writeEventBlock(fp, eventLines):
+    data = compress(''.join(eventLines).encode())
+    fp.write(BLOCK_HEADER.pack(len(data)) + data)
+
+def repairEventLog(eventsFilePath):
+    if not isfile(eventsFilePath) or getsize(eventsFilePath) == 0:
+        return
+    with open(eventsFilePath, 'rb') as fp:
+        magic = fp.read(len(LOG_MAGIC))
+        if magic in (LOG_MAGIC, SORTED_MAGIC):
+            validSize = fp.tell()
+            for block in _iterBlocks(fp):
+                validSize = fp.tell()
+            if validSize == getsize(eventsFilePath):
+                return
+            with open(eventsFilePath, 'r+b') as fp:
+                fp.truncate(validSize)
+            return
+    upgradedPath = eventsFilePath + '.upgraded'
+    with openEventLog(upgradedPath) as fp:
+        writeEventBlock(fp, [formatEvent(*event) for event in iterEvents(eventsFilePath)])
+    rename(upgradedPath, eventsFilePath)
+
+def _iterBlocks(fp):
+    while True:
+        header = fp.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return
+        length, = BLOCK_HEADER.unpack(header)
+        data = fp.read(length)
+        if len(data) < length:
+            return
+        try:
+            yield decompress(data)
+        except ZlibError:
+            return
+
+def formatEvent(identifier, action, dataHash, fingerprintHash=None):
+    if fingerprintHash is None:
+        return "%s\t%s\t%s\n" % (identifier, action, dataHash or '')
+    return "%s\t%s\t%s\t%s\n" % (identifier, action, dataHash or '', fingerprintHash)
+
+def split(line, separator, expectedNumber):
+    r = line.split(separator)
+    return r + (expectedNumber - len(r)) * [None]
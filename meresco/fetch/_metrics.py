@@ -0,0 +1,164 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from contextlib import contextmanager
+from os import rename
+from os.path import join
+from time import time, perf_counter
+from threading import Lock
+
+from meresco.components.json import JsonDict
+
+
+PHASES = ['download', 'convert', 'hash', 'upload', 'stateSave', 'batchDone']
+
+class Metrics(object):
+    def __init__(self, statePath, interval=60, name=None):
+        self._jsonPath = join(statePath, 'metrics.json')
+        self._prometheusPath = join(statePath, 'metrics.prom')
+        self._interval = interval
+        self._name = name
+        self._lastWrite = None
+        self._harvest = _counters()
+        self._batch = _counters()
+        self._batchStart = None
+        self._lock = Lock()  # AsyncHarvester converts on an executor thread while uploads are timed on the loop
+
+    def startBatch(self):
+        self._batch = _counters()
+        self._batchStart = perf_counter()
+
+    @contextmanager
+    def timer(self, phase):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, perf_counter() - t0)
+
+    def timed(self, phase, f):
+        def timedF(*args, **kwargs):
+            with self.timer(phase):
+                return f(*args, **kwargs)
+        return timedF
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self._batch['phases'][phase] += seconds
+            self._harvest['phases'][phase] += seconds
+
+    def countRecords(self, nrOfRecords):
+        with self._lock:
+            self._batch['records'] += nrOfRecords
+            self._harvest['records'] += nrOfRecords
+
+    def countConverted(self, data):
+        nrOfBytes = len(data.encode() if isinstance(data, str) else data)
+        with self._lock:
+            self._batch['convertedBytes'] += nrOfBytes
+            self._harvest['convertedBytes'] += nrOfBytes
+
+    def endBatch(self):
+        if self._batchStart is not None:
+            seconds = perf_counter() - self._batchStart
+            self._batch['seconds'] += seconds
+            self._harvest['seconds'] += seconds
+            self._batchStart = None
+        metrics = self.asDict()
+        if self._lastWrite is None or time() - self._lastWrite >= self._interval:
+            self.write()
+        return metrics
+
+    def harvestReady(self):
+        self.write()
+        self._harvest = _counters()
+        self._batch = _counters()
+
+    def asDict(self):
+        return dict(batch=_summary(self._batch), harvest=_summary(self._harvest))
+
+    def write(self):
+        metrics = JsonDict(self.asDict())
+        if self._name is not None:
+            metrics['name'] = self._name
+        metrics.dump(self._jsonPath + '.tmp')
+        rename(self._jsonPath + '.tmp', self._jsonPath)
+        with open(self._prometheusPath + '.tmp', 'w') as fp:
+            fp.write(prometheusText(metrics['harvest'], name=self._name))
+        rename(self._prometheusPath + '.tmp', self._prometheusPath)
+        self._lastWrite = time()
+
+
+class NoMetrics(object):
+    def startBatch(self):
+        pass
+
+    @contextmanager
+    def timer(self, phase):
+        yield
+
+    def timed(self, phase, f):
+        return f
+
+    def add(self, phase, seconds):
+        pass
+
+    def countRecords(self, nrOfRecords):
+        pass
+
+    def countConverted(self, data):
+        pass
+
+    def endBatch(self):
+        return None
+
+    def harvestReady(self):
+        pass
+
+
+def prometheusText(summary, name=None):
+    labels = '' if name is None else 'name="%s",' % name
+    lines = [
+        '# HELP meresco_fetch_phase_seconds_total Seconds the harvester spent waiting on each phase in the current harvest.',
+        '# TYPE meresco_fetch_phase_seconds_total counter',
+    ]
+    lines.extend('meresco_fetch_phase_seconds_total{%sphase="%s"} %.6f' % (labels, phase, summary['phases'][phase]) for phase in PHASES)
+    for metric, kind, key, help in [
+            ('meresco_fetch_seconds_total', 'counter', 'seconds', 'Seconds spent harvesting batches in the current harvest.'),
+            ('meresco_fetch_records_total', 'counter', 'records', 'Records processed in the current harvest.'),
+            ('meresco_fetch_converted_bytes_total', 'counter', 'convertedBytes', 'Bytes of converted records in the current harvest.'),
+            ('meresco_fetch_records_per_second', 'gauge', 'recordsPerSecond', 'Records processed per second in the current harvest.'),
+        ]:
+        lines.append('# HELP %s %s' % (metric, help))
+        lines.append('# TYPE %s %s' % (metric, kind))
+        lines.append('%s%s %s' % (metric, '{%s}' % labels.rstrip(',') if labels else '', summary[key]))
+    return '\n'.join(lines) + '\n'
+
+def _counters():
+    return dict(seconds=0.0, records=0, convertedBytes=0, phases=dict((phase, 0.0) for phase in PHASES))
+
+def _summary(counters):
+    summary = dict(counters, phases=dict(counters['phases']))
+    summary['recordsPerSecond'] = round(counters['records'] / counters['seconds'], 3) if counters['seconds'] else 0.0
+    return summary
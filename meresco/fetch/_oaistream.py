@@ -0,0 +1,151 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from lxml.etree import iterparse, tostring
+
+
+class StreamingListRequest(object):
+    def __init__(self, baseurl, metadataPrefix=None, set=None, resumptionToken=None, from_=None, timeout=60, cache=None, readAll=False):
+        self.baseurl = baseurl
+        self.metadataPrefix = metadataPrefix
+        self.set = set
+        self.resumptionToken = resumptionToken
+        self.from_ = from_
+        self._timeout = timeout
+        self._cache = cache
+        self._readAll = readAll
+        if resumptionToken:
+            self._arguments = [('verb', 'ListRecords'), ('resumptionToken', resumptionToken)]
+        else:
+            self._arguments = [('verb', 'ListRecords'), ('metadataPrefix', metadataPrefix)]
+            if set:
+                self._arguments.append(('set', set))
+            if from_:
+                self._arguments.append(('from', from_))
+
+    def buildUrl(self):
+        return '%s?%s' % (self.baseurl, urlencode(self._arguments))
+
+    def retrieveBatch(self):
+        batch = StreamingOaiBatch(self, self._openResponse)
+        return batch.readAll() if self._readAll else batch
+
+    def cacheKey(self):
+        if self.resumptionToken:
+            return (self.baseurl, self.resumptionToken)
+        return (self.baseurl, self.metadataPrefix, self.set, self.from_)
+
+    def _openResponse(self):
+        response = urlopen(self.buildUrl(), timeout=self._timeout)
+        return response if self._cache is None else self._cache.store(self, response)
+
+
+class CachedListRequest(StreamingListRequest):
+    def __init__(self, baseurl, from_=None, **kwargs):
+        if from_:
+            raise ValueError('Replaying an incremental (from=%s) listing is not supported; replay is always a full harvest' % from_)
+        StreamingListRequest.__init__(self, baseurl, **kwargs)
+
+    def _openResponse(self):
+        return self._cache.open(self)
+
+
+class StreamingOaiBatch(object):
+    def __init__(self, request, openResponse):
+        self.request = request
+        self.resumptionToken = None
+        self.responseDate = None
+        self.headerFilter = None
+        self.nrOfItems = 0
+        self.nrOfDroppedItems = 0
+        self.items = self._items(openResponse)
+
+    def readAll(self):
+        self.items = list(self.items)
+        return self
+
+    def _items(self, openResponse):
+        header = None
+        with openResponse() as response:
+            for _, element in iterparse(response, events=('end',), tag=TAGS):
+                if element.tag == HEADER:
+                    header = StreamingOaiHeader(element)
+                    if self.headerFilter is not None and not self.headerFilter(header):
+                        header = None
+                elif element.tag == RECORD:
+                    element.getparent().remove(element)
+                    self.nrOfItems += 1
+                    if header is None:
+                        self.nrOfDroppedItems += 1
+                        element.clear()
+                        continue
+                    yield StreamingOaiItem(element, header)
+                    header = None
+                elif element.tag == METADATA:
+                    if header is None:
+                        element.clear()
+                elif element.tag == RESPONSE_DATE:
+                    self.responseDate = element.text
+                elif element.tag == RESUMPTION_TOKEN:
+                    self.resumptionToken = element.text or None
+                elif element.get('code') != 'noRecordsMatch':
+                    raise ValueError("OAI-PMH error '%s': %s" % (element.get('code'), element.text))
+
+
+class StreamingOaiHeader(object):
+    def __init__(self, header):
+        self.identifier = header.findtext(IDENTIFIER)
+        self.datestamp = header.findtext(DATESTAMP)
+        self.setSpecs = [setSpec.text for setSpec in header.iterfind(SET_SPEC)]
+        self.deleted = header.get('status') == 'deleted'
+
+
+class StreamingOaiItem(object):
+    def __init__(self, record, header):
+        self.record = record
+        self.identifier = header.identifier
+        self.datestamp = header.datestamp
+        self.setSpecs = header.setSpecs
+        self.deleted = header.deleted
+        metadata = record.find(METADATA)
+        self.metadata = None if metadata is None or len(metadata) == 0 else metadata[0]
+
+    def __str__(self):
+        return tostring(self.record, encoding=str)
+
+
+OAI = '{http://www.openarchives.org/OAI/2.0/}'
+RESPONSE_DATE = OAI + 'responseDate'
+RECORD = OAI + 'record'
+RESUMPTION_TOKEN = OAI + 'resumptionToken'
+ERROR = OAI + 'error'
+HEADER = OAI + 'header'
+IDENTIFIER = OAI + 'identifier'
+DATESTAMP = OAI + 'datestamp'
+SET_SPEC = OAI + 'setSpec'
+METADATA = OAI + 'metadata'
+TAGS = (RESPONSE_DATE, HEADER, METADATA, RECORD, RESUMPTION_TOKEN, ERROR)
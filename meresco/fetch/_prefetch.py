@@ -0,0 +1,74 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from copy import deepcopy
+
+
+class Prefetch(object):
+    def __init__(self, downloadBatch):
+        self._downloadBatch = downloadBatch
+        self._executor = None
+        self._future = None
+        self._resumptionAttributes = None
+
+    def downloadBatch(self, resumptionAttributes):
+        future, self._future = self._future, None
+        if future is not None:
+            if self._resumptionAttributes == resumptionAttributes:
+                return future.result()
+            _cancel(future)
+        return self._downloadBatch(resumptionAttributes=resumptionAttributes)
+
+    def prefetch(self, resumptionAttributes):
+        if self._future is not None:
+            _cancel(self._future)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        self._resumptionAttributes = deepcopy(resumptionAttributes)
+        self._future = self._executor.submit(self._downloadBatch, resumptionAttributes=deepcopy(resumptionAttributes))
+
+    def cancel(self):
+        if self._future is not None:
+            _cancel(self._future)
+            self._future = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class NoPrefetch(object):
+    def __init__(self, downloadBatch):
+        self.downloadBatch = lambda resumptionAttributes: downloadBatch(resumptionAttributes=resumptionAttributes)
+
+    def prefetch(self, resumptionAttributes):
+        pass
+
+    def cancel(self):
+        pass
+
+
+def _cancel(future):
+    if not future.cancel():
+        wait([future])
@@ -0,0 +1,190 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os import rename
+from os.path import join, isfile
+from sqlite3 import connect
+from threading import RLock
+
+from ._eventstore import EventStoreProtocol, iterEvents
+
+
+class SqliteEvents(EventStoreProtocol):
+    def __init__(self, stateDir, fsync=False, metrics=None):
+        if metrics is not None:
+            self._makeHash = metrics.timed('hash', self._makeHash)
+        self._stateDir = stateDir
+        databasePath = join(stateDir, 'events.db')
+        mustImport = not isfile(databasePath)
+        self._db = connect(databasePath, isolation_level=None, check_same_thread=False)  # a Scheduler may run each harvest on another thread
+        self._lock = RLock()
+        self._execute("PRAGMA journal_mode=WAL")
+        self._execute("PRAGMA synchronous=%s" % ('FULL' if fsync else 'NORMAL'))
+        self._execute(CREATE_TABLE % 'previous')
+        self._addFingerprintColumns()
+        self._pending = []
+        self._harvestStarted = False
+        if mustImport:
+            self._importFiles()
+        self._hasCurrent = self._currentExists()
+
+    def markEvent(self, identifier, uploadData=None, delete=False, sourceFingerprint=None):
+        dataHash = '' if delete else self._makeHash(uploadData)
+        fingerprintHash = None if sourceFingerprint is None else self._makeHash(sourceFingerprint)
+        self._pending.append((identifier, ('D' if delete else 'A'), dataHash, fingerprintHash))
+
+    def markSourceUnchanged(self, identifier):
+        self._pending.append((identifier,) + tuple(self._lastEvent(identifier)))
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self._transaction():
+            self._execute(CREATE_TABLE % 'current')
+            self._db.executemany(INSERT % 'current', self._pending)
+        self._pending = []
+        self._hasCurrent = True
+
+    def discard(self):
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+    def alreadyDeleted(self, identifier):
+        action = self._lastEvent(identifier)
+        return action[0] == 'D' if action else False
+
+    def alreadyAdded(self, identifier, uploadData):
+        previousHash = None
+        action = self._lastEvent(identifier)
+        if action:
+            if action[0] != 'A':
+                return False
+            previousHash = action[1]
+        return previousHash == self._makeHash(uploadData)
+
+    def sourceUnchanged(self, identifier, sourceFingerprint):
+        action = self._lastEvent(identifier)
+        return bool(action) and action[0] == 'A' and action[2] == self._makeHash(sourceFingerprint)
+
+    def toBeDeleted(self):
+        self.flush()
+        if not self._currentExists():
+            return
+        for identifier, in self._execute("""SELECT identifier FROM previous
+                WHERE action != 'D'
+                AND NOT EXISTS (SELECT 1 FROM current WHERE current.identifier = previous.identifier)
+                ORDER BY identifier"""):
+            yield identifier
+
+    def remainingAdds(self):
+        self.flush()
+        if not self._currentExists():
+            query = "SELECT identifier FROM previous WHERE action = 'A' ORDER BY identifier"
+        else:
+            query = """SELECT identifier FROM previous
+                WHERE action = 'A'
+                AND NOT EXISTS (SELECT 1 FROM current WHERE current.identifier = previous.identifier)
+                UNION ALL SELECT identifier FROM current WHERE action = 'A'
+                ORDER BY identifier"""
+        for identifier, in self._execute(query):
+            yield identifier
+
+    def markHarvestStart(self):
+        self._execute(CREATE_TABLE % 'current')
+        self._hasCurrent = True
+        self._harvestStarted = True
+
+    def markHarvestReady(self, merge=False):
+        assert self._harvestStarted
+        self.flush()
+        with self._transaction():
+            if merge:
+                self._execute("INSERT OR REPLACE INTO previous SELECT identifier, action, hash, fingerprint FROM current")
+                self._execute("DROP TABLE current")
+            else:
+                self._execute("DROP TABLE previous")
+                self._execute("ALTER TABLE current RENAME TO previous")
+        self._hasCurrent = False
+        self._harvestStarted = False
+
+    def _lastEvent(self, identifier):
+        event = self._event('current', identifier) if self._hasCurrent else None
+        return self._event('previous', identifier) if event is None else event
+
+    def _event(self, name, identifier):
+        return self._execute("SELECT action, hash, fingerprint FROM %s WHERE identifier = ?" % name, (identifier,)).fetchone()
+
+    def _currentExists(self):
+        return self._execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'current'").fetchone() is not None
+
+    def _importFiles(self):
+        for name in ['previous', 'current']:
+            eventsFilePath = join(self._stateDir, name)
+            if not isfile(eventsFilePath):
+                continue
+            with self._transaction():
+                self._execute(CREATE_TABLE % name)
+                self._db.executemany(
+                    INSERT % name,
+                    ((identifier, action, dataHash or '', fingerprintHash) for identifier, action, dataHash, fingerprintHash in iterEvents(eventsFilePath)))
+            rename(eventsFilePath, eventsFilePath + '.imported')
+
+    def _addFingerprintColumns(self):
+        for name in ['previous', 'current']:
+            columns = [row[1] for row in self._execute("PRAGMA table_info(%s)" % name)]
+            if columns and 'fingerprint' not in columns:
+                self._execute("ALTER TABLE %s ADD COLUMN fingerprint TEXT" % name)
+
+    def _execute(self, *args):
+        with self._lock:
+            return self._db.execute(*args)
+
+    def _transaction(self):
+        return _Transaction(self._db, self._lock)
+
+
+class _Transaction(object):
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._db.execute("BEGIN")
+        except:
+            self._lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+
+
+CREATE_TABLE = "CREATE TABLE IF NOT EXISTS %s (identifier TEXT PRIMARY KEY, action TEXT NOT NULL, hash TEXT NOT NULL, fingerprint TEXT) WITHOUT ROWID"
+INSERT = "INSERT OR REPLACE INTO %s (identifier, action, hash, fingerprint) VALUES (?, ?, ?, ?)"
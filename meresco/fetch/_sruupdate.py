@@ -0,0 +1,193 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from http.client import HTTPConnection, HTTPException
+from queue import Queue
+from threading import Thread, Lock
+from xml.sax.saxutils import escape as xmlEscape
+from zlib import crc32
+
+
+TIMEOUT = 60
+
+
+class SruUpdateException(Exception):
+    pass
+
+
+class SruUpdateConnection(object):
+    def __init__(self, host, port, path, userAgent, timeout=TIMEOUT):
+        self._host = host
+        self._port = port
+        self._path = path
+        self._userAgent = userAgent
+        self._timeout = timeout
+        self._connection = None
+
+    def add(self, identifier, data):
+        self.send(updateRequest(identifier=identifier, data=data))
+
+    def delete(self, identifier):
+        self.send(updateRequest(identifier=identifier))
+
+    def bulk(self, operations):
+        self.send(bulkUpdateRequest(operations))
+
+    def send(self, body):
+        try:
+            status, response = self._post(body)
+        except (HTTPException, OSError):
+            self.close()
+            status, response = self._post(body)
+        if status != 200 or SUCCESS not in response:
+            raise SruUpdateException("SRU update failed with HTTP status %s: %s" % (status, response.decode(errors='replace')))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _post(self, body):
+        if self._connection is None:
+            self._connection = HTTPConnection(self._host, self._port, timeout=self._timeout)
+        self._connection.request('POST', self._path, body=body.encode(), headers={
+            'Content-Type': 'text/xml; charset=utf-8',
+            'User-Agent': self._userAgent,
+        })
+        response = self._connection.getresponse()
+        return response.status, response.read()
+
+
+class SruUpdatePool(object):
+    def __init__(self, host, port, path, userAgent, concurrency, timeout=TIMEOUT):
+        self._connections = [SruUpdateConnection(host=host, port=port, path=path, userAgent=userAgent, timeout=timeout) for _ in range(concurrency)]
+        self._queues = [Queue() for _ in range(concurrency)]
+        self._errors = []
+        self._lock = Lock()
+        self._workers = None
+
+    def add(self, identifier, data, onDone):
+        self._queue(identifier).put((lambda connection: connection.add(identifier=identifier, data=data), onDone))
+
+    def delete(self, identifier, onDone):
+        self._queue(identifier).put((lambda connection: connection.delete(identifier=identifier), onDone))
+
+    def bulk(self, operations, maxRecords, maxBytes, onDone):
+        partitions = [[] for _ in self._queues]
+        for operation in operations:
+            partitions[self._index(operation['identifier'])].append(operation)
+        for index, partition in enumerate(partitions):
+            for chunk in packOperations(partition, maxRecords=maxRecords, maxBytes=maxBytes):
+                self._queue(index).put((lambda connection, chunk=chunk: connection.bulk(chunk), lambda chunk=chunk: onDone(chunk)))
+
+    def flush(self):
+        for queue in self._queues:
+            queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        workers, self._workers = self._workers, None
+        if workers is None:
+            return
+        for queue in self._queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    def _queue(self, identifierOrIndex):
+        if self._workers is None:
+            self._workers = [Thread(target=self._work, args=(connection, queue), daemon=True) for connection, queue in zip(self._connections, self._queues)]
+            for worker in self._workers:
+                worker.start()
+        if isinstance(identifierOrIndex, str):
+            identifierOrIndex = self._index(identifierOrIndex)
+        return self._queues[identifierOrIndex]
+
+    def _index(self, identifier):
+        return partitionIndex(identifier, len(self._queues))
+
+    def _work(self, connection, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                queue.task_done()
+                connection.close()
+                return
+            request, onDone = item
+            try:
+                request(connection)
+                onDone()
+            except Exception as e:
+                with self._lock:
+                    self._errors.append(e)
+            finally:
+                queue.task_done()
+
+
+def partitionIndex(identifier, count):
+    return crc32(identifier.encode()) % count
+
+def packOperations(operations, maxRecords, maxBytes):
+    chunk = []
+    size = 0
+    for operation in operations:
+        operationSize = len(operation.get('data') or '') + len(operation['identifier'])
+        if chunk and (len(chunk) >= maxRecords or size + operationSize > maxBytes):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(operation)
+        size += operationSize
+    if chunk:
+        yield chunk
+
+def bulkUpdateRequest(operations):
+    return BULK_UPDATE_REQUEST % ''.join(
+        updateRequest(identifier=operation['identifier'], data=None if operation['action'] == 'delete' else operation['data'])
+        for operation in operations)
+
+def updateRequest(identifier, data=None):
+    if data is None:
+        return UPDATE_REQUEST % dict(action='delete', identifier=xmlEscape(identifier), record='')
+    return UPDATE_REQUEST % dict(action='replace', identifier=xmlEscape(identifier), record=RECORD % dict(data=data))
+
+UPDATE_REQUEST = """<ucp:updateRequest xmlns:ucp="info:lc/xmlns/update-v1" xmlns:srw="http://www.loc.gov/zing/srw/">
+    <srw:version>1.0</srw:version>
+    <ucp:action>info:srw/action/1/%(action)s</ucp:action>
+    <ucp:recordIdentifier>%(identifier)s</ucp:recordIdentifier>%(record)s
+</ucp:updateRequest>"""
+
+RECORD = """
+    <srw:record>
+        <srw:recordPacking>xml</srw:recordPacking>
+        <srw:recordSchema>rdf</srw:recordSchema>
+        <srw:recordData>%(data)s</srw:recordData>
+    </srw:record>"""
+
+BULK_UPDATE_REQUEST = """<ucp:bulkUpdateRequest xmlns:ucp="info:lc/xmlns/update-v1">%s</ucp:bulkUpdateRequest>"""
+
+SUCCESS = b'<ucp:operationStatus>success</ucp:operationStatus>'
@@ -22,6 +22,7 @@
 #
 ## end license ##
 
+from os import rename
 from os.path import isfile
 from seecr.zulutime import ZuluTime
 from meresco.components.json import JsonDict
@@ -36,8 +37,23 @@ class State(object):
         self.harvestingReady = False
         self.error = None
         self.resumptionAttributes = None
+        self.failures = 0
+        self.nextAttempt = None
+        self.incremental = False
         return self
 
+    def restart(self):
+        nextHarvest = (self.resumptionAttributes or {}).get('nextHarvest')
+        self.clear()
+        if nextHarvest is not None:
+            self.resumptionAttributes = {'nextHarvest': nextHarvest}
+        return self
+
+    def resetError(self):
+        self.error = False
+        self.failures = 0
+        self.nextAttempt = None
+
     @classmethod
     def load(cls, filePath):
         state = cls(filePath=filePath)
@@ -47,16 +63,27 @@ class State(object):
             state.harvestingReady = d.get('harvestingReady', False)
             state.error = d.get('error')
             state.resumptionAttributes = d.get('resumptionAttributes')
+            state.failures = d.get('failures', 0)
+            state.nextAttempt = d.get('nextAttempt')
+            state.incremental = d.get('incremental', False)
         return state
 
     def save(self):
         self.datetime = self.now().zulu()
-        JsonDict(
+        d = JsonDict(
             datetime=self.datetime,
             harvestingReady=self.harvestingReady,
             error=self.error,
             resumptionAttributes=self.resumptionAttributes
-        ).dump(self._filePath)
+        )
+        if self.failures:
+            d['failures'] = self.failures
+            d['nextAttempt'] = self.nextAttempt
+        if self.incremental:
+            d['incremental'] = True
+        tmpFilePath = self._filePath + '.tmp'
+        d.dump(tmpFilePath)
+        rename(tmpFilePath, self._filePath)
 
     def now(self):
         return ZuluTime()
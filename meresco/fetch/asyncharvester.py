@@ -0,0 +1,262 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+import asyncio
+from copy import deepcopy
+from inspect import isawaitable
+
+from meresco.core import NoneOfTheObserversRespond
+
+from .harvester import Harvester, UPLOAD_BATCH_SIZE
+
+
+class AsyncHarvester(Harvester):
+    def __init__(self, statePath, uploadConcurrency=1, **kwargs):
+        Harvester.__init__(self, statePath, **kwargs)
+        self._uploadConcurrency = uploadConcurrency
+
+    async def harvest(self):
+        if not self._attemptDue():
+            return
+        try:
+            await self._harvestAsync()
+        finally:
+            await self._optional('closeUploads')
+
+    async def _harvestAsync(self):
+        uploads = _PendingUploads(self._uploadConcurrency)
+        if self._deleteAll:
+            return await self._deleteAllRecordsAsync(uploads)
+        if self._state.harvestingReady:
+            await self._deleteOldRecordsAsync(uploads)
+            self._recoveredFromError()
+            if self._harvestIntervalElapsed():
+                self._state.restart()
+                self._state.save()
+            else:
+                self._events.close()
+                self._logWrite('Harvesting ready since {0}.\n'.format(self._state.datetime))
+                self._logWrite('Waiting until {0} seconds have passed.\n'.format(self._harvestInterval))
+                return
+
+        self._logWrite('Harvesting.\n')
+        self._events.markHarvestStart()
+        self._startCheckpoints()
+        download = _Prefetch(self._downloadBatch, enabled=self._prefetch)
+        try:
+            while not self._state.harvestingReady:
+                try:
+                    self._metrics.startBatch()
+                    with self._metrics.timer('download'):
+                        batch = await download.downloadBatch(resumptionAttributes=self._state.resumptionAttributes or dict())
+                    quitForSleep = getattr(batch, 'quitForSleep', False)
+                    if not (batch.harvestingReady or quitForSleep or getattr(batch, 'streaming', False)):
+                        download.prefetch(resumptionAttributes=batch.resumptionAttributes())
+                    await self._processBatchAsync(batch, uploads)
+                    if quitForSleep:
+                        self._events.close()
+                        self._logWrite('Quiting for sleep.\n')
+                        return
+                except (SystemExit, KeyboardInterrupt, AssertionError):
+                    raise
+                except Exception:
+                    download.cancel()
+                    uploads.cancel()
+                    self._failed()
+                    raise
+        finally:
+            download.cancel()
+            self._convertStage.close()
+
+        await self._deleteOldRecordsAsync(uploads)
+        self._events.markHarvestReady(merge=self._state.incremental)
+        self._metrics.harvestReady()
+        self._logWrite('Finished harvesting.\n')
+
+    async def _processBatchAsync(self, batch, uploads):
+        await self._sendOperationsAsync(self._processRecords(batch.records), uploads)
+        with self._metrics.timer('upload'):
+            await self._optional('flushUploads')
+        self._state.resumptionAttributes = batch.resumptionAttributes()
+        self._state.harvestingReady = batch.harvestingReady
+        self._state.incremental = getattr(batch, 'incremental', False)
+        recovering = self._state.error
+        self._state.resetError()
+        self._events.flush()
+        self._checkpointBatch(batch, force=recovering)
+        self._batchDone(batch)
+
+    async def _sendOperationsAsync(self, operations, uploads):
+        count = 0
+        pending = []
+        async for operation in _inExecutor(operations):  # convert and streaming downloads block; keep them off the loop
+            count += 1
+            if not self._batchUpload:
+                with self._metrics.timer('upload'):
+                    await uploads.submit(self._sendOperationAsync(operation))
+                continue
+            pending.append(operation)
+            if len(pending) >= UPLOAD_BATCH_SIZE:
+                await self._uploadBatchAsync(pending, uploads)
+                pending = []
+        await self._uploadBatchAsync(pending, uploads)
+        with self._metrics.timer('upload'):
+            await uploads.flush()
+        return count
+
+    async def _sendOperationAsync(self, operation):
+        if operation['action'] == 'delete':
+            await self._optional('deleteRecord', identifier=operation['identifier'])
+        else:
+            await _resolve(self.call.uploadRecord(identifier=operation['identifier'], data=operation['data']))
+
+    async def _uploadBatchAsync(self, operations, uploads):
+        if not operations:
+            return
+        if self._batchUpload:
+            try:
+                with self._metrics.timer('upload'):
+                    await _resolve(self.call.uploadBatch(operations=operations))
+                return
+            except NoneOfTheObserversRespond:
+                self._batchUpload = False
+        for operation in operations:
+            with self._metrics.timer('upload'):
+                await uploads.submit(self._sendOperationAsync(operation))
+
+    async def _deleteOldRecordsAsync(self, uploads):
+        if self._state.incremental:
+            return self._events.flush()
+        try:
+            if await self._sendOperationsAsync(self._deleteOperations(self._events.toBeDeleted()), uploads):
+                await self._optional('flushUploads')
+        except (SystemExit, KeyboardInterrupt, AssertionError):
+            raise
+        except Exception:
+            uploads.cancel()
+            self._failed()
+            raise
+        self._events.flush()
+
+    async def _deleteAllRecordsAsync(self, uploads):
+        self._events.markHarvestStart()
+        try:
+            await self._sendOperationsAsync(self._deleteOperations(self._events.remainingAdds()), uploads)
+            await self._optional('flushUploads')
+        except (SystemExit, KeyboardInterrupt, AssertionError):
+            raise
+        except Exception:
+            uploads.cancel()
+            self._failed()
+            raise
+        self._state.clear()
+        self._state.resetError()
+        self._events.flush()
+        self._state.save()
+        self._clearError()
+        self._events.markHarvestReady()
+
+    def _downloadBatch(self, resumptionAttributes):
+        return _resolve(self.call.downloadBatch(resumptionAttributes=resumptionAttributes))
+
+    async def _optional(self, message, **kwargs):
+        try:
+            return await _resolve(getattr(self.call, message)(**kwargs))
+        except NoneOfTheObserversRespond:
+            return None
+
+
+class _PendingUploads(object):
+    def __init__(self, concurrency):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    async def submit(self, coroutine):
+        await self._semaphore.acquire()
+        task = asyncio.ensure_future(coroutine)
+        task.add_done_callback(lambda task: self._semaphore.release())
+        self._tasks.add(task)
+        await asyncio.sleep(0)
+
+    async def flush(self):
+        tasks, self._tasks = self._tasks, set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def cancel(self):
+        tasks, self._tasks = self._tasks, set()
+        for task in tasks:
+            task.cancel()
+
+
+class _Prefetch(object):
+    def __init__(self, downloadBatch, enabled):
+        self._downloadBatch = downloadBatch
+        self._enabled = enabled
+        self._task = None
+        self._resumptionAttributes = None
+
+    async def downloadBatch(self, resumptionAttributes):
+        task, self._task = self._task, None
+        if task is not None:
+            if self._resumptionAttributes == resumptionAttributes:
+                return await task
+            task.cancel()
+        return await self._downloadBatch(resumptionAttributes=resumptionAttributes)
+
+    def prefetch(self, resumptionAttributes):
+        if not self._enabled:
+            return
+        self.cancel()
+        self._resumptionAttributes = deepcopy(resumptionAttributes)
+        self._task = asyncio.ensure_future(self._downloadBatch(resumptionAttributes=deepcopy(resumptionAttributes)))
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+async def _inExecutor(iterable):
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    try:
+        while True:
+            item = await loop.run_in_executor(None, next, iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+_EXHAUSTED = object()
+
+async def _resolve(result):
+    if isawaitable(result):
+        return await result
+    return result
@@ -29,18 +29,27 @@
 #
 ## end license ##
 
-from os import rename, makedirs, remove
+from os import rename, makedirs, remove, fsync
 from os.path import join, isdir, isfile
 from sys import exc_info
+from collections import deque
+from contextlib import closing
 from traceback import print_exception
-from time import sleep
-from hashlib import md5
+from math import ceil
+from random import uniform
 
 from seecr.zulutime import ZuluTime
 
-from meresco.core import Observable
+from meresco.core import Observable, NoneOfTheObserversRespond
 
 from ._state import State
+from ._compactindex import CompactIndex, PendingIndex
+from ._eventstore import EventStoreProtocol, iterEvents, split, formatEvent, openEventLog, writeEventBlock, repairEventLog, SORTED_MAGIC, COMPACT_BLOCK_SIZE
+from ._sqliteevents import SqliteEvents
+from ._externalsort import mergeJoin
+from ._prefetch import Prefetch, NoPrefetch
+from ._convertstage import convertStage
+from ._metrics import Metrics, NoMetrics
 
 
 class SkipRecordException(Exception):
@@ -48,16 +57,22 @@ class SkipRecordException(Exception):
 
 
 class BatchProtocol(object):
+    __slots__ = ('records', 'harvestingReady', 'quitForSleep', 'incremental', 'streaming')
+
     def __init__(self):
         self.records = []
         self.harvestingReady = False
         self.quitForSleep = False
+        self.incremental = False  # only changed records were harvested; no deletion of records missing from this harvest
+        self.streaming = False  # records is a lazy iterable; harvestingReady and resumptionAttributes are final once it is consumed
 
     def resumptionAttributes(self):
-        return 'a structure that can be saved as value in the JSON state file, signifying how next batch can be retrieved'
+        return 'a structure that can be saved as value in the JSON state file, signifying how next batch can be retrieved; a "nextHarvest" key is kept for the next harvest'
 
 
 class RecordProtocol(object):
+    __slots__ = ('identifier',)
+
     def __init__(self):
         self.identifier = 'identifier used with SRU update'
 
@@ -68,110 +83,289 @@ class RecordProtocol(object):
         return False
 
     def asString(self):
-        return 'record string representation for debugging'
+        return 'record string representation for debugging; with processConvert also what the worker process converts'
+
+    def sourceFingerprint(self):
+        return None  # or a cheap hash or datestamp of the source record; convert is skipped when unchanged
 
 
 class Harvester(Observable):
-    def __init__(self, statePath, log=None, name=None, deleteAll=False, harvestInterval=24*60*60, errorInterval=10):
+    def __init__(self, statePath, log=None, name=None, deleteAll=False, harvestInterval=24*60*60, errorInterval=10, fsyncEvents=False, compactEvents=False, eventStore='files', reconvert=False, prefetch=False, convertWorkers=0, processConvert=None, batchUpload=False, maxErrorInterval=60*60, errorJitter=0.1, checkpointBatches=1, checkpointInterval=None, metricsInterval=None):
         Observable.__init__(self, name=name)
         self._statePath = statePath
         if not isdir(statePath):
             makedirs(statePath)
         self._state = State.load(filePath=join(self._statePath, 'state'))
-        self._events = _Events(self._statePath)
         self._logWrite = (lambda aString: None) if log is None else log.write
         self._deleteAll = deleteAll
         self._harvestInterval = harvestInterval
         self._errorInterval = errorInterval
+        self._maxErrorInterval = maxErrorInterval
+        self._errorJitter = errorJitter
+        self._reconvert = reconvert
+        self._prefetch = prefetch
+        self._batchUpload = batchUpload
+        self._checkpointBatches = checkpointBatches
+        self._checkpointInterval = checkpointInterval
+        self._metrics = NoMetrics() if metricsInterval is None else Metrics(self._statePath, interval=metricsInterval, name=name)
+        assert eventStore in ('files', 'sqlite'), "eventStore must be 'files' or 'sqlite', not %s" % repr(eventStore)
+        assert not (compactEvents and eventStore == 'sqlite'), 'compactEvents only applies to the files event store'
+        if eventStore == 'sqlite':
+            self._events = SqliteEvents(self._statePath, fsync=fsyncEvents, metrics=self._metrics)
+        else:
+            self._events = _Events(self._statePath, fsync=fsyncEvents, compact=compactEvents, metrics=self._metrics)
+        self._convertStage = convertStage(lambda record: self.call.convert(record=record), workers=convertWorkers, processConvert=processConvert)
 
     def harvest(self):
-        self._waitAWhileAfterError()
+        if not self._attemptDue():
+            return
+        try:
+            self._harvest()
+        finally:
+            self.do.closeUploads()
 
+    def _harvest(self):
         if self._deleteAll:
             return self._deleteAllRecords()
         if self._state.harvestingReady:
             self._deleteOldRecords()  # possibly still needs to be finished after crash
+            self._recoveredFromError()
             if self._harvestIntervalElapsed():
-                self._state.clear()
+                self._state.restart()
                 self._state.save()
             else:
+                self._events.close()
                 self._logWrite('Harvesting ready since {0}.\n'.format(self._state.datetime))
                 self._logWrite('Waiting until {0} seconds have passed.\n'.format(self._harvestInterval))
                 return
 
         self._logWrite('Harvesting.\n')
         self._events.markHarvestStart()
-        while not self._state.harvestingReady:
-            try:
-                batch = self.call.downloadBatch(resumptionAttributes=self._state.resumptionAttributes or dict())
-                self._processBatch(batch)
-                if getattr(batch, 'quitForSleep', False):
-                    self._logWrite('Quiting for sleep.\n')
-                    return
-            except (SystemExit, KeyboardInterrupt, AssertionError):
-                raise
-            except Exception:
-                self._saveError()
-                raise
+        self._startCheckpoints()
+        download = (Prefetch if self._prefetch else NoPrefetch)(self.call.downloadBatch)
+        try:
+            while not self._state.harvestingReady:
+                try:
+                    self._metrics.startBatch()
+                    with self._metrics.timer('download'):
+                        batch = download.downloadBatch(resumptionAttributes=self._state.resumptionAttributes or dict())
+                    quitForSleep = getattr(batch, 'quitForSleep', False)
+                    if not (batch.harvestingReady or quitForSleep or getattr(batch, 'streaming', False)):
+                        download.prefetch(resumptionAttributes=batch.resumptionAttributes())
+                    self._processBatch(batch)
+                    if quitForSleep:
+                        self._events.close()
+                        self._logWrite('Quiting for sleep.\n')
+                        return
+                except (SystemExit, KeyboardInterrupt, AssertionError):
+                    raise
+                except Exception:
+                    download.cancel()
+                    self._failed()
+                    raise
+        finally:
+            download.cancel()
+            self._convertStage.close()
 
         self._deleteOldRecords()
-        self._events.markHarvestReady()
+        self._events.markHarvestReady(merge=self._state.incremental)
+        self._metrics.harvestReady()
         self._logWrite('Finished harvesting.\n')
 
     def _processBatch(self, batch):
+        self._sendOperations(self._processRecords(batch.records))
+        with self._metrics.timer('upload'):
+            self.do.flushUploads()
+        self._state.resumptionAttributes = batch.resumptionAttributes()
+        self._state.harvestingReady = batch.harvestingReady
+        self._state.incremental = getattr(batch, 'incremental', False)
+        recovering = self._state.error
+        self._state.resetError()
+        self._events.flush()
+        self._checkpointBatch(batch, force=recovering)
+        self._batchDone(batch)
+
+    def _batchDone(self, batch):
+        with self._metrics.timer('batchDone'):
+            self.do.batchDone(batch)
+        metrics = self._metrics.endBatch()
+        if metrics is not None:
+            self.do.harvestMetrics(metrics=metrics)
+
+    def _startCheckpoints(self):
+        self._uncheckpointedBatches = 0
+        self._lastCheckpoint = self._state.now().epoch
+
+    def _checkpointBatch(self, batch, force=False):
+        self._uncheckpointedBatches += 1
+        if force or batch.harvestingReady or getattr(batch, 'quitForSleep', False) or self._checkpointDue():
+            self._checkpoint()
+
+    def _checkpointDue(self):
+        if self._checkpointBatches is not None and self._uncheckpointedBatches >= self._checkpointBatches:
+            return True
+        return self._checkpointInterval is not None and self._state.now().epoch - self._lastCheckpoint >= self._checkpointInterval
+
+    def _checkpoint(self):
+        with self._metrics.timer('stateSave'):
+            self._state.save()
+        self._clearError()
+        self._uncheckpointedBatches = 0
+        self._lastCheckpoint = self._state.now().epoch
+
+    def _processRecords(self, records):
         added = deleted = unchanged = skipped = 0
-        for record in batch.records:
-            if record.mustDelete():
-                if self._events.alreadyDeleted(record.identifier):
-                    unchanged += 1
-                else:
-                    deleted += 1
-                    self.do.deleteRecord(identifier=record.identifier)
-                self._events.markEvent(record.identifier, delete=True)
-            elif record.mustAdd():
-                try:
-                    uploadData = self.call.convert(record=record)
+        with closing(self._convertRecords(records)) as convertedRecords:
+            for record, sourceFingerprint, converted in convertedRecords:
+                if record.mustDelete():
+                    if self._events.alreadyDeleted(record.identifier):
+                        unchanged += 1
+                    else:
+                        deleted += 1
+                        yield dict(action='delete', identifier=record.identifier)
+                    self._events.markEvent(record.identifier, delete=True)
+                elif record.mustAdd():
+                    if converted is None:
+                        unchanged += 1
+                        self._events.markSourceUnchanged(record.identifier)
+                        continue
+                    try:
+                        with self._metrics.timer('convert'):
+                            uploadData = converted.result()
+                    except SkipRecordException:
+                        skipped += 1
+                        self._logWrite("Skipping record '%s'\n" % record.identifier)
+                        continue
+                    self._metrics.countConverted(uploadData)
                     if self._events.alreadyAdded(record.identifier, uploadData):
                         unchanged += 1
                     else:
-                        self.call.uploadRecord(identifier=record.identifier, data=uploadData)
                         added += 1
-                    self._events.markEvent(record.identifier, uploadData)
-                except SkipRecordException:
+                        yield dict(action='add', identifier=record.identifier, data=uploadData)
+                    self._events.markEvent(record.identifier, uploadData, sourceFingerprint=sourceFingerprint)
+                else:
                     skipped += 1
                     self._logWrite("Skipping record '%s'\n" % record.identifier)
-            else:
-                skipped += 1
-                self._logWrite("Skipping record '%s'\n" % record.identifier)
+        self._metrics.countRecords(added + deleted + unchanged + skipped)
         self._logWrite("%d added, %d deleted, %d unchanged, %d skipped.\n-\n" % (added, deleted, unchanged, skipped))
-        self._state.resumptionAttributes = batch.resumptionAttributes()
-        self._state.harvestingReady = batch.harvestingReady
-        self._state.error = False
-        self._state.save()
-        self._clearError()
-        self.do.batchDone(batch)
 
-    def _deleteOldRecords(self):
-        for identifier in self._events.toBeDeleted():
-            self.do.deleteRecord(identifier=identifier)
+    def _convertRecords(self, records):
+        pending = deque()
+        try:
+            for record in records:
+                sourceFingerprint = converted = None
+                if not record.mustDelete() and record.mustAdd():
+                    sourceFingerprint = getattr(record, 'sourceFingerprint', lambda: None)()
+                    if sourceFingerprint is None or self._reconvert or not self._events.sourceUnchanged(record.identifier, sourceFingerprint):
+                        converted = self._convertStage.submit(record)
+                pending.append((record, sourceFingerprint, converted))
+                while len(pending) > self._convertStage.lookahead:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+        finally:
+            for _, _, converted in pending:
+                if converted is not None:
+                    converted.cancel()
+
+    def _sendOperations(self, operations):
+        count = 0
+        pending = []
+        for operation in operations:
+            count += 1
+            if not self._batchUpload:
+                self._sendOperation(operation)
+                continue
+            pending.append(operation)
+            if len(pending) >= UPLOAD_BATCH_SIZE:
+                self._uploadBatch(pending)
+                pending = []
+        self._uploadBatch(pending)
+        return count
+
+    def _sendOperation(self, operation):
+        with self._metrics.timer('upload'):
+            if operation['action'] == 'delete':
+                self.do.deleteRecord(identifier=operation['identifier'])
+            else:
+                self.call.uploadRecord(identifier=operation['identifier'], data=operation['data'])
+
+    def _uploadBatch(self, operations):
+        if not operations:
+            return
+        if self._batchUpload:
+            try:
+                with self._metrics.timer('upload'):
+                    self.call.uploadBatch(operations=operations)
+                return
+            except NoneOfTheObserversRespond:
+                self._batchUpload = False
+        for operation in operations:
+            self._sendOperation(operation)
+
+    def _deleteOperations(self, identifiers):
+        for identifier in identifiers:
             self._events.markEvent(identifier, delete=True)
+            yield dict(action='delete', identifier=identifier)
+
+    def _deleteOldRecords(self):
+        if self._state.incremental:
+            return self._events.flush()
+        try:
+            if self._sendOperations(self._deleteOperations(self._events.toBeDeleted())):
+                self.do.flushUploads()
+        except (SystemExit, KeyboardInterrupt, AssertionError):
+            raise
+        except Exception:
+            self._failed()
+            raise
+        self._events.flush()
 
     def _deleteAllRecords(self):
         self._events.markHarvestStart()
-        for identifier in self._events.remainingAdds():
-            self.do.deleteRecord(identifier=identifier)
-            self._events.markEvent(identifier, delete=True)
+        try:
+            self._sendOperations(self._deleteOperations(self._events.remainingAdds()))
+            self.do.flushUploads()
+        except (SystemExit, KeyboardInterrupt, AssertionError):
+            raise
+        except Exception:
+            self._failed()
+            raise
         self._state.clear()
-        self._state.error = False
+        self._state.resetError()
+        self._events.flush()
         self._state.save()
         self._clearError()
         self._events.markHarvestReady()
 
+    def _failed(self):
+        self._events.discard()
+        self._events.close()
+        self._saveError()
+
+    def _recoveredFromError(self):
+        if self._state.error:
+            self._state.resetError()
+            self._state.save()
+            self._clearError()
+
+    def nextHarvestTime(self):
+        if self._deleteAll or self._state.datetime is None:
+            return 0
+        stateTime = ZuluTime(self._state.datetime).epoch
+        if self._state.error:
+            return self._nextAttemptTime()
+        if self._state.harvestingReady:
+            return stateTime + self._harvestInterval
+        return stateTime
+
     def _harvestIntervalElapsed(self):
         return self._state.now().epoch - ZuluTime(self._state.datetime).epoch > self._harvestInterval
 
     def _saveError(self, record=None):
         self._state.error = True
+        self._state.failures += 1
+        self._state.nextAttempt = ZuluTime(ceil(self._state.now().epoch + self._errorBackoff(self._state.failures))).zulu()
         self._state.save()
         exc_type, exc_value, exc_traceback = exc_info()
         with open(join(self._statePath, "last_error"), "w") as fp:
@@ -187,61 +381,111 @@ class Harvester(Observable):
             if isfile(f):
                 remove(f)
 
-    def _waitAWhileAfterError(self):
-        if self._state.error:
-            self._logWrite('Harvesting in error state since {0}: {1}.\n'.format(self._state.datetime, self._lastError()))
-            waitTime = ZuluTime(self._state.datetime).epoch + self._errorInterval - self._state.now().epoch
-            if waitTime > 0:
-                self._logWrite('Waiting until {0} seconds have passed.\n'.format(self._errorInterval))
-                sleep(waitTime)  # Note!!
+    def _attemptDue(self):
+        if not self._state.error:
+            return True
+        self._logWrite('Harvesting in error state since {0}: {1}.\n'.format(self._state.datetime, self._lastError()))
+        if self._state.now().epoch < self._nextAttemptTime():
+            self._logWrite('Waiting until {0} after {1} consecutive failure(s).\n'.format(ZuluTime(self._nextAttemptTime()).zulu(), self._state.failures))
+            return False
+        return True
+
+    def _nextAttemptTime(self):
+        if self._state.nextAttempt is None:
+            return ZuluTime(self._state.datetime).epoch + self._errorInterval
+        return ZuluTime(self._state.nextAttempt).epoch
+
+    def _errorBackoff(self, failures):
+        backoff = min(self._maxErrorInterval, self._errorInterval * 2 ** min(failures - 1, 32))
+        return backoff * (1 + uniform(-self._errorJitter, self._errorJitter))
 
     def _lastError(self):
-        with open(join(self._statePath, "last_error")) as fp:
+        lastErrorF = join(self._statePath, "last_error")
+        if not isfile(lastErrorF):
+            return 'unknown error'
+        with open(lastErrorF) as fp:
             return fp.read().strip()
 
 
-class _Events(object):
-    def __init__(self, stateDir):
+class _Events(EventStoreProtocol):
+    def __init__(self, stateDir, fsync=False, compact=False, sortBufferSize=100000, metrics=None):
+        if metrics is not None:
+            self._makeHash = metrics.timed('hash', self._makeHash)
         self._currentEventsPath = join(stateDir, 'current')
         self._previousEventsPath = join(stateDir, 'previous')
+        self._fsync = fsync
+        self._compact = compact
+        self._sortBufferSize = sortBufferSize
+        self._currentFile = None
+        self._pending = []
+        self._recoverCompaction()
+        repairEventLog(self._currentEventsPath)
         self._readPrevious()
+        self._readCurrent()
         self._harvestStarted = False
 
-    def markEvent(self, identifier, uploadData=None, delete=False):
+    def markEvent(self, identifier, uploadData=None, delete=False, sourceFingerprint=None):
         dataHash = '' if delete else self._makeHash(uploadData)
-        with open(self._currentEventsPath, 'a') as fp:
-            fp.write("%s\t%s\t%s\n" % (identifier, ('D' if delete else 'A'), dataHash))
+        fingerprintHash = None if sourceFingerprint is None else self._makeHash(sourceFingerprint)
+        self._appendEvent(identifier, ('D' if delete else 'A'), dataHash, fingerprintHash)
+
+    def markSourceUnchanged(self, identifier):
+        action, dataHash, fingerprintHash = self._lastEvent(identifier)
+        self._appendEvent(identifier, action, dataHash, fingerprintHash)
+
+    def _appendEvent(self, identifier, action, dataHash, fingerprintHash):
+        self._pending.append((identifier, action, dataHash, fingerprintHash))
+
+    def flush(self):
+        if not self._pending:
+            return
+        if self._currentFile is None:
+            self._currentFile = openEventLog(self._currentEventsPath)
+        writeEventBlock(self._currentFile, [formatEvent(*event) for event in self._pending])
+        self._addCurrent(self._pending)
+        self._pending = []
+        self._currentFile.flush()
+        if self._fsync:
+            fsync(self._currentFile.fileno())
+
+    def discard(self):
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._currentFile is not None:
+            self._currentFile.close()
+            self._currentFile = None
 
     def alreadyDeleted(self, identifier):
-        action = self._previous.get(identifier)
+        action = self._lastEvent(identifier)
         return action[0] == 'D' if action else False
 
     def alreadyAdded(self, identifier, uploadData):
         previousHash = None
-        action = self._previous.get(identifier)
+        action = self._lastEvent(identifier)
         if action:
             if action[0] != 'A':
                 return False
             previousHash = action[1]
         return previousHash == self._makeHash(uploadData)
 
+    def sourceUnchanged(self, identifier, sourceFingerprint):
+        action = self._lastEvent(identifier)
+        return bool(action) and action[0] == 'A' and action[2] == self._makeHash(sourceFingerprint)
+
     def toBeDeleted(self):
+        self.flush()
         if not isfile(self._currentEventsPath):
             return
-        currentIdentifiers = set(self._readEvents(self._currentEventsPath).keys())
-        for identifier, action in sorted(self._previous.items()):
-            if identifier in currentIdentifiers:
-                continue
-            if action[0] != 'D':
+        for identifier, action, *_ in self._sortedPrevious():
+            if action != 'D' and not identifier in self._current:
                 yield identifier
 
     def remainingAdds(self):
-        current = self._readEvents(self._currentEventsPath)
-        for identifier, action in (sorted(self._previous.items()) + sorted(current.items())):
-            if action[0] == 'A':
-                currentIdState = current.get(identifier)
-                if currentIdState and currentIdState[0] == 'D':
-                    continue
+        self.flush()
+        for identifier, previous, current in mergeJoin(self._sortedPrevious(), self._sortedCurrent()):
+            if (current or previous)[1] == 'A':
                 yield identifier
 
     def markHarvestStart(self):
@@ -249,32 +493,85 @@ class _Events(object):
             open(self._currentEventsPath, 'w').close()
         self._harvestStarted = True
 
-    def markHarvestReady(self):
+    def markHarvestReady(self, merge=False):
         assert self._harvestStarted
-        rename(self._currentEventsPath, self._previousEventsPath)
-        self._readPrevious()
+        self.close()
+        if self._compact:
+            previous = self._current.mergedInto(self._previous if merge else CompactIndex())
+            self._compactIntoPrevious(self._sortedEvents(previous))
+        else:
+            events = self._sortedCurrent()
+            if merge:
+                events = (current or previous for identifier, previous, current in mergeJoin(self._sortedPrevious(), events))
+            self._compactIntoPrevious(events)
+            previous = self._current
+            if merge:
+                self._previous.update(self._current)
+                previous = self._previous
+        self._previous, self._current = previous, self._newIndex()
         self._harvestStarted = False
 
-    def _makeHash(self, data):
-        return md5(data.encode()).hexdigest()
+    def _compactIntoPrevious(self, events):
+        compactedPath = self._previousEventsPath + '.compacted'
+        with open(compactedPath, 'wb') as fp:
+            fp.write(SORTED_MAGIC)
+            block = []
+            for event in events:
+                block.append(formatEvent(*event))
+                if len(block) == COMPACT_BLOCK_SIZE:
+                    writeEventBlock(fp, block)
+                    block = []
+            if block:
+                writeEventBlock(fp, block)
+            fp.flush()
+            if self._fsync:
+                fsync(fp.fileno())
+        remove(self._currentEventsPath)
+        rename(compactedPath, self._previousEventsPath)
+
+    def _recoverCompaction(self):
+        compactedPath = self._previousEventsPath + '.compacted'
+        if not isfile(compactedPath):
+            return
+        if isfile(self._currentEventsPath):
+            remove(compactedPath)
+        else:
+            rename(compactedPath, self._previousEventsPath)
+
+    def _lastEvent(self, identifier):
+        event = self._current.get(identifier)
+        return self._previous.get(identifier) if event is None else event
 
     def _readPrevious(self):
-        self._previous = self._readEvents(self._previousEventsPath)
+        if self._compact:
+            self._previous = CompactIndex.fromEvents(iterEvents(self._previousEventsPath))
+        else:
+            self._previous = dict(headTail(event) for event in iterEvents(self._previousEventsPath))
+
+    def _readCurrent(self):
+        self._current = self._newIndex()
+        self._addCurrent(iterEvents(self._currentEventsPath))  # events of an interrupted harvest
+
+    def _addCurrent(self, events):
+        for identifier, *event in events:
+            self._current[identifier] = event
 
-    def _readEvents(self, eventsFilePath):
-        if not isfile(eventsFilePath):
-            return {}
-        with open(eventsFilePath) as fp:
-            return dict(
-                headTail(split(line.strip(), '\t', 3))
-                for line in fp.read().strip().split("\n")
-                if line.strip()
-            )
+    def _newIndex(self):
+        return PendingIndex(bufferSize=self._sortBufferSize) if self._compact else {}
 
+    def _sortedPrevious(self):
+        return self._sortedEvents(self._previous)
+
+    def _sortedCurrent(self):
+        return self._sortedEvents(self._current)
+
+    def _sortedEvents(self, index):
+        if self._compact:
+            return ((identifier,) + tuple(event) for identifier, event in index.items())
+        return ((identifier,) + tuple(index[identifier]) for identifier in sorted(index))
 
-def split(line, separator, expectedNumber):
-    r = line.split(separator)
-    return r + (expectedNumber - len(r)) * [None]
 
 def headTail(s):
     return (s[0], s[1:])
+
+UPLOAD_BATCH_SIZE = 1000
@@ -24,81 +24,307 @@
 #
 ## end license ##
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from copy import deepcopy
+from functools import partial
+from json import dumps
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from xml.etree.ElementTree import parse as parseXml
+import asyncio
+
+from seecr.zulutime import ZuluTime
+
 from meresco.fetch.harvester import BatchProtocol, RecordProtocol
 
 from meresco.oai.tools import OaiListRequest
 
+from ._oaistream import StreamingListRequest, CachedListRequest
+from ._batchcache import BatchCache
+
 class OaiPmhDownload(object):
-    def __init__(self, repositories, log, recordAllowedFilter=None):
+    def __init__(self, repositories, log, recordAllowedFilter=None, datestampFingerprint=False, concurrentRepositories=1, incremental=False, fullHarvestInterval=7*24*60*60, streaming=False, headerAllowedFilter=None, cacheDir=None, cacheMaxAge=None, cacheMaxBytes=None, replay=False):
         self._repositories = repositories
         self._log = log
+        self._datestampFingerprint = datestampFingerprint
         self._recordAllowedFilter = (lambda record: True) if recordAllowedFilter is None else recordAllowedFilter
-        self._OaiListRequest = OaiListRequest
+        self._headerAllowedFilter = headerAllowedFilter
+        self._concurrentRepositories = concurrentRepositories
+        self._incremental = incremental
+        self._fullHarvestInterval = fullHarvestInterval
+        self._repositoryInfos = {}
+        self._executor = None
+        self._inFlight = {}
+        assert not (streaming and concurrentRepositories > 1), 'streaming batches are only supported for one repository at a time'
+        assert not replay or (cacheDir is not None and not incremental), 'replay requires a cacheDir and is always a full harvest'
+        self._streaming = streaming
+        self._OaiListRequest = StreamingListRequest if streaming else OaiListRequest
+        if cacheDir is not None:
+            cache = BatchCache(cacheDir, maxAge=cacheMaxAge, maxBytes=cacheMaxBytes)
+            self._OaiListRequest = partial(CachedListRequest if replay else StreamingListRequest, cache=cache, readAll=not streaming)
+        self._now = ZuluTime
 
     def downloadBatch(self, resumptionAttributes):
+        if self._concurrentRepositories > 1:
+            try:
+                batch = self._downloadConcurrently(resumptionAttributes)
+            except:
+                self.close()
+                raise
+            if batch is None or batch.harvestingReady:
+                self.close()
+            return batch
         repositoriesRemaining = resumptionAttributes.get('repositoriesRemaining')
+        harvest = deepcopy(resumptionAttributes.get('harvest'))
         if not repositoriesRemaining:
             repositoriesRemaining = self._repositories[:]
+            harvest = self._startHarvest(resumptionAttributes)
         currentRepository = first(repositoriesRemaining)
         if currentRepository is None:
             self._log.write('no repositories configured for OaiPmhDownload.\n')
             return
-        baseurl = currentRepository.get('baseurl')
-        assert baseurl, "Got repository description without 'baseurl': %s" % repr(currentRepository)
-        metadataPrefix = currentRepository.get('metadataPrefix')
-        assert metadataPrefix, "Got repository description without 'metadataPrefix': %s" % repr(currentRepository)
 
         resumptionToken = resumptionAttributes.get('resumptionToken', 0)
         self._log.write("Batch download; repository: %s, resumptionToken: %s\n" % (currentRepository, resumptionToken))
+        oaiBatch = self._retrieveBatch(currentRepository, resumptionToken, harvest)
+        batch = _Batch(oaiBatch=oaiBatch, repositoriesRemaining=repositoriesRemaining)
+        def complete(nrOfItems):
+            batch.resumptionToken = oaiBatch.resumptionToken
+            self._log.write('nrOfResults: %s, next resumptionToken: %s\n' % (nrOfItems, batch.resumptionToken))
+            if not batch.resumptionToken:
+                batch.repositoriesRemaining.pop(0)
+                if not batch.repositoriesRemaining:
+                    batch.harvestingReady = True
+            self._addHarvest(batch, self._harvestProgress(harvest, currentRepository, resumptionToken, oaiBatch))
+        if self._streaming:
+            batch.streaming = True
+            batch.records = self._streamRecords(batch, oaiBatch, complete)
+            return batch
+        complete(len(oaiBatch.items))
+        return self._addRecords(batch, oaiBatch)
+
+    def close(self):
+        for future in self._inFlight.values():
+            future.cancel()
+        self._inFlight = {}
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _downloadConcurrently(self, resumptionAttributes):
+        repositoryStates = resumptionAttributes.get('repositoryStates')
+        harvest = deepcopy(resumptionAttributes.get('harvest'))
+        if not repositoryStates:
+            repositoryStates = [{'repository': repository, 'resumptionToken': None} for repository in self._repositories]
+            harvest = self._startHarvest(resumptionAttributes)
+        if not repositoryStates:
+            self._log.write('no repositories configured for OaiPmhDownload.\n')
+            return
+        wanted = dict((_stateKey(state), state) for state in repositoryStates)
+        for key in list(self._inFlight):
+            if key not in wanted:
+                self._inFlight.pop(key).cancel()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._concurrentRepositories, thread_name_prefix='oaipmhdownload')
+        for key, state in wanted.items():
+            if key not in self._inFlight and len(self._inFlight) < self._concurrentRepositories:
+                self._log.write("Batch download; repository: %s, resumptionToken: %s\n" % (state['repository'], state['resumptionToken']))
+                self._inFlight[key] = self._executor.submit(self._retrieveBatch, state['repository'], state['resumptionToken'], harvest)
+        done, _ = wait(list(self._inFlight.values()), return_when=FIRST_COMPLETED)
+        key = first(key for key in wanted if self._inFlight.get(key) in done)
+        oaiBatch = self._inFlight.pop(key).result()
+        repository = wanted[key]['repository']
+        remaining = [dict(state) for state in repositoryStates if _stateKey(state) != key]
+        if oaiBatch.resumptionToken:
+            remaining.insert(repositoryStates.index(wanted[key]), {'repository': repository, 'resumptionToken': oaiBatch.resumptionToken})
+        batch = _RepositoryStatesBatch(oaiBatch=oaiBatch, repository=repository, repositoryStates=remaining)
+        self._log.write('nrOfResults: %s, repository: %s, next resumptionToken: %s\n' % (len(oaiBatch.items), repository, batch.resumptionToken))
+        batch.harvestingReady = not remaining
+        self._addHarvest(batch, self._harvestProgress(harvest, repository, wanted[key]['resumptionToken'], oaiBatch))
+        return self._addRecords(batch, oaiBatch)
+
+    def _retrieveBatch(self, repository, resumptionToken, harvest=None):
+        baseurl = repository.get('baseurl')
+        assert baseurl, "Got repository description without 'baseurl': %s" % repr(repository)
+        metadataPrefix = repository.get('metadataPrefix')
+        assert metadataPrefix, "Got repository description without 'metadataPrefix': %s" % repr(repository)
+        fromDates = (harvest or {}).get('from')
         if resumptionToken:
             oaiListRequest = self._OaiListRequest(baseurl=baseurl, resumptionToken=resumptionToken)
+        elif fromDates:
+            oaiListRequest = self._OaiListRequest(baseurl=baseurl, metadataPrefix=metadataPrefix, set=repository.get('setSpec'), from_=fromDates.get(_repositoryKey(repository)))
         else:
-            oaiListRequest = self._OaiListRequest(baseurl=baseurl, metadataPrefix=metadataPrefix, set=currentRepository.get('setSpec'))
+            oaiListRequest = self._OaiListRequest(baseurl=baseurl, metadataPrefix=metadataPrefix, set=repository.get('setSpec'))
 
         self._log.write('requesting %s\n' % oaiListRequest.buildUrl())
-        oaiBatch = oaiListRequest.retrieveBatch()
-        batch = _Batch(oaiBatch=oaiBatch, repositoriesRemaining=repositoriesRemaining)
-        self._log.write('nrOfResults: %s, next resumptionToken: %s\n' % (len(oaiBatch.items), batch.resumptionToken))
-        if not batch.resumptionToken:
-            batch.repositoriesRemaining.pop(0)
-            if not batch.repositoriesRemaining:
-                batch.harvestingReady = True
-        batch.records = [r for r in [Record(batch, item) for item in batch.oaiBatch.items] if self._recordAllowedFilter(r)]
+        return oaiListRequest.retrieveBatch()
+
+    def _startHarvest(self, resumptionAttributes):
+        if not self._incremental:
+            return None
+        nextHarvest = resumptionAttributes.get('nextHarvest') or {}
+        responseDates = nextHarvest.get('responseDates') or {}
+        fullHarvestStarted = nextHarvest.get('fullHarvestStarted')
+        now = self._now()
+        incremental = fullHarvestStarted is not None \
+            and now.epoch - ZuluTime(fullHarvestStarted).epoch < self._fullHarvestInterval \
+            and all(responseDates.get(_repositoryKey(repository)) and self._repositoryInfo(repository).get('deletedRecord') == 'persistent' for repository in self._repositories)
+        self._log.write('Starting %s harvest.\n' % ('incremental' if incremental else 'full'))
+        return {
+            'from': dict((_repositoryKey(repository), self._fromDate(repository, responseDates[_repositoryKey(repository)])) for repository in self._repositories) if incremental else None,
+            'responseDates': {},
+            'fullHarvestStarted': fullHarvestStarted if incremental else now.zulu(),
+        }
+
+    def _harvestProgress(self, harvest, repository, resumptionToken, oaiBatch):
+        if harvest is not None and not resumptionToken:
+            harvest['responseDates'].setdefault(_repositoryKey(repository), getattr(oaiBatch, 'responseDate', None))
+        return harvest
+
+    def _fromDate(self, repository, responseDate):
+        if self._repositoryInfo(repository).get('granularity') == 'YYYY-MM-DD':
+            return responseDate[:len('YYYY-MM-DD')]
+        return responseDate
+
+    def _repositoryInfo(self, repository):
+        if 'deletedRecord' in repository:
+            return dict(deletedRecord=repository['deletedRecord'], granularity=repository.get('granularity'))
+        baseurl = repository['baseurl']
+        if baseurl not in self._repositoryInfos:
+            try:
+                self._repositoryInfos[baseurl] = self._identify(baseurl)
+            except Exception as e:
+                self._log.write('Identify of %s failed: %s\n' % (baseurl, e))
+                return {}
+        return self._repositoryInfos[baseurl]
+
+    def _identify(self, baseurl):
+        with urlopen('%s?%s' % (baseurl, urlencode(dict(verb='Identify'))), timeout=60) as response:
+            identify = parseXml(response).getroot().find('{%(oai)s}Identify' % NAMESPACES)
+        return dict(
+            deletedRecord=identify.findtext('{%(oai)s}deletedRecord' % NAMESPACES),
+            granularity=identify.findtext('{%(oai)s}granularity' % NAMESPACES))
+
+    def _addHarvest(self, batch, harvest):
+        if harvest is not None:
+            batch.harvest = harvest
+            batch.incremental = harvest['from'] is not None
+            if batch.harvestingReady:
+                batch.nextHarvest = dict(responseDates=harvest['responseDates'], fullHarvestStarted=harvest['fullHarvestStarted'])
+
+    def _addRecords(self, batch, oaiBatch):
+        batch.datestampFingerprint = self._datestampFingerprint
+        batch.records = list(self._filterRecords(batch, oaiBatch.items, self._headerAllowedFilter))
+        self._logDropped(batch)
         return batch
 
+    def _streamRecords(self, batch, oaiBatch, complete):
+        batch.datestampFingerprint = self._datestampFingerprint
+        oaiBatch.headerFilter = self._headerAllowedFilter
+        for record in self._filterRecords(batch, oaiBatch.items, None):
+            yield record
+        batch.droppedByHeaderFilter += oaiBatch.nrOfDroppedItems
+        complete(oaiBatch.nrOfItems)
+        self._logDropped(batch)
+
+    def _filterRecords(self, batch, items, headerFilter):
+        for item in items:
+            if headerFilter is not None and not headerFilter(item):
+                batch.droppedByHeaderFilter += 1
+                continue
+            record = Record(batch, item)
+            if not self._recordAllowedFilter(record):
+                batch.droppedByRecordFilter += 1
+                continue
+            yield record
+
+    def _logDropped(self, batch):
+        if batch.droppedByHeaderFilter or batch.droppedByRecordFilter:
+            self._log.write('dropped: %s by header filter, %s by record filter\n' % (batch.droppedByHeaderFilter, batch.droppedByRecordFilter))
+
+
+
+class AsyncOaiPmhDownload(OaiPmhDownload):
+    async def downloadBatch(self, resumptionAttributes):
+        return await asyncio.get_running_loop().run_in_executor(None, partial(OaiPmhDownload.downloadBatch, self, resumptionAttributes))
 
 
 class _Batch(BatchProtocol):
-    def __init__(self, oaiBatch, repositoriesRemaining):
+    __slots__ = ('repositoriesRemaining', 'resumptionToken', 'baseurl', 'repositoryGroupId', 'repositoryId', 'setSpec', 'metadataPrefix', 'identifierPrefix', 'datestampFingerprint', 'harvest', 'nextHarvest', 'droppedByHeaderFilter', 'droppedByRecordFilter')
+
+    def __init__(self, oaiBatch, repositoriesRemaining, currentRepository=None):
         BatchProtocol.__init__(self)
         self.repositoriesRemaining = repositoriesRemaining
-        currentRepository = first(repositoriesRemaining)
-        self.oaiBatch = oaiBatch
+        currentRepository = first(repositoriesRemaining) if currentRepository is None else currentRepository
         self.resumptionToken = oaiBatch.resumptionToken
         self.baseurl = oaiBatch.request.baseurl
         self.repositoryGroupId = currentRepository.get('repositoryGroupId')
         self.repositoryId = currentRepository.get('repositoryId')
         self.setSpec = currentRepository.get('setSpec') or ''
         self.metadataPrefix = currentRepository.get('metadataPrefix') or ''
+        self.identifierPrefix = '%s:' % self.repositoryGroupId
+        self.datestampFingerprint = False
+        self.harvest = None
+        self.nextHarvest = None
+        self.droppedByHeaderFilter = 0
+        self.droppedByRecordFilter = 0
 
     def resumptionAttributes(self):
-        return {
+        return self._withHarvest({
             'resumptionToken': self.resumptionToken,
             'repositoriesRemaining': self.repositoriesRemaining
-        }
+        })
+
+    def _withHarvest(self, attributes):
+        if self.harvest is not None:
+            attributes['harvest'] = self.harvest
+        if self.nextHarvest is not None:
+            attributes['nextHarvest'] = self.nextHarvest
+        return attributes
+
+
+class _RepositoryStatesBatch(_Batch):
+    __slots__ = ('repositoryStates',)
+
+    def __init__(self, oaiBatch, repository, repositoryStates):
+        _Batch.__init__(self, oaiBatch=oaiBatch, repositoriesRemaining=None, currentRepository=repository)
+        self.repositoryStates = repositoryStates
+
+    def resumptionAttributes(self):
+        return self._withHarvest({'repositoryStates': self.repositoryStates})
 
 
 class Record(RecordProtocol):
+    __slots__ = ('batch', 'item')
+
     def __init__(self, batch, item):
         self.batch = batch
         self.item = item
-        self.repositoryGroupId = batch.repositoryGroupId
-        self.repositoryId = batch.repositoryId
-        self.setSpec = batch.setSpec
-        self.metadataPrefix = batch.metadataPrefix
-        self.baseurl = batch.baseurl
-        self.recordIdentifier = item.identifier
-        self.identifier = "%s:%s" % (batch.repositoryGroupId, self.recordIdentifier)
+        self.identifier = batch.identifierPrefix + item.identifier
+
+    @property
+    def repositoryGroupId(self):
+        return self.batch.repositoryGroupId
+
+    @property
+    def repositoryId(self):
+        return self.batch.repositoryId
+
+    @property
+    def setSpec(self):
+        return self.batch.setSpec
+
+    @property
+    def metadataPrefix(self):
+        return self.batch.metadataPrefix
+
+    @property
+    def baseurl(self):
+        return self.batch.baseurl
+
+    @property
+    def recordIdentifier(self):
+        return self.item.identifier
 
     def mustAdd(self):
         return not self.item.deleted
@@ -109,8 +335,22 @@ class Record(RecordProtocol):
     def asString(self):
         return str(self.item)
 
+    def sourceFingerprint(self):
+        datestamp = getattr(self.item, 'datestamp', None)
+        if not self.batch.datestampFingerprint or not datestamp:
+            return None
+        return "%s %s %s" % (self.baseurl, self.metadataPrefix, datestamp)
+
+def _repositoryKey(repository):
+    return '%s|%s|%s' % (repository.get('baseurl'), repository.get('metadataPrefix'), repository.get('setSpec') or '')
+
+def _stateKey(state):
+    return dumps([state['repository'], state['resumptionToken']], sort_keys=True)
+
 def first(l, default=None):
     if l:
         for v in l:
             return v
     return default
+
+NAMESPACES = {'oai': 'http://www.openarchives.org/OAI/2.0/'}
@@ -0,0 +1,130 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from asyncio import run as runCoroutine
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from inspect import isawaitable
+from threading import Event
+from time import time
+
+
+class Scheduler(object):
+    def __init__(self, concurrency=1, log=None, sleepInterval=60, maxWait=60):
+        self._concurrency = concurrency
+        self._logWrite = (lambda aString: None) if log is None else log.write
+        self._sleepInterval = sleepInterval
+        self._maxWait = maxWait
+        self._scheduled = []
+        self._running = {}
+        self._stopped = Event()
+        self._executor = None
+        self._now = time
+
+    def addHarvester(self, harvester, priority=0, name=None):
+        self._scheduled.append(_Scheduled(harvester, priority=priority, name=repr(harvester) if name is None else name))
+
+    def run(self):
+        self._stopped.clear()
+        try:
+            while not self._stopped.is_set():
+                self._start(self._due())
+                self._waitForNext()
+        finally:
+            self._finish(self._running)
+            self._shutdown()
+
+    def runDue(self):
+        try:
+            due = self._due()
+            while due or self._running:
+                due = self._start(due)
+                done, _ = wait(list(self._running), return_when=FIRST_COMPLETED)
+                self._finish(done)
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _start(self, due):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix='scheduler')
+        while due and len(self._running) < self._concurrency:
+            scheduled = due.pop(0)
+            self._running[self._executor.submit(_harvest, scheduled.harvester)] = scheduled
+        return due
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _due(self):
+        now = self._now()
+        running = set(self._running.values())
+        due = [scheduled for scheduled in self._scheduled if scheduled not in running and self._dueTime(scheduled) <= now]
+        return sorted(due, key=lambda scheduled: (-scheduled.priority, self._dueTime(scheduled)))
+
+    def _dueTime(self, scheduled):
+        dueTime = scheduled.harvester.nextHarvestTime()
+        if scheduled.finishedAt is not None and dueTime <= scheduled.finishedAt:
+            return scheduled.finishedAt + self._sleepInterval
+        return dueTime
+
+    def _waitForNext(self):
+        timeout = self._maxWait
+        if len(self._running) < self._concurrency:
+            running = set(self._running.values())
+            now = self._now()
+            timeout = min([timeout] + [self._dueTime(scheduled) - now for scheduled in self._scheduled if scheduled not in running])
+        if self._running:
+            done, _ = wait(list(self._running), timeout=max(0, timeout), return_when=FIRST_COMPLETED)
+            self._finish(done)
+        elif timeout > 0:
+            self._stopped.wait(timeout)
+
+    def _finish(self, futures):
+        for future in list(futures):
+            if not future.done():
+                wait([future])
+            scheduled = self._running.pop(future)
+            scheduled.finishedAt = self._now()
+            try:
+                future.result()
+            except Exception as e:
+                self._logWrite('Harvest of {0} failed: {1}\n'.format(scheduled.name, e))
+
+
+class _Scheduled(object):
+    def __init__(self, harvester, priority, name):
+        self.harvester = harvester
+        self.priority = priority
+        self.name = name
+        self.finishedAt = None
+
+
+def _harvest(harvester):
+    result = harvester.harvest()
+    if isawaitable(result):
+        runCoroutine(result)
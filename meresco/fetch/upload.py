@@ -30,35 +30,77 @@
 ## end license ##
 
 from urllib.parse import urlsplit
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 from weightless.core import consume
 from meresco.components.sru import SruUpdateClient
 
+from ._sruupdate import SruUpdatePool, SruUpdateConnection, packOperations, partitionIndex, TIMEOUT
+
 
 class Upload(object):
-    def __init__(self, baseUrl, log, userAgent="Meresco-Fetch Harvester"):
+    def __init__(self, baseUrl, log, userAgent="Meresco-Fetch Harvester", concurrency=1, bulk=False, maxBatchRecords=100, maxBatchBytes=1024*1024, timeout=TIMEOUT):
+        self._pool = None
+        if bulk:
+            self.uploadBatch = self._uploadBatch  # without it Harvester(batchUpload=True) falls back to uploadRecord
+        self._concurrent = concurrency > 1
+        self._maxBatchRecords = maxBatchRecords
+        self._maxBatchBytes = maxBatchBytes
         if not baseUrl:
             self._sruUpdateClient = _Ignore()
         else:
-            _, netloc, path, _, _ = urlsplit(baseUrl)
-            host, port = netloc.split(':', 1) if ':' in netloc else (netloc, 80)
+            host, port, path = _hostPortPath(baseUrl)
             self._sruUpdateClient = SruUpdateClient(
                 host=host,
-                port=int(port),
+                port=port,
                 path=path,
                 userAgent=userAgent,
                 synchronous=True)
+            self._pool = SruUpdatePool(host=host, port=port, path=path, userAgent=userAgent, concurrency=concurrency, timeout=timeout)
         self._log = log
+        self._logLock = Lock()
         self._log.write("Uploading to: %s\n" % repr(baseUrl))
 
     def uploadRecord(self, identifier, data):
+        if self._concurrent:
+            return self._pool.add(identifier=identifier, data=data, onDone=lambda: self._logWrite("Uploaded: %s\n" % identifier))
         self._upload(identifier, data)
         self._log.write("Uploaded: %s\n" % identifier)
 
     def deleteRecord(self, identifier):
+        if self._concurrent:
+            return self._pool.delete(identifier=identifier, onDone=lambda: self._logWrite("Deleted: %s\n" % identifier))
         self._delete(identifier)
         self._log.write("Deleted: %s\n" % identifier)
 
+    def _uploadBatch(self, operations):
+        if self._pool is None:
+            return self._logOperations(operations)
+        self._pool.bulk(operations, maxRecords=self._maxBatchRecords, maxBytes=self._maxBatchBytes, onDone=self._logOperations)
+        self._pool.flush()
+
+    def flushUploads(self):
+        if self._pool is not None:
+            self._pool.flush()
+
+    def closeUploads(self):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+
+    def _logOperations(self, operations):
+        self._logWrite(''.join(
+            ("Deleted: %s\n" if operation['action'] == 'delete' else "Uploaded: %s\n") % operation['identifier']
+            for operation in operations))
+
+    def _logWrite(self, aString):
+        with self._logLock:
+            self._log.write(aString)
+
     def _upload(self, identifier, data):
         consume(self._sruUpdateClient.add(identifier=identifier, data=data))
 
@@ -66,6 +108,82 @@ class Upload(object):
         consume(self._sruUpdateClient.delete(identifier=identifier))
 
 
+class AsyncUpload(object):
+    def __init__(self, baseUrl, log, userAgent="Meresco-Fetch Harvester", concurrency=1, bulk=False, maxBatchRecords=100, maxBatchBytes=1024*1024, timeout=TIMEOUT):
+        self._connections = []
+        if bulk:
+            self.uploadBatch = self._uploadBatch
+        self._executor = None
+        if baseUrl:
+            host, port, path = _hostPortPath(baseUrl)
+            self._connections = [SruUpdateConnection(host=host, port=port, path=path, userAgent=userAgent, timeout=timeout) for _ in range(concurrency)]
+        self._locks = None
+        self._locksLoop = None
+        self._maxBatchRecords = maxBatchRecords
+        self._maxBatchBytes = maxBatchBytes
+        self._log = log
+        self._log.write("Uploading to: %s\n" % repr(baseUrl))
+
+    async def uploadRecord(self, identifier, data):
+        await self._send(identifier, lambda connection: connection.add(identifier=identifier, data=data))
+        self._log.write("Uploaded: %s\n" % identifier)
+
+    async def deleteRecord(self, identifier):
+        await self._send(identifier, lambda connection: connection.delete(identifier=identifier))
+        self._log.write("Deleted: %s\n" % identifier)
+
+    async def _uploadBatch(self, operations):
+        if not self._connections:
+            return self._logOperations(operations)
+        partitions = [[] for _ in self._connections]
+        for operation in operations:
+            partitions[partitionIndex(operation['identifier'], len(self._connections))].append(operation)
+        await asyncio.gather(*(self._sendPartition(index, partition) for index, partition in enumerate(partitions) if partition))
+
+    def closeUploads(self):
+        self.close()
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for connection in self._connections:
+            connection.close()
+
+    async def _sendPartition(self, index, operations):
+        for chunk in packOperations(operations, maxRecords=self._maxBatchRecords, maxBytes=self._maxBatchBytes):
+            await self._sendOn(index, lambda connection, chunk=chunk: connection.bulk(chunk))
+            self._logOperations(chunk)
+
+    async def _send(self, identifier, request):
+        if self._connections:
+            await self._sendOn(partitionIndex(identifier, len(self._connections)), request)
+
+    async def _sendOn(self, index, request):
+        async with self._lock(index):
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(self._connections), thread_name_prefix='asyncupload')
+            await asyncio.get_running_loop().run_in_executor(self._executor, request, self._connections[index])
+
+    def _lock(self, index):
+        loop = asyncio.get_running_loop()
+        if self._locksLoop is not loop:  # every asyncio.run of a harvest has its own loop
+            self._locks = [asyncio.Lock() for _ in self._connections]
+            self._locksLoop = loop
+        return self._locks[index]
+
+    def _logOperations(self, operations):
+        self._log.write(''.join(
+            ("Deleted: %s\n" if operation['action'] == 'delete' else "Uploaded: %s\n") % operation['identifier']
+            for operation in operations))
+
+
+def _hostPortPath(baseUrl):
+    _, netloc, path, _, _ = urlsplit(baseUrl)
+    host, port = netloc.split(':', 1) if ':' in netloc else (netloc, 80)
+    return host, int(port), path
+
+
 class _Ignore(object):
     def add(self, **kwargs):
         return
@@ -38,8 +38,15 @@ import seecr_initvm
 seecr_initvm.initvm("meresco_lucene", "meresco_oai")
 from unittest import main
 
+from asyncharvestertest import AsyncHarvesterTest
+from batchcachetest import BatchCacheTest
+from compactindextest import CompactIndexTest
+from externalsorttest import ExternalSortTest
 from harvesttest import HarvestTest
 from oaipmhdownloadtest import OaiPmhDownloadTest
+from schedulertest import SchedulerTest
+from sqliteeventstest import SqliteEventsTest
+from uploadtest import UploadTest
 
 if __name__ == "__main__":
     main()
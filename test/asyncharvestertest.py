@@ -0,0 +1,268 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+import asyncio
+from os.path import join, isfile
+from threading import Event
+from io import StringIO
+
+from simplejson import load as jsonLoad
+
+from seecr.test import SeecrTestCase
+from seecr.zulutime import ZuluTime
+
+from meresco.fetch import AsyncHarvester, Harvester
+from meresco.fetch._eventstore import iterEvents
+
+from harvesttest import Batch, Record
+
+
+class AsyncHarvesterTest(SeecrTestCase):
+    def setUp(self):
+        SeecrTestCase.setUp(self)
+        self.log = StringIO()
+        self.observer = AsyncObserver()
+
+    def _prepareHarvester(self, harvesterClass=AsyncHarvester, **kwargs):
+        harvester = harvesterClass(self.tempdir, log=self.log, errorInterval=0.5, **kwargs)
+        harvester._state.now = lambda: ZuluTime("1976-11-08T12:34:56Z")
+        harvester.addObserver(self.observer)
+        return harvester
+
+    def _state(self):
+        with open(join(self.tempdir, 'state')) as fp:
+            return jsonLoad(fp)
+
+    def _events(self, name):
+        return list(iterEvents(join(self.tempdir, name)))
+
+    def testHarvestWithAsyncObservers(self):
+        self.observer.batches = [
+            makeBatch([Record('id0', 'data0'), Record('id1', 'data1')], resumptionAttributes={'token': 't1'}),
+            makeBatch([Record('id2', 'data2'), Record('id1', delete=True)], harvestingReady=True),
+        ]
+        harvester = self._prepareHarvester(uploadConcurrency=2)
+        asyncio.run(harvester.harvest())
+        self.assertEqual([('downloadBatch', {}), ('downloadBatch', {'token': 't1'})], [c for c in self.observer.calls if c[0] == 'downloadBatch'])
+        self.assertEqual(['id0', 'id1', 'id2'], sorted(identifier for message, identifier in self.observer.calls if message == 'uploadRecord'))
+        self.assertEqual([('deleteRecord', 'id1')], [c for c in self.observer.calls if c[0] == 'deleteRecord'])
+        self.assertEqual(2, self.observer.maxConcurrentUploads)
+        self.assertEqual(True, self._state()['harvestingReady'])
+        self.assertEqual(['id0', 'id2'], list(harvester._events.remainingAdds()))
+
+    def testMetrics(self):
+        self.observer.batches = [makeBatch([Record('id0', 'data0'), Record('id1', 'data1')], harvestingReady=True)]
+        asyncio.run(self._prepareHarvester(metricsInterval=0).harvest())
+        with open(join(self.tempdir, 'metrics.json')) as fp:
+            metrics = jsonLoad(fp)['harvest']
+        self.assertEqual(2, metrics['records'])
+        self.assertTrue(metrics['phases']['upload'] >= 0.02, metrics)
+
+    def testSameOnDiskFormatsAsHarvester(self):
+        self.observer.batches = [makeBatch([Record('id0', 'data0'), Record('id1', 'data1')], harvestingReady=True)]
+        asyncio.run(self._prepareHarvester().harvest())
+        asyncState = self._state()
+        asyncEvents = self._events('previous')
+
+        self.observer = SyncObserver()
+        self.observer.batches = [makeBatch([Record('id0', 'data0'), Record('id1', 'data2')], harvestingReady=True)]
+        harvester = self._prepareHarvester(harvesterClass=Harvester)
+        harvester._state.harvestingReady = False
+        harvester.harvest()
+        self.assertEqual(asyncState, self._state())
+        self.assertEqual([('uploadRecord', 'id1')], self.observer.calls)
+        self.assertEqual(asyncEvents[0], self._events('previous')[0])
+
+    def testUploadErrorDiscardsBatch(self):
+        self.observer.batches = [makeBatch([Record('id0', 'data0'), Record('id1', 'fail')], harvestingReady=True)]
+        harvester = self._prepareHarvester(uploadConcurrency=4)
+        self.assertRaises(IOError, asyncio.run, harvester.harvest())
+        self.assertEqual({'harvestingReady': False, 'datetime': '1976-11-08T12:34:56Z', 'resumptionAttributes': None, 'error': True, 'failures': 1, 'nextAttempt': '1976-11-08T12:34:57Z'}, self._state())
+        self.assertEqual([], self._events('current'))
+
+    def testFailedDeleteRetried(self):
+        harvester = self._prepareHarvester()
+        harvester._events.markHarvestStart()
+        harvester._events.markEvent(identifier='id0', uploadData='data0')
+        harvester._events.markEvent(identifier='id9', uploadData='data9')
+        harvester._events.markHarvestReady()
+        self.observer.batches = [makeBatch([Record('id0', 'data0')], harvestingReady=True)]
+        failures = ['id9']
+        async def deleteRecord(identifier):
+            self.observer.calls.append(('deleteRecord', identifier))
+            if identifier in failures:
+                failures.remove(identifier)
+                raise IOError('help!')
+        self.observer.deleteRecord = deleteRecord
+        self.assertRaises(IOError, asyncio.run, harvester.harvest())
+        self.assertEqual(True, self._state()['error'])
+        self.assertFalse(harvester._events.alreadyDeleted('id9'))
+
+        harvester._state.now = lambda: ZuluTime("1976-11-08T12:35:56Z")
+        asyncio.run(harvester.harvest())
+        self.assertEqual([('deleteRecord', 'id9'), ('deleteRecord', 'id9')], [call for call in self.observer.calls if call[0] == 'deleteRecord'])
+        self.assertTrue(harvester._events.alreadyDeleted('id9'))
+        self.assertEqual(False, self._state()['error'])
+
+    def testFailedFlushUploadsOfFinalBatchRetried(self):
+        harvester = self._prepareHarvester()
+        harvester._events.markHarvestStart()
+        harvester._events.markEvent(identifier='id0', uploadData='data0')
+        harvester._events.markEvent(identifier='id1', uploadData='data1')
+        harvester._events.markHarvestReady()
+        failures = [IOError('help!')]
+        def flushUploads():
+            if failures:
+                raise failures.pop()
+        self.observer.flushUploads = flushUploads
+        self.observer.batches = [makeBatch([Record('id0', 'data0.1'), Record('id1', 'data1.1')], harvestingReady=True)] * 2
+        self.assertRaises(IOError, asyncio.run, harvester.harvest())
+        state = self._state()
+        self.assertEqual((False, True, None), (state['harvestingReady'], state['error'], state['resumptionAttributes']))
+
+        harvester._state.now = lambda: ZuluTime("1976-11-08T12:35:56Z")
+        asyncio.run(harvester.harvest())
+        self.assertEqual([('downloadBatch', {}), ('downloadBatch', {})], [call for call in self.observer.calls if call[0] == 'downloadBatch'])
+        self.assertEqual([], [call for call in self.observer.calls if call[0] == 'deleteRecord'])
+        self.assertTrue(harvester._events.alreadyAdded('id1', 'data1.1'))
+        self.assertEqual(True, self._state()['harvestingReady'])
+
+    def testRestartAfterCrashDoesNotUploadAgain(self):
+        self._assertRestartAfterCrashDoesNotUploadAgain()
+
+    def testRestartAfterCrashDoesNotUploadAgainWithCompactEvents(self):
+        self._assertRestartAfterCrashDoesNotUploadAgain(compactEvents=True)
+
+    def testRestartAfterCrashDoesNotUploadAgainWithSqliteEvents(self):
+        self._assertRestartAfterCrashDoesNotUploadAgain(eventStore='sqlite')
+
+    def _assertRestartAfterCrashDoesNotUploadAgain(self, **kwargs):
+        uploads = []
+        for run in range(2):
+            self.observer = AsyncObserver()
+            self.observer.batches = [
+                makeBatch([Record('id0', 'data0'), Record('id1', 'data1'), Record('id2', delete=True)], resumptionAttributes={'token': 'next'}),
+                KeyboardInterrupt(),
+            ]
+            harvester = self._prepareHarvester(checkpointBatches=10, **kwargs)
+            self.assertRaises(KeyboardInterrupt, asyncio.run, harvester.harvest())
+            harvester._events.close()
+            self.assertFalse(isfile(join(self.tempdir, 'state')))
+            uploads.append([call for call in self.observer.calls if call[0] in ['uploadRecord', 'deleteRecord']])
+        self.assertEqual([[('uploadRecord', 'id0'), ('uploadRecord', 'id1'), ('deleteRecord', 'id2')], []], uploads)
+        self.assertTrue('0 added, 0 deleted, 3 unchanged, 0 skipped.' in self.log.getvalue())
+
+    def testConvertAndStreamingRecordsOverlapUploads(self):
+        uploaded = dict((identifier, Event()) for identifier in ['id0', 'id1', 'id2'])
+        converting = Event()
+        def records():
+            yield Record('id0', 'data0')
+            yield Record('id1', 'data1')
+            self.assertTrue(uploaded['id1'].wait(5))
+            yield Record('id2', 'data2')
+        def convert(record):
+            if record.identifier == 'id1':
+                converting.set()
+                self.assertTrue(uploaded['id0'].wait(5))
+            return record.data
+        async def uploadRecord(identifier, data):
+            if identifier == 'id0':
+                while not converting.is_set():
+                    await asyncio.sleep(0.001)
+            uploaded[identifier].set()
+        batch = makeBatch(records(), harvestingReady=True)
+        batch.streaming = True
+        self.observer.batches = [batch]
+        self.observer.convert = convert
+        self.observer.uploadRecord = uploadRecord
+        asyncio.run(self._prepareHarvester(uploadConcurrency=2).harvest())
+        self.assertTrue(all(event.is_set() for event in uploaded.values()))
+        self.assertTrue('3 added, 0 deleted, 0 unchanged, 0 skipped.' in self.log.getvalue(), self.log.getvalue())
+
+    def testPrefetchNextBatch(self):
+        self.observer.batches = [
+            makeBatch([Record('id0', 'data0')], resumptionAttributes={'token': 't1'}),
+            makeBatch([Record('id1', 'data1')], harvestingReady=True),
+        ]
+        asyncio.run(self._prepareHarvester(prefetch=True).harvest())
+        downloads = [i for i, c in enumerate(self.observer.calls) if c[0] == 'downloadBatch']
+        firstUpload = self.observer.calls.index(('uploadRecord', 'id0'))
+        self.assertEqual(2, len(downloads))
+        self.assertTrue(downloads[1] < firstUpload, self.observer.calls)
+
+
+class AsyncObserver(object):
+    def __init__(self):
+        self.batches = []
+        self.calls = []
+        self.concurrentUploads = 0
+        self.maxConcurrentUploads = 0
+
+    async def downloadBatch(self, resumptionAttributes):
+        self.calls.append(('downloadBatch', resumptionAttributes))
+        await asyncio.sleep(0)
+        batch = self.batches.pop(0)
+        if isinstance(batch, BaseException):
+            raise batch
+        return batch
+
+    def convert(self, record):
+        return record.data
+
+    async def uploadRecord(self, identifier, data):
+        self.calls.append(('uploadRecord', identifier))
+        self.concurrentUploads += 1
+        self.maxConcurrentUploads = max(self.maxConcurrentUploads, self.concurrentUploads)
+        try:
+            await asyncio.sleep(0.01)
+            if data == 'fail':
+                raise IOError('upload failed')
+        finally:
+            self.concurrentUploads -= 1
+
+    async def deleteRecord(self, identifier):
+        self.calls.append(('deleteRecord', identifier))
+
+
+class SyncObserver(object):
+    def __init__(self):
+        self.batches = []
+        self.calls = []
+
+    def downloadBatch(self, resumptionAttributes):
+        return self.batches.pop(0)
+
+    def convert(self, record):
+        return record.data
+
+    def uploadRecord(self, identifier, data):
+        self.calls.append(('uploadRecord', identifier))
+
+
+def makeBatch(records, resumptionAttributes=None, harvestingReady=False):
+    batch = Batch()
+    batch.records = records
+    batch.harvestingReady = harvestingReady
+    batch.resumptionAttributes = lambda: resumptionAttributes
+    return batch
@@ -0,0 +1,76 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from io import BytesIO
+from os import listdir, utime, urandom
+from os.path import join
+from time import time
+
+from seecr.test import SeecrTestCase
+
+from meresco.fetch._batchcache import BatchCache
+from meresco.fetch._oaistream import StreamingListRequest
+
+
+class BatchCacheTest(SeecrTestCase):
+    def store(self, cache, token, data):
+        request = StreamingListRequest(baseurl='http://example.org/oai', resumptionToken=token)
+        with cache.store(request, BytesIO(data)) as response:
+            response.read(1)
+        return request
+
+    def testStoreAndOpen(self):
+        cache = BatchCache(join(self.tempdir, 'cache'))
+        request = self.store(cache, 'token1', b'<response/>')
+        with cache.open(request) as fp:
+            self.assertEqual(b'<response/>', fp.read())
+        self.assertRaises(IOError, cache.open, StreamingListRequest(baseurl='http://example.org/oai', resumptionToken='token2'))
+
+    def testFailedResponseNotCached(self):
+        cache = BatchCache(self.tempdir)
+        request = StreamingListRequest(baseurl='http://example.org/oai', resumptionToken='token1')
+        try:
+            with cache.store(request, BytesIO(b'<response/>')):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual([], listdir(self.tempdir))
+
+    def testMaxAge(self):
+        cache = BatchCache(self.tempdir, maxAge=3600)
+        old = self.store(cache, 'token1', b'<old/>')
+        path = join(self.tempdir, listdir(self.tempdir)[0])
+        utime(path, (time() - 7200, time() - 7200))
+        new = self.store(cache, 'token2', b'<new/>')
+        self.assertRaises(IOError, cache.open, old)
+        cache.open(new).close()
+
+    def testMaxBytesRemovesOldestFirst(self):
+        cache = BatchCache(self.tempdir, maxBytes=600)
+        requests = [self.store(cache, 'token%d' % i, urandom(200)) for i in range(5)]
+        self.assertEqual(2, len(listdir(self.tempdir)))
+        for request in requests[:3]:
+            self.assertRaises(IOError, cache.open, request)
+        for request in requests[3:]:
+            cache.open(request).close()
@@ -0,0 +1,132 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from hashlib import md5
+
+from seecr.test import SeecrTestCase
+
+from meresco.fetch._compactindex import CompactIndex, PendingIndex
+
+
+class CompactIndexTest(SeecrTestCase):
+    def testEmpty(self):
+        index = CompactIndex.fromEvents([])
+        self.assertEqual(0, len(index))
+        self.assertEqual(None, index.get('id0'))
+        self.assertEqual([], list(index.items()))
+
+    def testSortedEvents(self):
+        index = CompactIndex.fromEvents([
+            ('id0', 'A', makeHash('data0')),
+            ('id1', 'D', None),
+            ('id2', 'A', makeHash('data2')),
+        ])
+        self.assertEqual(3, len(index))
+        self.assertEqual(['A', makeHash('data0'), None], index.get('id0'))
+        self.assertEqual(['D', '', None], index.get('id1'))
+        self.assertEqual(None, index.get('id01'))
+        self.assertTrue('id2' in index)
+        self.assertFalse('id3' in index)
+
+    def testUnsortedEventsLastEventWins(self):
+        index = CompactIndex.fromEvents([
+            ('id2', 'A', makeHash('data2')),
+            ('id0', 'A', makeHash('data0')),
+            ('id2', 'D', ''),
+            ('id1', 'A', makeHash('data1')),
+        ])
+        self.assertEqual([
+                ('id0', ['A', makeHash('data0'), None]),
+                ('id1', ['A', makeHash('data1'), None]),
+                ('id2', ['D', '', None]),
+            ], list(index.items()))
+
+    def testNonAsciiIdentifiersSortLikeStrings(self):
+        identifiers = ['z', 'é', 'a', '中', 'B']
+        index = CompactIndex.fromEvents((i, 'A', makeHash(i)) for i in identifiers)
+        self.assertEqual(sorted(identifiers), [identifier for identifier, _ in index.items()])
+        self.assertEqual(['A', makeHash('é'), None], index.get('é'))
+
+    def testManyBlocks(self):
+        events = [('repo:%04d' % i, 'A', makeHash(str(i))) for i in range(0, 1000, 3)]
+        index = CompactIndex.fromEvents(reversed(events))
+        self.assertEqual([(identifier, ['A', dataHash, None]) for identifier, _, dataHash in events], list(index.items()))
+        for i in range(1000):
+            expected = ['A', makeHash(str(i)), None] if i % 3 == 0 else None
+            self.assertEqual(expected, index.get('repo:%04d' % i))
+        self.assertEqual(None, index.get('repo:'))
+        self.assertEqual(None, index.get('repo:9999'))
+
+    def testFingerprints(self):
+        index = CompactIndex.fromEvents([
+            ('id0', 'A', makeHash('data0')),
+            ('id1', 'A', makeHash('data1'), makeHash('source1')),
+            ('id2', 'D', '', None),
+            ('id3', 'A', makeHash('data3'), makeHash('source3')),
+        ])
+        self.assertEqual(['A', makeHash('data0'), None], index.get('id0'))
+        self.assertEqual(['A', makeHash('data1'), makeHash('source1')], index.get('id1'))
+        self.assertEqual(['D', '', None], index.get('id2'))
+        self.assertEqual(['A', makeHash('data3'), makeHash('source3')], index.get('id3'))
+
+    def testUnparsableHashNeverMatches(self):
+        index = CompactIndex.fromEvents([('id:1', 'A', 'datahash')])
+        self.assertEqual('A', index.get('id:1')[0])
+        self.assertNotEqual('datahash', index.get('id:1')[1])
+
+    def testPendingIndexMergedInto(self):
+        pending = PendingIndex()
+        pending['id2'] = ('A', makeHash('data2'), makeHash('source2'))
+        pending['id0'] = ('D', '', None)
+        pending['id2'] = ('A', makeHash('data2.1'), None)
+        self.assertTrue('id0' in pending)
+        self.assertEqual(['A', makeHash('data2.1'), None], pending.get('id2'))
+        self.assertEqual(['id0', 'id2'], [identifier for identifier, event in pending.items()])
+        index = pending.mergedInto(CompactIndex.fromEvents([('id0', 'A', makeHash('data0')), ('id1', 'A', makeHash('data1'))]))
+        self.assertEqual([
+                ('id0', ['D', '', None]),
+                ('id1', ['A', makeHash('data1'), None]),
+                ('id2', ['A', makeHash('data2.1'), None]),
+            ], list(index.items()))
+
+    def testPendingIndexFreezesBufferIntoRuns(self):
+        pending = PendingIndex(bufferSize=4)
+        expected = {}
+        for i in range(100):
+            identifier = 'id%02d' % ((i * 37) % 41)
+            event = ['D', '', None] if i % 7 == 0 else ['A', makeHash('data%d' % i), None]
+            pending[identifier] = event
+            expected[identifier] = event
+        runSizes = [len(run.index) for run in pending._runs]
+        self.assertTrue(len(runSizes) > 1)
+        self.assertEqual(sorted(runSizes, reverse=True), runSizes)
+        for i in range(45):
+            identifier = 'id%02d' % i
+            self.assertEqual(expected.get(identifier), pending.get(identifier))
+            self.assertEqual(identifier in expected, identifier in pending)
+        self.assertEqual(sorted(expected.items()), list(pending.items()))
+        self.assertEqual(sorted(expected.items()), list(pending.mergedInto(CompactIndex()).items()))
+
+def makeHash(data):
+    return md5(data.encode()).hexdigest()
@@ -0,0 +1,41 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from seecr.test import SeecrTestCase
+
+from meresco.fetch._externalsort import mergeJoin
+
+
+class ExternalSortTest(SeecrTestCase):
+    def testMergeJoin(self):
+        left = [('a', 1), ('c', 2), ('d', 3)]
+        right = [('b', 4), ('c', 5), ('e', 6)]
+        self.assertEqual([
+                ('a', ('a', 1), None),
+                ('b', None, ('b', 4)),
+                ('c', ('c', 2), ('c', 5)),
+                ('d', ('d', 3), None),
+                ('e', None, ('e', 6)),
+            ], list(mergeJoin(left, right)))
+        self.assertEqual([], list(mergeJoin([], [])))
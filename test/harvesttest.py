@@ -29,8 +29,12 @@
 #
 ## end license ##
 
-from os.path import join, isfile
+from os import rename, listdir
+from os.path import join, isfile, getsize
+from hashlib import md5
 from io import StringIO
+from threading import Event
+from time import sleep
 
 from simplejson import load as jsonLoad
 
@@ -38,7 +42,9 @@ from seecr.test import SeecrTestCase, CallTrace
 from seecr.zulutime import ZuluTime
 
 from meresco.components.json import JsonDict
-from meresco.fetch.harvester import Harvester, BatchProtocol, RecordProtocol, SkipRecordException
+from meresco.fetch import harvester as harvesterModule
+from meresco.fetch.harvester import Harvester, BatchProtocol, RecordProtocol, SkipRecordException, _Events
+from meresco.fetch._eventstore import iterEvents, isSortedEventLog
 
 
 class HarvestTest(SeecrTestCase):
@@ -48,8 +54,8 @@ class HarvestTest(SeecrTestCase):
         self.observer = CallTrace('observer', methods={'convert': (lambda record: str(record))})
         self._prepareHarvester()
 
-    def _prepareHarvester(self, deleteAll=False):
-        self.harvester = Harvester(self.tempdir, log=self.log, deleteAll=deleteAll, errorInterval=0.5)
+    def _prepareHarvester(self, deleteAll=False, **kwargs):
+        self.harvester = Harvester(self.tempdir, log=self.log, deleteAll=deleteAll, errorInterval=0.5, **kwargs)
         self.harvester._state.now = lambda: ZuluTime("1976-11-08T12:34:56Z")
         self.harvester.addObserver(self.observer)
         return self.harvester
@@ -66,7 +72,7 @@ class HarvestTest(SeecrTestCase):
         batch.harvestingReady = True
         self.observer.returnValues['downloadBatch'] = batch
         self.harvester.harvest()
-        self.assertEqual(['downloadBatch', 'batchDone'], self.observer.calledMethodNames())
+        self.assertEqual(['downloadBatch', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
         self.assertEqual('Harvesting.\n0 added, 0 deleted, 0 unchanged, 0 skipped.\n-\nFinished harvesting.\n', self.log.getvalue())
 
     def testHarvestMoreThanOneBatch(self):
@@ -88,12 +94,12 @@ class HarvestTest(SeecrTestCase):
         self.observer.methods['downloadBatch'] = lambda **kwargs: batches.pop(0)
         self.observer.methods['convert'] =lambda record: 'converted.' + record.data
         self.harvester.harvest()
-        self.assertEqual(['downloadBatch', 'convert', 'uploadRecord', 'convert', 'uploadRecord', 'batchDone', 'downloadBatch', 'convert', 'uploadRecord', 'batchDone', 'deleteRecord'], self.observer.calledMethodNames())
-        lastDownloadBatchCall = self.observer.calledMethods[-5]
+        self.assertEqual(['downloadBatch', 'convert', 'uploadRecord', 'convert', 'uploadRecord', 'flushUploads', 'batchDone', 'downloadBatch', 'convert', 'uploadRecord', 'flushUploads', 'batchDone', 'deleteRecord', 'flushUploads', 'closeUploads'], self.observer.calledMethodNames())
+        lastDownloadBatchCall = self.observer.calledMethods[-8]
         self.assertEqual({'resumptionAttributes': {'key': 'value1'}}, lastDownloadBatchCall.kwargs)
-        lastUploadRecordCall = self.observer.calledMethods[-3]
+        lastUploadRecordCall = self.observer.calledMethods[-6]
         self.assertEqual({'identifier': 'id2', 'data': 'converted.data2'}, lastUploadRecordCall.kwargs)
-        deleteRecordCall = self.observer.calledMethods[-1]
+        deleteRecordCall = self.observer.calledMethods[-3]
         self.assertEqual({'identifier': 'id9'}, deleteRecordCall.kwargs)
         self.assertEqual(['id0', 'id1', 'id2'], list(self.harvester._events.remainingAdds()))
 
@@ -105,7 +111,7 @@ class HarvestTest(SeecrTestCase):
         self.harvester._events.markHarvestReady()
         self.assertEqual(['id0', 'id1', 'id9'], list(self.harvester._events.remainingAdds()))
         self._prepareHarvester(deleteAll=True).harvest()
-        self.assertEqual(['deleteRecord'] * 3, self.observer.calledMethodNames())
+        self.assertEqual(['deleteRecord'] * 3 + ['flushUploads', 'closeUploads'], self.observer.calledMethodNames())
         self.assertEqual([], list(self.harvester._events.remainingAdds()))
 
     def testDownloadError(self):
@@ -122,7 +128,9 @@ class HarvestTest(SeecrTestCase):
             'harvestingReady': False,
             'datetime': '1976-11-08T12:34:56Z',
             'resumptionAttributes': None,
-            'error': True}, persistedState)
+            'error': True,
+            'failures': 1,
+            'nextAttempt': '1976-11-08T12:34:57Z'}, persistedState)
 
         lastError = self._lastError()
         self.assertTrue('help!' in lastError, lastError)
@@ -134,15 +142,68 @@ class HarvestTest(SeecrTestCase):
             batch.quitForSleep = True
             return batch
         self.observer.methods['downloadBatch'] = downloadBatch
+        self.observer.calledMethods.reset()
+        self.harvester.harvest()
+        self.assertEqual([], self.observer.calledMethodNames())
+        self.assertTrue('Waiting until 1976-11-08T12:34:57Z after 1 consecutive failure(s).\n' in self.log.getvalue(), self.log.getvalue())
+
+        self.harvester._state.now = lambda: ZuluTime("1976-11-08T12:34:57Z")
         self.harvester.harvest()
         persistedState = self._state()
         self.assertEqual({
             'harvestingReady': False,
-            'datetime': '1976-11-08T12:34:56Z',
+            'datetime': '1976-11-08T12:34:57Z',
             'resumptionAttributes': {},
             'error': False}, persistedState)
         self.assertFalse(isfile(join(self.tempdir, 'last_error')))
 
+    def testErrorBackoffGrowsExponentially(self):
+        self._prepareHarvester(errorJitter=0, maxErrorInterval=5)
+        def downloadBatchRaises(resumptionAttributes):
+            raise IOError('help!')
+        self.observer.methods['downloadBatch'] = downloadBatchRaises
+        now = ZuluTime("1976-11-08T12:34:56Z").epoch
+        nextAttempts = []
+        for i in range(5):
+            self.harvester._state.now = lambda: ZuluTime(now)
+            self.assertRaises(IOError, self.harvester.harvest)
+            self.assertEqual(i + 1, self._state()['failures'])
+            nextAttempts.append(self.harvester.nextHarvestTime() - now)
+            now = self.harvester.nextHarvestTime()
+        self.assertEqual([1, 1, 2, 4, 5], nextAttempts)
+        reloaded = self._prepareHarvester()
+        self.assertEqual(5, reloaded._state.failures)
+        self.assertEqual(now, reloaded.nextHarvestTime())
+
+    def testIncrementalHarvestMergesEventsWithoutDeleting(self):
+        self._assertIncrementalHarvest()
+
+    def testIncrementalHarvestMergesEventsWithoutDeletingWithCompactEvents(self):
+        self._assertIncrementalHarvest(compactEvents=True)
+
+    def _assertIncrementalHarvest(self, **kwargs):
+        self._prepareHarvester(**kwargs)
+        self.harvester._events.markHarvestStart()
+        self.harvester._events.markEvent(identifier='id0', uploadData='converted.data0')
+        self.harvester._events.markEvent(identifier='id1', uploadData='converted.data1')
+        self.harvester._events.markHarvestReady()
+        batch = Batch()
+        batch.records = [Record('id1', delete=True), Record('id2', 'data2')]
+        batch.harvestingReady = True
+        batch.incremental = True
+        batch.resumptionAttributes = lambda: {'nextHarvest': {'from': 'here'}}
+        self.observer.returnValues['downloadBatch'] = batch
+        self.observer.methods['convert'] = lambda record: 'converted.' + record.data
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch', 'deleteRecord', 'convert', 'uploadRecord', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual(True, self._state()['incremental'])
+        self.assertEqual(['id0', 'id2'], list(self.harvester._events.remainingAdds()))
+        self.assertTrue(self.harvester._events.alreadyAdded('id0', 'converted.data0'))
+
+        self.harvester._state.restart()
+        self.assertEqual({'nextHarvest': {'from': 'here'}}, self.harvester._state.resumptionAttributes)
+        self.assertEqual(False, self.harvester._state.incremental)
+
     def testConvertError(self):
         batch = Batch()
         batch.records = [Record('id0', 'data0'), Record('id1', 'data1')]
@@ -161,7 +222,9 @@ class HarvestTest(SeecrTestCase):
             'harvestingReady': False,
             'datetime': '1976-11-08T12:34:56Z',
             'resumptionAttributes': None,
-            'error': True}, persistedState)
+            'error': True,
+            'failures': 1,
+            'nextAttempt': '1976-11-08T12:34:57Z'}, persistedState)
         lastError = self._lastError()
         self.assertTrue('help!' in lastError, lastError)
 
@@ -203,7 +266,9 @@ class HarvestTest(SeecrTestCase):
             'harvestingReady': False,
             'datetime': '1976-11-08T12:34:56Z',
             'resumptionAttributes': None,
-            'error': True}, persistedState)
+            'error': True,
+            'failures': 1,
+            'nextAttempt': '1976-11-08T12:34:57Z'}, persistedState)
         lastError = self._lastError()
         self.assertTrue('help!' in lastError, lastError)
 
@@ -218,9 +283,81 @@ class HarvestTest(SeecrTestCase):
         self.observer.methods['downloadBatch'] = lambda **kwargs: batch
         self.observer.methods['convert'] =lambda record: 'converted.' + record.data
         self.harvester.harvest()
-        self.assertEqual(['downloadBatch', 'convert', 'convert', 'uploadRecord', 'batchDone'], self.observer.calledMethodNames())
-        self.assertEqual({'identifier': 'id1', 'data': 'converted.data1.changed'}, self.observer.calledMethods[-2].kwargs)
+        self.assertEqual(['downloadBatch', 'convert', 'convert', 'uploadRecord', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual({'identifier': 'id1', 'data': 'converted.data1.changed'}, self.observer.calledMethods[-4].kwargs)
+        self.assertEqual(['id0', 'id1'], list(self.harvester._events.remainingAdds()))
+
+    def testOnlyUploadUpdatesWithCompactEvents(self):
+        self.harvester._events.markHarvestStart()
+        self.harvester._events.markEvent(identifier='id0', uploadData='converted.data0')
+        self.harvester._events.markEvent(identifier='id1', uploadData='converted.data1')
+        self.harvester._events.markEvent(identifier='id2', uploadData='converted.data2')
+        self.harvester._events.markHarvestReady()
+        self._prepareHarvester(compactEvents=True)
+        batch = Batch()
+        batch.records = [Record('id0', 'data0'), Record('id1', 'data1.changed')]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        self.observer.methods['convert'] =lambda record: 'converted.' + record.data
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch', 'convert', 'convert', 'uploadRecord', 'flushUploads', 'batchDone', 'deleteRecord', 'flushUploads', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual({'identifier': 'id1', 'data': 'converted.data1.changed'}, self.observer.calledMethods[3].kwargs)
+        self.assertEqual({'identifier': 'id2'}, self.observer.calledMethods[-3].kwargs)
+        self.assertEqual(['id0', 'id1'], list(self.harvester._events.remainingAdds()))
+
+    def testHarvestWithSqliteEvents(self):
+        self._prepareHarvester(eventStore='sqlite')
+        self.harvester._events.markHarvestStart()
+        self.harvester._events.markEvent(identifier='id0', uploadData='converted.data0')
+        self.harvester._events.markEvent(identifier='id9', uploadData='converted.data9')
+        self.harvester._events.markHarvestReady()
+        batch = Batch()
+        batch.records = [Record('id0', 'data0'), Record('id1', 'data1')]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        self.observer.methods['convert'] =lambda record: 'converted.' + record.data
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch', 'convert', 'convert', 'uploadRecord', 'flushUploads', 'batchDone', 'deleteRecord', 'flushUploads', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual({'identifier': 'id1', 'data': 'converted.data1'}, self.observer.calledMethods[3].kwargs)
+        self.assertEqual({'identifier': 'id9'}, self.observer.calledMethods[-3].kwargs)
         self.assertEqual(['id0', 'id1'], list(self.harvester._events.remainingAdds()))
+        self.assertFalse(isfile(join(self.tempdir, 'previous')))
+
+    def testSkipConvertForUnchangedSourceFingerprint(self):
+        self._assertSkipConvertForUnchangedSourceFingerprint()
+
+    def testSkipConvertForUnchangedSourceFingerprintWithCompactEvents(self):
+        self._assertSkipConvertForUnchangedSourceFingerprint(compactEvents=True)
+
+    def testSkipConvertForUnchangedSourceFingerprintWithSqliteEvents(self):
+        self._assertSkipConvertForUnchangedSourceFingerprint(eventStore='sqlite')
+
+    def _assertSkipConvertForUnchangedSourceFingerprint(self, **kwargs):
+        self._prepareHarvester(**kwargs)
+        self.harvester._events.markHarvestStart()
+        self.harvester._events.markEvent(identifier='id0', uploadData='converted.data0', sourceFingerprint='2020-01-01')
+        self.harvester._events.markEvent(identifier='id1', uploadData='converted.data1', sourceFingerprint='2020-01-01')
+        self.harvester._events.markEvent(identifier='id2', uploadData='converted.data2')
+        self.harvester._events.markHarvestReady()
+        batch = Batch()
+        batch.records = [Record('id0', 'data0', fingerprint='2020-01-01'), Record('id1', 'data1.changed', fingerprint='2020-02-02'), Record('id2', 'data2', fingerprint='2020-01-01')]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        self.observer.methods['convert'] =lambda record: 'converted.' + record.data
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch', 'convert', 'uploadRecord', 'convert', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual(['id1', 'id2'], [m.kwargs['record'].identifier for m in self.observer.calledMethods if m.name == 'convert'])
+        self.assertEqual({'identifier': 'id1', 'data': 'converted.data1.changed'}, self.observer.calledMethods[2].kwargs)
+        self.assertEqual(['id0', 'id1', 'id2'], list(self.harvester._events.remainingAdds()))
+        self.assertTrue(self.harvester._events.sourceUnchanged('id0', '2020-01-01'))
+        self.assertTrue(self.harvester._events.sourceUnchanged('id2', '2020-01-01'))
+        self.assertTrue(self.harvester._events.alreadyAdded('id0', 'converted.data0'))
+
+        self._prepareHarvester(reconvert=True, **kwargs)
+        self.harvester._state.harvestingReady = False
+        self.observer.calledMethods.reset()
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch', 'convert', 'convert', 'convert', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
 
     def testDeleteOnlyWhenNotAlready(self):
         self.harvester._events.markHarvestStart()
@@ -232,8 +369,8 @@ class HarvestTest(SeecrTestCase):
         batch.harvestingReady = True
         self.observer.methods['downloadBatch'] = lambda **kwargs: batch
         self.harvester.harvest()
-        self.assertEqual(['downloadBatch', 'deleteRecord', 'batchDone'], self.observer.calledMethodNames())
-        self.assertEqual({'identifier': 'id0'}, self.observer.calledMethods[-2].kwargs)
+        self.assertEqual(['downloadBatch', 'deleteRecord', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual({'identifier': 'id0'}, self.observer.calledMethods[-4].kwargs)
         self.assertEqual([], list(self.harvester._events.remainingAdds()))
 
     def testDeleteOldIfHarvestingReady(self):
@@ -250,20 +387,544 @@ class HarvestTest(SeecrTestCase):
             f.write("id:2\tA\tdatahash\n")
         self._prepareHarvester()
         self.harvester.harvest()
-        self.assertEqual(['deleteRecord', 'deleteRecord'], self.observer.calledMethodNames())
+        self.assertEqual(['deleteRecord', 'deleteRecord', 'flushUploads', 'closeUploads'], self.observer.calledMethodNames())
         self.assertEqual({'identifier': 'id:1'}, self.observer.calledMethods[0].kwargs)
         self.assertEqual({'identifier': 'id:2'}, self.observer.calledMethods[1].kwargs)
 
+    def testInvalidEventStoreOptions(self):
+        self.assertRaises(AssertionError, lambda: Harvester(self.tempdir, eventStore='sqllite'))
+        self.assertRaises(AssertionError, lambda: Harvester(self.tempdir, eventStore='sqlite', compactEvents=True))
+
+    def testFailedFlushUploadsOfFinalBatchRetried(self):
+        self.harvester._events.markHarvestStart()
+        self.harvester._events.markEvent(identifier='id0', uploadData='data0')
+        self.harvester._events.markEvent(identifier='id1', uploadData='data1')
+        self.harvester._events.markHarvestReady()
+        downloads = []
+        def downloadBatch(resumptionAttributes):
+            downloads.append(resumptionAttributes)
+            batch = Batch()
+            batch.records = [Record('id0', 'data0.1'), Record('id1', 'data1.1')]
+            batch.harvestingReady = True
+            return batch
+        failures = [IOError('help!')]
+        def flushUploads():
+            if failures:
+                raise failures.pop()
+        self.observer.methods['downloadBatch'] = downloadBatch
+        self.observer.methods['convert'] = lambda record: record.data
+        self.observer.methods['flushUploads'] = flushUploads
+        self.assertRaises(IOError, self.harvester.harvest)
+        state = self._state()
+        self.assertEqual((False, True, None), (state['harvestingReady'], state['error'], state['resumptionAttributes']))
+
+        self.harvester._state.now = lambda: ZuluTime("1976-11-08T12:35:56Z")
+        self.harvester.harvest()
+        self.assertEqual([{}, {}], downloads)
+        self.assertEqual([], [m for m in self.observer.calledMethodNames() if m == 'deleteRecord'])
+        self.assertEqual(4, self.observer.calledMethodNames().count('uploadRecord'))
+        self.assertTrue(self.harvester._events.alreadyAdded('id1', 'data1.1'))
+        self.assertEqual(True, self._state()['harvestingReady'])
+
+    def testFailedDeleteRetried(self):
+        self._assertFailedDeleteRetried()
+
+    def testFailedDeleteRetriedWithBatchUpload(self):
+        self._assertFailedDeleteRetried(batchUpload=True)
+
+    def _assertFailedDeleteRetried(self, **kwargs):
+        self.harvester._events.markHarvestStart()
+        self.harvester._events.markEvent(identifier='id0', uploadData='data0')
+        self.harvester._events.markEvent(identifier='id9', uploadData='data9')
+        self.harvester._events.markHarvestReady()
+        self.harvester._events.close()
+        self._prepareHarvester(**kwargs)
+        batch = Batch()
+        batch.records = [Record('id0', 'data0')]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        self.observer.methods['convert'] = lambda record: record.data
+        deleted = []
+        def deleteRecord(identifier):
+            if not deleted:
+                deleted.append(None)
+                raise IOError('help!')
+            deleted.append(identifier)
+        def uploadBatch(operations):
+            for operation in operations:
+                deleteRecord(operation['identifier'])
+        self.observer.methods['deleteRecord'] = deleteRecord
+        self.observer.methods['uploadBatch'] = uploadBatch
+        self.assertRaises(IOError, self.harvester.harvest)
+        self.assertEqual(True, self._state()['error'])
+        self.assertFalse(self.harvester._events.alreadyDeleted('id9'))
+
+        self.harvester._state.now = lambda: ZuluTime("1976-11-08T12:35:56Z")
+        self.harvester.harvest()
+        self.assertEqual([None, 'id9'], deleted)
+        self.assertTrue(self.harvester._events.alreadyDeleted('id9'))
+        self.assertEqual(False, self._state()['error'])
+        self.assertFalse(isfile(join(self.tempdir, 'last_error')))
+
+    def testEventsWrittenOncePerBatch(self):
+        currentPath = join(self.tempdir, 'current')
+        def currentEvents():
+            return [event[0] for event in iterEvents(currentPath)]
+        batch = Batch()
+        batch.records = [Record('id0', 'data0'), Record('id1', 'data1')]
+        batch.quitForSleep = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        uploaded = []
+        self.observer.methods['uploadRecord'] = lambda identifier, data: uploaded.append((identifier, currentEvents()))
+        self.harvester.harvest()
+        self.assertEqual([('id0', []), ('id1', [])], uploaded)
+        self.assertEqual(['id0', 'id1'], currentEvents())
+
+    def testEventsOfFailedBatchDiscarded(self):
+        batch = Batch()
+        batch.records = [Record('id0', 'data0'), Record('id1', 'data1')]
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        def uploadRecord(identifier, data):
+            if identifier == 'id1':
+                raise RuntimeError('help!')
+        self.observer.methods['uploadRecord'] = uploadRecord
+        self.assertRaises(RuntimeError, self.harvester.harvest)
+        self.harvester._events.flush()
+        self.assertEqual([], list(iterEvents(join(self.tempdir, 'current'))))
+
+    def testToBeDeletedAndRemainingAdds(self):
+        self._assertToBeDeletedAndRemainingAdds()
+
+    def testToBeDeletedAndRemainingAddsWithCompactEvents(self):
+        self._assertToBeDeletedAndRemainingAdds(compact=True, sortBufferSize=2)
+
+    def _assertToBeDeletedAndRemainingAdds(self, **kwargs):
+        events = _Events(self.tempdir, **kwargs)
+        events.markHarvestStart()
+        for i in [5, 3, 1, 4, 0, 2]:
+            events.markEvent(identifier='id%d' % i, uploadData='data%d' % i)
+        events.markEvent(identifier='id6', delete=True)
+        events.markHarvestReady()
+        events.markHarvestStart()
+        events.markEvent(identifier='id4', uploadData='data4')
+        events.markEvent(identifier='id1', delete=True)
+        events.markEvent(identifier='id7', uploadData='data7')
+        events.markEvent(identifier='id2', uploadData='data2')
+        self.assertEqual(['id0', 'id3', 'id5'], list(events.toBeDeleted()))
+        self.assertEqual(['id0', 'id2', 'id3', 'id4', 'id5', 'id7'], list(events.remainingAdds()))
+        events.close()
+        self.assertEqual(['current', 'previous'], sorted(listdir(self.tempdir)))
+
+    def testPromoteCurrentEventsWithoutReadingThem(self):
+        self._assertPromoteCurrentEventsWithoutReadingThem()
+
+    def testPromoteCurrentEventsWithoutReadingThemWithCompactEvents(self):
+        self._assertPromoteCurrentEventsWithoutReadingThem(compact=True, sortBufferSize=2)
+
+    def _assertPromoteCurrentEventsWithoutReadingThem(self, **kwargs):
+        events = _Events(self.tempdir, **kwargs)
+        originalIterEvents = harvesterModule.iterEvents
+        harvesterModule.iterEvents = None
+        try:
+            self._assertPromoteCurrentEvents(events)
+        finally:
+            harvesterModule.iterEvents = originalIterEvents
+
+    def _assertPromoteCurrentEvents(self, events):
+        events._readPrevious = events._readCurrent = lambda: _raise(AssertionError('indexes reread'))
+        previousPath = join(self.tempdir, 'previous')
+        events.markHarvestStart()
+        events.markEvent(identifier='id1', uploadData='data1')
+        events.markEvent(identifier='id0', uploadData='data0')
+        events.markHarvestReady()
+        self.assertTrue(isSortedEventLog(previousPath))
+        self.assertEqual(['id0', 'id1'], [event[0] for event in iterEvents(previousPath)])
+        events.markHarvestStart()
+        for i in [4, 2, 3]:
+            events.markEvent(identifier='id%d' % i, uploadData='data%d' % i)
+        events.flush()
+        self.assertTrue(events.alreadyAdded('id2', 'data2'))
+        self.assertTrue(events.alreadyAdded('id3', 'data3'))
+        events.markEvent(identifier='id0', delete=True)
+        events.markEvent(identifier='id2', uploadData='data2.1')
+        self.assertEqual(['id1'], list(events.toBeDeleted()))
+        self.assertTrue(events.alreadyAdded('id2', 'data2.1'))
+        events.markHarvestReady()
+        self.assertTrue(isSortedEventLog(previousPath))
+        self.assertEqual(['id0', 'id2', 'id3', 'id4'], [event[0] for event in iterEvents(previousPath)])
+        self.assertTrue(events.alreadyDeleted('id0'))
+        self.assertTrue(events.alreadyAdded('id2', 'data2.1'))
+        self.assertFalse(events.alreadyAdded('id1', 'data1'))
+        events.markHarvestStart()
+        events.markEvent(identifier='id5', uploadData='data5')
+        events.markEvent(identifier='id3', uploadData='data3.1')
+        events.markHarvestReady(merge=True)
+        self.assertEqual(['id0', 'id2', 'id3', 'id4', 'id5'], [event[0] for event in iterEvents(previousPath)])
+        self.assertTrue(events.alreadyAdded('id2', 'data2.1'))
+        self.assertTrue(events.alreadyAdded('id3', 'data3.1'))
+        self.assertTrue(events.alreadyAdded('id5', 'data5'))
+
+    def testCompactionKeepsLastEventPerIdentifier(self):
+        events = _Events(self.tempdir)
+        events.markHarvestStart()
+        for round in range(3):
+            for i in [2, 0, 1]:
+                events.markEvent(identifier='id%d' % i, uploadData='data%d.%d' % (i, round))
+            events.flush()
+        events.markEvent(identifier='id1', delete=True)
+        events.close()
+        self.assertEqual(10, len(list(iterEvents(join(self.tempdir, 'current')))))
+        events = _Events(self.tempdir)
+        events.markHarvestStart()
+        events.markHarvestReady()
+        self.assertFalse(isfile(join(self.tempdir, 'current')))
+        self.assertEqual(['id0', 'id1', 'id2'], [event[0] for event in iterEvents(join(self.tempdir, 'previous'))])
+        self.assertTrue(events.alreadyAdded('id2', 'data2.2'))
+        self.assertTrue(events.alreadyDeleted('id1'))
+        events.markHarvestStart()
+        events.markEvent(identifier='id3', uploadData='data3')
+        events.markHarvestReady(merge=True)
+        self.assertEqual(['id0', 'id1', 'id2', 'id3'], [event[0] for event in iterEvents(join(self.tempdir, 'previous'))])
+        self.assertTrue(events.alreadyAdded('id0', 'data0.2'))
+
+    def testTruncatedBlockOfCurrentEventsIgnored(self):
+        events = _Events(self.tempdir)
+        events.markHarvestStart()
+        events.markEvent(identifier='id0', uploadData='data0')
+        events.flush()
+        events.markEvent(identifier='id1', uploadData='data1')
+        events.close()
+        currentPath = join(self.tempdir, 'current')
+        with open(currentPath, 'r+b') as fp:
+            fp.truncate(getsize(currentPath) - 3)
+        self.assertEqual(['id0'], [event[0] for event in iterEvents(currentPath)])
+        events = _Events(self.tempdir)
+        events.markEvent(identifier='id2', uploadData='data2')
+        events.close()
+        self.assertEqual(['id0', 'id2'], [event[0] for event in iterEvents(currentPath)])
+
+    def testLegacyCurrentEventsUpgraded(self):
+        with open(join(self.tempdir, 'current'), 'w') as fp:
+            fp.write("id0\tA\t%s\n" % md5(b'data0').hexdigest())
+        events = _Events(self.tempdir)
+        events.markEvent(identifier='id1', uploadData='data1')
+        events.close()
+        self.assertEqual(['id0', 'id1'], [event[0] for event in iterEvents(join(self.tempdir, 'current'))])
+        self.assertTrue(events.alreadyAdded('id0', 'data0'))
+
+    def testInterruptedCompactionRecovered(self):
+        events = _Events(self.tempdir)
+        events.markHarvestStart()
+        events.markEvent(identifier='id0', uploadData='data0')
+        events.markHarvestReady()
+        rename(join(self.tempdir, 'previous'), join(self.tempdir, 'previous.compacted'))
+        events = _Events(self.tempdir)
+        self.assertTrue(events.alreadyAdded('id0', 'data0'))
+        self.assertFalse(isfile(join(self.tempdir, 'previous.compacted')))
+
+    def testPrefetchNextBatchWhileProcessing(self):
+        self._prepareHarvester(prefetch=True)
+        secondBatchRequested = Event()
+        def downloadBatch(resumptionAttributes):
+            batch = Batch()
+            if not resumptionAttributes:
+                batch.records = [Record('id0', 'data0')]
+                batch.resumptionAttributes = lambda: {'repositoriesRemaining': ['repo'], 'resumptionToken': 'token1'}
+            else:
+                self.assertEqual({'repositoriesRemaining': ['repo'], 'resumptionToken': 'token1'}, resumptionAttributes)
+                resumptionAttributes['repositoriesRemaining'].pop(0)
+                secondBatchRequested.set()
+                batch.records = [Record('id1', 'data1')]
+                batch.harvestingReady = True
+            return batch
+        self.observer.methods['downloadBatch'] = downloadBatch
+        convertedWhileDownloading = []
+        def convert(record):
+            convertedWhileDownloading.append(secondBatchRequested.wait(timeout=5))
+            return 'converted.' + record.data
+        self.observer.methods['convert'] = convert
+        self.harvester.harvest()
+        self.assertEqual([True, True], convertedWhileDownloading)
+        self.assertEqual(['id0', 'id1'], [m.kwargs['identifier'] for m in self.observer.calledMethods if m.name == 'uploadRecord'])
+        self.assertEqual(2, len([m for m in self.observer.calledMethods if m.name == 'downloadBatch']))
+
+    def testPrefetchedBatchDiscardedOnError(self):
+        self._prepareHarvester(prefetch=True)
+        downloads = []
+        def downloadBatch(resumptionAttributes):
+            downloads.append(resumptionAttributes)
+            batch = Batch()
+            batch.records = [Record('id%d' % len(downloads), 'data')]
+            batch.resumptionAttributes = lambda: {'resumptionToken': 'token%d' % len(downloads)}
+            return batch
+        self.observer.methods['downloadBatch'] = downloadBatch
+        def uploadRecordRaises(identifier, data):
+            raise RuntimeError('help!')
+        self.observer.methods['uploadRecord'] = uploadRecordRaises
+        self.assertRaises(RuntimeError, self.harvester.harvest)
+        self.assertEqual({}, downloads[0])
+        self.assertTrue(downloads[1:] in [[], [{'resumptionToken': 'token1'}]], downloads)
+        self.assertEqual({
+            'harvestingReady': False,
+            'datetime': '1976-11-08T12:34:56Z',
+            'resumptionAttributes': None,
+            'error': True,
+            'failures': 1,
+            'nextAttempt': '1976-11-08T12:34:57Z'}, self._state())
+
+    def testParallelConvertKeepsOrder(self):
+        self._prepareHarvester(convertWorkers=4)
+        batch = Batch()
+        batch.records = [Record('id%d' % i, 'data%d' % i) for i in range(10)] + [Record('id4', delete=True)]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        def convert(record):
+            sleep(0.001 * (10 - int(record.identifier[2:])))
+            if record.identifier == 'id3':
+                raise SkipRecordException()
+            return 'converted.' + record.data
+        self.observer.methods['convert'] = convert
+        self.harvester.harvest()
+        uploads = [m.kwargs for m in self.observer.calledMethods if m.name == 'uploadRecord']
+        self.assertEqual([{'identifier': 'id%d' % i, 'data': 'converted.data%d' % i} for i in range(10) if i != 3], uploads)
+        self.assertEqual('deleteRecord', self.observer.calledMethods[-4].name)
+        self.assertTrue("Skipping record 'id3'\n9 added, 1 deleted, 0 unchanged, 1 skipped." in self.log.getvalue(), self.log.getvalue())
+        self.assertEqual(None, self.harvester._convertStage._executor)
+
+    def testParallelConvertErrorSavedAtRecordPosition(self):
+        self._prepareHarvester(convertWorkers=2)
+        batch = Batch()
+        batch.records = [Record('id%d' % i, 'data%d' % i) for i in range(10)]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        def convert(record):
+            if record.identifier == 'id2':
+                raise RuntimeError('help!')
+            return 'converted.' + record.data
+        self.observer.methods['convert'] = convert
+        self.assertRaises(RuntimeError, self.harvester.harvest)
+        self.assertEqual(['id0', 'id1'], [m.kwargs['identifier'] for m in self.observer.calledMethods if m.name == 'uploadRecord'])
+        self.assertEqual(True, self._state()['error'])
+        self.assertTrue('help!' in self._lastError())
+        self.assertEqual(None, self.harvester._convertStage._executor)
+
+    def testProcessConvert(self):
+        self._prepareHarvester(convertWorkers=2, processConvert=processConvert)
+        batch = Batch()
+        batch.records = [Record('id%d' % i, 'data%d' % i) for i in range(5)]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch'] + ['uploadRecord'] * 4 + ['flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual(['converted.id0: data0', 'converted.id1: data1', 'converted.id3: data3', 'converted.id4: data4'], [m.kwargs['data'] for m in self.observer.calledMethods if m.name == 'uploadRecord'])
+        self.assertTrue("4 added, 0 deleted, 0 unchanged, 1 skipped." in self.log.getvalue(), self.log.getvalue())
+        self.assertEqual(None, self.harvester._convertStage._executor)
+
+    def testBatchUpload(self):
+        self.harvester._events.markHarvestStart()
+        self.harvester._events.markEvent(identifier='id0', uploadData='converted.data0')
+        self.harvester._events.markEvent(identifier='id9', uploadData='converted.data9')
+        self.harvester._events.markHarvestReady()
+        self._prepareHarvester(batchUpload=True)
+        batch = Batch()
+        batch.records = [Record('id0', 'data0'), Record('id1', 'data1'), Record('id0', delete=True)]
+        batch.harvestingReady = True
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batch
+        self.observer.methods['convert'] =lambda record: 'converted.' + record.data
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch', 'convert', 'convert', 'uploadBatch', 'flushUploads', 'batchDone', 'uploadBatch', 'flushUploads', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual({'operations': [
+                {'action': 'add', 'identifier': 'id1', 'data': 'converted.data1'},
+                {'action': 'delete', 'identifier': 'id0'},
+            ]}, self.observer.calledMethods[3].kwargs)
+        self.assertEqual({'operations': [{'action': 'delete', 'identifier': 'id9'}]}, self.observer.calledMethods[6].kwargs)
+        self.assertEqual(['id1'], list(self.harvester._events.remainingAdds()))
+
+    def testBatchUploadFallsBackToSingleRecordMessages(self):
+        observer = SingleRecordObserver()
+        harvester = Harvester(join(self.tempdir, 'fallback'), log=self.log, batchUpload=True)
+        harvester.addObserver(observer)
+        harvester.harvest()
+        self.assertEqual([('uploadRecord', 'id0'), ('deleteRecord', 'id1')], observer.calls)
+        self.assertEqual(False, harvester._batchUpload)
+
+    def testStreamingBatchIsNotPrefetched(self):
+        self._prepareHarvester(prefetch=True)
+        def records(batch):
+            yield Record('id0', 'data0')
+            batch.harvestingReady = True
+            batch.resumptionAttributes = lambda: {'token': 'final'}
+        batch = Batch()
+        batch.streaming = True
+        batch.records = records(batch)
+        self.observer.returnValues['downloadBatch'] = batch
+        self.harvester.harvest()
+        self.assertEqual(['downloadBatch', 'convert', 'uploadRecord', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertEqual({'token': 'final'}, self._state()['resumptionAttributes'])
+        self.assertEqual(True, self._state()['harvestingReady'])
+
     def testQuitForSleep(self):
         batch = Batch()
         batch.harvestingReady = False
         batch.quitForSleep = True
         self.observer.returnValues['downloadBatch'] = batch
         self.harvester.harvest()
-        self.assertEqual(['downloadBatch', 'batchDone'], self.observer.calledMethodNames())
+        self.assertEqual(['downloadBatch', 'flushUploads', 'batchDone', 'closeUploads'], self.observer.calledMethodNames())
         # Note: previous line implicitly asserts that deleteRecord was not invoked, as _deleteOldRecords should not be executed when only quiting for sleep.
         self.assertEqual('Harvesting.\n0 added, 0 deleted, 0 unchanged, 0 skipped.\n-\nQuiting for sleep.\n', self.log.getvalue())
 
+    def testCheckpointEveryNBatches(self):
+        self._prepareHarvester(checkpointBatches=2)
+        checkpoints = []
+        def downloadBatch(resumptionAttributes):
+            checkpoints.append(self._state()['resumptionAttributes'] if isfile(join(self.tempdir, 'state')) else None)
+            batch = Batch()
+            batch.records = [Record('id%d' % len(checkpoints), 'data')]
+            batch.harvestingReady = len(checkpoints) == 5
+            batch.resumptionAttributes = lambda: {'token': len(checkpoints)}
+            return batch
+        self.observer.methods['downloadBatch'] = downloadBatch
+        self.harvester.harvest()
+        self.assertEqual([None, None, {'token': 2}, {'token': 2}, {'token': 4}], checkpoints)
+        self.assertEqual({'token': 5}, self._state()['resumptionAttributes'])
+        self.assertFalse(isfile(join(self.tempdir, 'state.tmp')))
+
+    def testCheckpointInterval(self):
+        self._prepareHarvester(checkpointBatches=None, checkpointInterval=60)
+        now = [ZuluTime("1976-11-08T12:34:56Z").epoch]
+        self.harvester._state.now = lambda: ZuluTime(now[0])
+        checkpoints = []
+        def downloadBatch(resumptionAttributes):
+            checkpoints.append(self._state()['resumptionAttributes'] if isfile(join(self.tempdir, 'state')) else None)
+            now[0] += 25
+            batch = Batch()
+            batch.resumptionAttributes = lambda: {'token': len(checkpoints)}
+            batch.quitForSleep = len(checkpoints) == 6
+            return batch
+        self.observer.methods['downloadBatch'] = downloadBatch
+        self.harvester.harvest()
+        self.assertEqual([None, None, None, {'token': 3}, {'token': 3}, {'token': 3}], checkpoints)
+        self.assertEqual({'token': 6}, self._state()['resumptionAttributes'])
+
+    def testErrorClearedOnlyWithSavedState(self):
+        self.observer.methods['downloadBatch'] = lambda **kwargs: _raise(IOError('help!'))
+        self.assertRaises(IOError, self.harvester.harvest)
+        self._prepareHarvester(checkpointBatches=3)
+        self.harvester._state.now = lambda: ZuluTime("1976-11-08T12:35:56Z")
+        checkpoints = []
+        def downloadBatch(resumptionAttributes):
+            checkpoints.append((self._state()['error'], isfile(join(self.tempdir, 'last_error'))))
+            if len(checkpoints) == 3:
+                raise KeyboardInterrupt()
+            batch = Batch()
+            batch.resumptionAttributes = lambda: {'token': len(checkpoints)}
+            return batch
+        self.observer.methods['downloadBatch'] = downloadBatch
+        self.assertRaises(KeyboardInterrupt, self.harvester.harvest)
+        self.assertEqual([(True, True), (False, False), (False, False)], checkpoints)
+
+    def testMissingLastErrorTolerated(self):
+        self.harvester._state.error = True
+        self.harvester._state.failures = 1
+        self.harvester._state.nextAttempt = '1976-11-08T12:35:56Z'
+        self.harvester._state.save()
+        self._prepareHarvester()
+        self.harvester.harvest()
+        self.assertTrue('Harvesting in error state since 1976-11-08T12:34:56Z: unknown error.\n' in self.log.getvalue(), self.log.getvalue())
+
+    def testMetrics(self):
+        self._prepareHarvester(metricsInterval=0, name='repo')
+        batches = []
+        batch = Batch()
+        batch.records = [Record('id0', 'data0'), Record('id1', 'data1')]
+        batches.append(batch)
+        batch = Batch()
+        batch.records = [Record('id2', 'dátä2'), Record('id3', delete=True)]
+        batch.harvestingReady = True
+        batches.append(batch)
+        self.observer.methods['downloadBatch'] = lambda **kwargs: batches.pop(0)
+        self.observer.methods['convert'] = lambda record: record.data
+        self.harvester.harvest()
+        metrics = [m.kwargs['metrics'] for m in self.observer.calledMethods if m.name == 'harvestMetrics']
+        self.assertEqual([(2, 10), (2, 7)], [(m['batch']['records'], m['batch']['convertedBytes']) for m in metrics])
+        self.assertEqual((4, 17), (metrics[-1]['harvest']['records'], metrics[-1]['harvest']['convertedBytes']))
+        self.assertEqual(['batchDone', 'convert', 'download', 'hash', 'stateSave', 'upload'], sorted(metrics[-1]['harvest']['phases']))
+        self.assertTrue(metrics[-1]['harvest']['phases']['hash'] > 0)
+        self.assertTrue(metrics[-1]['harvest']['seconds'] >= metrics[-1]['batch']['seconds'] > 0)
+        with open(join(self.tempdir, 'metrics.json')) as fp:
+            written = jsonLoad(fp)
+        self.assertEqual(('repo', 4), (written['name'], written['harvest']['records']))
+        with open(join(self.tempdir, 'metrics.prom')) as fp:
+            prometheus = fp.read()
+        self.assertTrue('\nmeresco_fetch_records_total{name="repo"} 4\n' in prometheus, prometheus)
+        self.assertTrue('\nmeresco_fetch_phase_seconds_total{name="repo",phase="convert"} ' in prometheus, prometheus)
+
+    def testNoMetricsByDefault(self):
+        batch = Batch()
+        batch.records = [Record('id0', 'data0')]
+        batch.harvestingReady = True
+        self.observer.returnValues['downloadBatch'] = batch
+        self.harvester.harvest()
+        self.assertFalse('harvestMetrics' in self.observer.calledMethodNames())
+        self.assertFalse(isfile(join(self.tempdir, 'metrics.json')))
+
+    def testRestartAfterCrashDoesNotUploadCheckpointlessBatchesAgain(self):
+        self._assertRestartAfterCrashDoesNotUploadAgain()
+
+    def testRestartAfterCrashDoesNotUploadAgainWithCompactEvents(self):
+        self._assertRestartAfterCrashDoesNotUploadAgain(compactEvents=True)
+
+    def testRestartAfterCrashDoesNotUploadAgainWithSqliteEvents(self):
+        self._assertRestartAfterCrashDoesNotUploadAgain(eventStore='sqlite')
+
+    def _assertRestartAfterCrashDoesNotUploadAgain(self, **kwargs):
+        self._prepareHarvester(checkpointBatches=10, **kwargs)
+        def downloadBatch(resumptionAttributes):
+            if resumptionAttributes:
+                raise KeyboardInterrupt()
+            batch = Batch()
+            batch.records = [Record('id0', 'data0'), Record('id1', 'data1'), Record('id2', delete=True)]
+            batch.resumptionAttributes = lambda: {'token': 'next'}
+            return batch
+        self.observer.methods['downloadBatch'] = downloadBatch
+        self.assertRaises(KeyboardInterrupt, self.harvester.harvest)
+        self.assertFalse(isfile(join(self.tempdir, 'state')))
+        self.assertEqual(['uploadRecord', 'uploadRecord', 'deleteRecord'], [m for m in self.observer.calledMethodNames() if m in ['uploadRecord', 'deleteRecord']])
+
+        self.harvester._events.close()
+        self.observer.calledMethods.reset()
+        self._prepareHarvester(checkpointBatches=10, **kwargs)
+        self.assertRaises(KeyboardInterrupt, self.harvester.harvest)
+        self.assertEqual(['downloadBatch', 'convert', 'convert', 'flushUploads', 'batchDone', 'downloadBatch', 'closeUploads'], self.observer.calledMethodNames())
+        self.assertTrue('0 added, 0 deleted, 3 unchanged, 0 skipped.' in self.log.getvalue())
+        self.harvester._events.close()
+
+
+class SingleRecordObserver(object):
+    def __init__(self):
+        self.calls = []
+
+    def downloadBatch(self, resumptionAttributes):
+        batch = Batch()
+        batch.records = [Record('id0', 'data0'), Record('id1', delete=True)]
+        batch.harvestingReady = True
+        return batch
+
+    def convert(self, record):
+        return record.data
+
+    def uploadRecord(self, identifier, data):
+        self.calls.append(('uploadRecord', identifier))
+
+    def deleteRecord(self, identifier):
+        self.calls.append(('deleteRecord', identifier))
+
+
+def processConvert(identifier, data):
+    if identifier == 'id2':
+        raise SkipRecordException()
+    return 'converted.' + data
+
 
 class Batch(BatchProtocol):
     def __init__(self):
@@ -274,10 +935,14 @@ class Batch(BatchProtocol):
         return {}
 
 class Record(RecordProtocol):
-    def __init__(self, identifier, data=None, delete=False):
+    def __init__(self, identifier, data=None, delete=False, fingerprint=None):
         self.identifier = identifier
         self.data = data
         self.delete = delete
+        self.fingerprint = fingerprint
+
+    def sourceFingerprint(self):
+        return self.fingerprint
 
     def mustAdd(self):
         return not self.delete
@@ -290,3 +955,7 @@ class Record(RecordProtocol):
 
     def __repr__(self):
         return "%s(%s, %s)" % (self.__class__.__name__, repr(self.identifier), repr(self.data))
+
+
+def _raise(exception):
+    raise exception
@@ -29,8 +29,18 @@
 
 from seecr.test import SeecrTestCase, CallTrace
 
-from meresco.fetch.oaipmhdownload import OaiPmhDownload
-from io import StringIO
+from meresco.fetch import Harvester
+from meresco.fetch.oaipmhdownload import OaiPmhDownload, AsyncOaiPmhDownload
+from meresco.fetch import _oaistream
+from meresco.fetch._oaistream import StreamingListRequest, CachedListRequest, StreamingOaiBatch
+from os import listdir
+from os.path import join
+from io import StringIO, BytesIO
+import asyncio
+from threading import Event
+from re import search
+
+from seecr.zulutime import ZuluTime
 
 class OaiPmhDownloadTest(SeecrTestCase):
     def setUp(self):
@@ -88,4 +98,316 @@ class OaiPmhDownloadTest(SeecrTestCase):
         self.assertEqual({'repositoriesRemaining': [], 'resumptionToken': None}, batch.resumptionAttributes())
         self.assertEqual('prefix', batch.metadataPrefix)
 
+    def testRecordReadsContextFromBatch(self):
+        repo1 = {
+                'baseurl': 'http://example.org/oai',
+                'metadataPrefix': 'prefix',
+                'setSpec': 'set',
+                'repositoryGroupId': 'group',
+                'repositoryId': 'repo',
+        }
+        batch = self.prepareDownload(repositories=[repo1]).downloadBatch({})
+        record = batch.records[0]
+        self.assertEqual(('group', 'repo', 'set', 'prefix', 'http://base.example.org', 'identifier', 'group:identifier'),
+            (record.repositoryGroupId, record.repositoryId, record.setSpec, record.metadataPrefix, record.baseurl, record.recordIdentifier, record.identifier))
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertFalse(hasattr(batch, '__dict__'))
+
+
+    def testDatestampFingerprint(self):
+        repo1 = {
+                'baseurl': 'http://example.org/oai',
+                'metadataPrefix': 'prefix',
+                'repositoryGroupId': 'group'
+        }
+        self.record.datestamp = '2020-01-01T00:00:00Z'
+        batch = self.prepareDownload(repositories=[repo1]).downloadBatch({})
+        self.assertEqual([None], [r.sourceFingerprint() for r in batch.records])
+        batch = self.prepareDownload(repositories=[repo1], datestampFingerprint=True).downloadBatch({})
+        self.assertEqual(['http://base.example.org prefix 2020-01-01T00:00:00Z'], [r.sourceFingerprint() for r in batch.records])
+
+    def testAsyncDownload(self):
+        repo1 = {
+                'baseurl': 'http://example.org/oai',
+                'metadataPrefix': 'prefix',
+                'repositoryGroupId': 'group'
+        }
+        dl = AsyncOaiPmhDownload(repositories=[repo1], log=self.log)
+        dl._OaiListRequest = self.oaiListRequest.create
+        batch = asyncio.run(dl.downloadBatch({}))
+        self.assertEqual({'repositoriesRemaining': [repo1], 'resumptionToken': 'continueHere'}, batch.resumptionAttributes())
+        self.assertEqual(["group:identifier"], [r.identifier for r in batch.records])
+
+    def testConcurrentRepositories(self):
+        slowStarted = Event()
+        releaseSlow = Event()
+        requests = []
+        def oaiListRequest(baseurl, resumptionToken=None, metadataPrefix=None, set=None):
+            requests.append((baseurl, resumptionToken))
+            request = CallTrace(returnValues={'buildUrl': baseurl})
+            oaiBatch = CallTrace()
+            oaiBatch.request = oaiBatch
+            oaiBatch.baseurl = baseurl
+            oaiBatch.resumptionToken = None if resumptionToken else 'next'
+            record = CallTrace()
+            record.identifier = '%s-%s' % (baseurl, resumptionToken or 'first')
+            oaiBatch.items = [record]
+            def retrieveBatch():
+                if baseurl == 'slow':
+                    slowStarted.set()
+                    releaseSlow.wait(5)
+                return oaiBatch
+            request.methods['retrieveBatch'] = retrieveBatch
+            return request
+        repositories = [dict(baseurl=baseurl, metadataPrefix='prefix', repositoryGroupId='group') for baseurl in ['slow', 'fast', 'other']]
+        dl = self.prepareDownload(repositories=repositories, concurrentRepositories=2)
+        dl._OaiListRequest = oaiListRequest
+
+        batch = dl.downloadBatch({})
+        self.assertTrue(slowStarted.wait(5))
+        self.assertEqual(['group:fast-first'], [r.identifier for r in batch.records])
+        self.assertEqual(['slow', 'fast', 'other'], [s['repository']['baseurl'] for s in batch.resumptionAttributes()['repositoryStates']])
+        self.assertEqual([None, 'next', None], [s['resumptionToken'] for s in batch.resumptionAttributes()['repositoryStates']])
+
+        resumptionAttributes = batch.resumptionAttributes()
+        batch = dl.downloadBatch(resumptionAttributes)
+        self.assertEqual(['group:fast-next'], [r.identifier for r in batch.records])
+        self.assertEqual([('slow', None), ('fast', None), ('fast', 'next')], requests)
+        self.assertFalse(batch.harvestingReady)
+
+        self.assertEqual([('slow', None), ('other', None)], [(s['repository']['baseurl'], s['resumptionToken']) for s in batch.resumptionAttributes()['repositoryStates']])
+
+        restarted = self.prepareDownload(repositories=repositories, concurrentRepositories=2)
+        restarted._OaiListRequest = oaiListRequest
+        releaseSlow.set()
+        identifiers = []
+        while not batch.harvestingReady:
+            batch = restarted.downloadBatch(batch.resumptionAttributes())
+            identifiers.extend(r.identifier for r in batch.records)
+        self.assertEqual(['group:other-first', 'group:other-next', 'group:slow-first', 'group:slow-next'], sorted(identifiers))
+        self.assertEqual({'repositoryStates': []}, batch.resumptionAttributes())
+        self.assertEqual(None, restarted._executor)
+        dl.close()
+        self.assertEqual({}, dl._inFlight)
+
+    def testConcurrentDownloadErrorShutsDownExecutor(self):
+        def oaiListRequest(baseurl, resumptionToken=None, metadataPrefix=None, set=None):
+            request = CallTrace(returnValues={'buildUrl': baseurl})
+            def retrieveBatch():
+                raise IOError('help!')
+            request.methods['retrieveBatch'] = retrieveBatch
+            return request
+        repositories = [dict(baseurl=baseurl, metadataPrefix='prefix', repositoryGroupId='group') for baseurl in ['one', 'two']]
+        dl = self.prepareDownload(repositories=repositories, concurrentRepositories=2)
+        dl._OaiListRequest = oaiListRequest
+        self.assertRaises(IOError, dl.downloadBatch, {})
+        self.assertEqual(None, dl._executor)
+        self.assertEqual({}, dl._inFlight)
+
+    def testIncrementalHarvest(self):
+        requests = []
+        def oaiListRequest(**kwargs):
+            requests.append(kwargs)
+            request = CallTrace(returnValues={'buildUrl': kwargs['baseurl']})
+            oaiBatch = CallTrace()
+            oaiBatch.request = oaiBatch
+            oaiBatch.baseurl = kwargs['baseurl']
+            oaiBatch.resumptionToken = None
+            oaiBatch.responseDate = '2026-10-%02dT10:00:00Z' % len(requests)
+            oaiBatch.items = []
+            request.returnValues['retrieveBatch'] = oaiBatch
+            return request
+        repositories = [
+            dict(baseurl='http://one.example.org', metadataPrefix='prefix', deletedRecord='persistent'),
+            dict(baseurl='http://two.example.org', metadataPrefix='prefix', deletedRecord='persistent', granularity='YYYY-MM-DD'),
+        ]
+        now = ['2026-10-01T00:00:00Z']
+        def harvest():
+            dl = self.prepareDownload(repositories=repositories, incremental=True, fullHarvestInterval=10*24*60*60)
+            dl._OaiListRequest = oaiListRequest
+            dl._now = lambda: ZuluTime(now[0])
+            del requests[:]
+            batches = [dl.downloadBatch(nextHarvest)]
+            while not batches[-1].harvestingReady:
+                batches.append(dl.downloadBatch(batches[-1].resumptionAttributes()))
+            return batches
+
+        nextHarvest = {}
+        batches = harvest()
+        self.assertEqual([False, False], [b.incremental for b in batches])
+        self.assertEqual([None, None], [r.get('from_') for r in requests])
+        nextHarvest = {'nextHarvest': batches[-1].resumptionAttributes()['nextHarvest']}
+        self.assertEqual({'nextHarvest': {
+                'responseDates': {'http://one.example.org|prefix|': '2026-10-01T10:00:00Z', 'http://two.example.org|prefix|': '2026-10-02T10:00:00Z'},
+                'fullHarvestStarted': '2026-10-01T00:00:00Z'}}, nextHarvest)
+
+        now[0] = '2026-10-05T00:00:00Z'
+        batches = harvest()
+        self.assertEqual([True, True], [b.incremental for b in batches])
+        self.assertEqual(['2026-10-01T10:00:00Z', '2026-10-02'], [r.get('from_') for r in requests])
+        self.assertEqual('2026-10-01T00:00:00Z', batches[-1].resumptionAttributes()['nextHarvest']['fullHarvestStarted'])
+
+        now[0] = '2026-10-12T00:00:00Z'
+        batches = harvest()
+        self.assertEqual([False, False], [b.incremental for b in batches])
+        self.assertEqual([None, None], [r.get('from_') for r in requests])
+        self.assertTrue('Starting full harvest.\n' in self.log.getvalue())
+
+    def testIncrementalHarvestRequiresPersistentDeletes(self):
+        identified = []
+        def identify(baseurl):
+            identified.append(baseurl)
+            return dict(deletedRecord='transient', granularity='YYYY-MM-DDThh:mm:ssZ')
+        repo1 = dict(baseurl='http://example.org/oai', metadataPrefix='prefix')
+        dl = self.prepareDownload(repositories=[repo1], incremental=True)
+        dl._identify = identify
+        nextHarvest = {'responseDates': {'http://example.org/oai|prefix|': '2026-10-01T10:00:00Z'}, 'fullHarvestStarted': ZuluTime().zulu()}
+        batch = dl.downloadBatch({'nextHarvest': nextHarvest})
+        self.assertFalse(batch.incremental)
+        self.assertEqual(['http://example.org/oai'], identified)
+        self.assertEqual({'baseurl': 'http://example.org/oai', 'metadataPrefix': 'prefix', 'set': None}, self.oaiListRequest.calledMethods[0].kwargs)
+
+    def testStreamingBatch(self):
+        responses = [LIST_RECORDS % dict(records=RECORD % dict(identifier='id0', status='') + RECORD % dict(identifier='id1', status=' status="deleted"'), resumptionToken='<resumptionToken>token1</resumptionToken>')]
+        responses.append(LIST_RECORDS % dict(records=RECORD % dict(identifier='id2', status=''), resumptionToken='<resumptionToken/>'))
+        requests = []
+        def oaiListRequest(**kwargs):
+            request = StreamingListRequest(**kwargs)
+            requests.append(request.buildUrl())
+            return CallTrace(returnValues={'buildUrl': request.buildUrl(), 'retrieveBatch': StreamingOaiBatch(request, lambda: BytesIO(responses.pop(0).encode()))})
+        repo1 = dict(baseurl='http://example.org/oai', metadataPrefix='prefix', repositoryGroupId='group', setSpec='set')
+        dl = self.prepareDownload(repositories=[repo1], streaming=True)
+        dl._OaiListRequest = oaiListRequest
+
+        batch = dl.downloadBatch({})
+        self.assertTrue(batch.streaming)
+        self.assertFalse('nrOfResults' in self.log.getvalue())
+        records = iter(batch.records)
+        record = next(records)
+        self.assertEqual('group:id0', record.identifier)
+        self.assertTrue(record.mustAdd())
+        self.assertEqual('data', record.item.metadata.text)
+        self.assertEqual('2026-10-18T00:00:00Z', record.item.datestamp)
+        record = next(records)
+        self.assertTrue(record.mustDelete())
+        self.assertEqual([], list(records))
+        self.assertTrue('nrOfResults: 2, next resumptionToken: token1\n' in self.log.getvalue())
+        self.assertEqual({'repositoriesRemaining': [repo1], 'resumptionToken': 'token1'}, batch.resumptionAttributes())
+        self.assertFalse(batch.harvestingReady)
+
+        batch = dl.downloadBatch(batch.resumptionAttributes())
+        self.assertEqual(['group:id2'], [r.identifier for r in batch.records])
+        self.assertTrue(batch.harvestingReady)
+        self.assertEqual(['http://example.org/oai?verb=ListRecords&metadataPrefix=prefix&set=set', 'http://example.org/oai?verb=ListRecords&resumptionToken=token1'], requests)
+
+    def testProcessConvertOfStreamedRecords(self):
+        responses = [LIST_RECORDS % dict(records=RECORD % dict(identifier='id0', status='') + RECORD % dict(identifier='id1', status=''), resumptionToken='<resumptionToken/>')]
+        def oaiListRequest(**kwargs):
+            request = StreamingListRequest(**kwargs)
+            return CallTrace(returnValues={'buildUrl': request.buildUrl(), 'retrieveBatch': StreamingOaiBatch(request, lambda: BytesIO(responses.pop(0).encode()))})
+        dl = self.prepareDownload(repositories=[dict(baseurl='http://example.org/oai', metadataPrefix='prefix', repositoryGroupId='group')], streaming=True)
+        dl._OaiListRequest = oaiListRequest
+        uploads = []
+        class Uploader(object):
+            def uploadRecord(self, identifier, data):
+                uploads.append((identifier, data))
+        harvester = Harvester(join(self.tempdir, 'state'), processConvert=processConvert)
+        harvester.addObserver(dl)
+        harvester.addObserver(Uploader())
+        harvester.harvest()
+        self.assertEqual([('group:id0', 'group:id0 data'), ('group:id1', 'group:id1 data')], uploads)
+        self.assertEqual(None, harvester._convertStage._executor)
+
+    def testHeaderAllowedFilter(self):
+        repo1 = dict(baseurl='http://example.org/oai', metadataPrefix='prefix', repositoryGroupId='group')
+        other = CallTrace()
+        other.identifier = 'other:identifier'
+        self.oaiBatch.items = [self.record, other]
+        self.record.identifier = 'keep:identifier'
+        headers = []
+        def headerAllowedFilter(header):
+            headers.append(header.identifier)
+            return header.identifier.startswith('keep:')
+        dl = self.prepareDownload(repositories=[repo1], headerAllowedFilter=headerAllowedFilter, recordAllowedFilter=lambda record: False)
+        batch = dl.downloadBatch({})
+        self.assertEqual([], batch.records)
+        self.assertEqual(['keep:identifier', 'other:identifier'], headers)
+        self.assertEqual((1, 1), (batch.droppedByHeaderFilter, batch.droppedByRecordFilter))
+        self.assertTrue('dropped: 1 by header filter, 1 by record filter\n' in self.log.getvalue())
+
+    def testStreamingHeaderAllowedFilter(self):
+        records = ''.join(RECORD % dict(identifier=identifier, status='') for identifier in ['keep:0', 'drop:1', 'keep:2', 'drop:3'])
+        oaiBatch = StreamingOaiBatch(StreamingListRequest(baseurl='http://example.org/oai', metadataPrefix='prefix'), lambda: BytesIO((LIST_RECORDS % dict(records=records, resumptionToken='')).encode()))
+        repo1 = dict(baseurl='http://example.org/oai', metadataPrefix='prefix', repositoryGroupId='group')
+        dl = self.prepareDownload(repositories=[repo1], streaming=True, headerAllowedFilter=lambda header: header.identifier.startswith('keep:') and header.setSpecs == ['set'])
+        dl._OaiListRequest = lambda **kwargs: CallTrace(returnValues={'buildUrl': 'url', 'retrieveBatch': oaiBatch})
+        batch = dl.downloadBatch({})
+        self.assertEqual(['group:keep:0', 'group:keep:2'], [r.identifier for r in batch.records])
+        self.assertEqual((4, 2), (oaiBatch.nrOfItems, oaiBatch.nrOfDroppedItems))
+        self.assertEqual(2, batch.droppedByHeaderFilter)
+        self.assertTrue('nrOfResults: 4, next resumptionToken: None\ndropped: 2 by header filter, 0 by record filter\n' in self.log.getvalue(), self.log.getvalue())
+
+    def testCacheAndReplayBatches(self):
+        responses = {
+            'http://example.org/oai?verb=ListRecords&metadataPrefix=prefix': LIST_RECORDS % dict(records=RECORD % dict(identifier='id0', status=''), resumptionToken='<resumptionToken>token1</resumptionToken>'),
+            'http://example.org/oai?verb=ListRecords&resumptionToken=token1': LIST_RECORDS % dict(records=RECORD % dict(identifier='id1', status=' status="deleted"'), resumptionToken=''),
+        }
+        requested = []
+        def urlopen(url, timeout):
+            requested.append(url)
+            return BytesIO(responses[url].encode())
+        repo1 = dict(baseurl='http://example.org/oai', metadataPrefix='prefix', repositoryGroupId='group')
+        cacheDir = join(self.tempdir, 'cache')
+        def harvest(**kwargs):
+            dl = OaiPmhDownload(repositories=[repo1], log=self.log, cacheDir=cacheDir, **kwargs)
+            batch = dl.downloadBatch({})
+            records = [(r.identifier, r.mustDelete()) for r in batch.records]
+            batch = dl.downloadBatch(batch.resumptionAttributes())
+            return records + [(r.identifier, r.mustDelete()) for r in batch.records], batch.harvestingReady
+        originalUrlopen = _oaistream.urlopen
+        _oaistream.urlopen = urlopen
+        try:
+            expected = ([('group:id0', False), ('group:id1', True)], True)
+            self.assertEqual(expected, harvest())
+            self.assertEqual(2, len(requested))
+            self.assertEqual(2, len(listdir(cacheDir)))
+            self.assertEqual(expected, harvest(replay=True))
+            self.assertEqual(expected, harvest(replay=True, streaming=True))
+            self.assertEqual(2, len(requested))
+        finally:
+            _oaistream.urlopen = originalUrlopen
+        self.assertRaises(AssertionError, OaiPmhDownload, repositories=[repo1], log=self.log, replay=True)
+
+    def testIncrementalListingCachedApartFromFullListing(self):
+        full = StreamingListRequest(baseurl='http://example.org/oai', metadataPrefix='prefix')
+        incremental = StreamingListRequest(baseurl='http://example.org/oai', metadataPrefix='prefix', from_='2026-10-18T00:00:00Z')
+        self.assertNotEqual(full.cacheKey(), incremental.cacheKey())
+        self.assertEqual(full.cacheKey(), CachedListRequest(baseurl='http://example.org/oai', metadataPrefix='prefix').cacheKey())
+        self.assertRaises(ValueError, CachedListRequest, baseurl='http://example.org/oai', metadataPrefix='prefix', from_='2026-10-18T00:00:00Z')
+
+    def testStreamingBatchOaiError(self):
+        batch = StreamingOaiBatch(StreamingListRequest(baseurl='http://example.org/oai', metadataPrefix='prefix'), lambda: BytesIO(OAI_ERROR % b'noRecordsMatch'))
+        self.assertEqual([], list(batch.items))
+        batch = StreamingOaiBatch(StreamingListRequest(baseurl='http://example.org/oai', metadataPrefix='prefix'), lambda: BytesIO(OAI_ERROR % b'badArgument'))
+        self.assertRaises(ValueError, list, batch.items)
+
+
+def processConvert(identifier, data):
+    return "%s %s" % (identifier, search(r'<data[^>]*>(.*?)</data>', data).group(1))
+
+
+LIST_RECORDS = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+    <responseDate>2026-10-18T10:00:00Z</responseDate>
+    <request verb="ListRecords">http://example.org/oai</request>
+    <ListRecords>%(records)s%(resumptionToken)s</ListRecords>
+</OAI-PMH>"""
+
+RECORD = """<record><header%(status)s><identifier>%(identifier)s</identifier><datestamp>2026-10-18T00:00:00Z</datestamp><setSpec>set</setSpec></header><metadata><data xmlns="urn:data">data</data></metadata></record>"""
 
+OAI_ERROR = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+    <responseDate>2026-10-18T10:00:00Z</responseDate>
+    <request verb="ListRecords">http://example.org/oai</request>
+    <error code="%s">message</error>
+</OAI-PMH>"""
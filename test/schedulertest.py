@@ -0,0 +1,186 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os.path import join
+from io import StringIO
+from threading import Lock, Thread
+from time import sleep
+
+from seecr.test import SeecrTestCase
+from seecr.zulutime import ZuluTime
+
+from meresco.fetch import Harvester, AsyncHarvester, AsyncUpload, Scheduler
+
+from harvesttest import Batch, Record
+from uploadtest import _SruUpdateServer
+
+
+class SchedulerTest(SeecrTestCase):
+    def setUp(self):
+        SeecrTestCase.setUp(self)
+        self.log = StringIO()
+        self.now = ZuluTime("1976-11-08T12:34:56Z").epoch
+        self.harvested = []
+        self.lock = Lock()
+        self.scheduler = Scheduler(concurrency=2, log=self.log)
+        self.scheduler._now = lambda: self.now
+
+    def _addHarvester(self, name, priority=0, harvestingReady=True, downloadBatch=None, **kwargs):
+        harvester = Harvester(join(self.tempdir, name), harvestInterval=100, errorInterval=10, errorJitter=0, **kwargs)
+        harvester._state.now = lambda: ZuluTime(self.now)
+        observer = _Observer(name, self, harvestingReady, downloadBatch)
+        harvester.addObserver(observer)
+        self.scheduler.addHarvester(harvester, priority=priority, name=name)
+        return harvester
+
+    def testRunDueHarvestersInPriorityOrder(self):
+        self.scheduler = Scheduler(concurrency=1, log=self.log)
+        self.scheduler._now = lambda: self.now
+        self._addHarvester('low', priority=0)
+        self._addHarvester('high', priority=10)
+        self._addHarvester('middle', priority=5)
+        self.scheduler.runDue()
+        self.assertEqual(['high', 'middle', 'low'], self.harvested)
+
+    def testNextHarvestTimeFromState(self):
+        ready = self._addHarvester('ready')
+        failing = self._addHarvester('failing', downloadBatch=_raises)
+        self.scheduler.runDue()
+        self.assertEqual(['ready', 'failing'], sorted(self.harvested, reverse=True))
+        self.assertEqual(self.now + 100, ready.nextHarvestTime())
+        self.assertEqual(self.now + 10, failing.nextHarvestTime())
+        self.assertTrue('Harvest of failing failed: help!' in self.log.getvalue(), self.log.getvalue())
+
+        self.harvested = []
+        self.now += 11
+        self.scheduler.runDue()
+        self.assertEqual(['failing'], self.harvested)
+
+        self.harvested = []
+        self.now += 90
+        self.scheduler.runDue()
+        self.assertEqual(['failing', 'ready'], sorted(self.harvested))
+
+    def testConcurrencyCap(self):
+        running = []
+        maxRunning = []
+        def downloadBatch(name):
+            with self.lock:
+                running.append(name)
+                maxRunning.append(len(running))
+            sleep(0.05)
+            with self.lock:
+                running.remove(name)
+        for i in range(5):
+            self._addHarvester('h%d' % i, downloadBatch=downloadBatch)
+        self.scheduler.runDue()
+        self.assertEqual(5, len(self.harvested))
+        self.assertEqual(2, max(maxRunning))
+
+    def testRunUntilStopped(self):
+        self.scheduler = Scheduler(concurrency=2, log=self.log, maxWait=0.01)
+        self._addHarvester('one')
+        self._addHarvester('two', harvestingReady=False)
+        thread = Thread(target=self.scheduler.run)
+        thread.start()
+        sleep(0.2)
+        self.scheduler.stop()
+        thread.join()
+        self.assertEqual(1, self.harvested.count('one'))
+        self.assertEqual(1, self.harvested.count('two'))
+
+    def testSqliteEventsHarvestedOnAnyThread(self):
+        harvester = self._addHarvester('sqlite', eventStore='sqlite')
+        for i in range(2):
+            self.scheduler.runDue()
+            self.now += 101
+        self.assertEqual('', self.log.getvalue())
+        self.assertEqual(['sqlite'] * 2, self.harvested)
+        self.assertEqual(['id'], list(harvester._events.remainingAdds()))
+
+    def testAsyncHarvesterWithAsyncUploadRunsRepeatedly(self):
+        requests = []
+        server = _SruUpdateServer(requests)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            harvester = AsyncHarvester(join(self.tempdir, 'async'), harvestInterval=100, errorInterval=10, errorJitter=0, uploadConcurrency=4)
+            harvester._state.now = lambda: ZuluTime(self.now)
+            harvester.addObserver(_Source('async', self))
+            upload = AsyncUpload(baseUrl='http://127.0.0.1:%s/update' % server.server_address[1], log=StringIO())
+            harvester.addObserver(upload)
+            self.scheduler.addHarvester(harvester, name='async')
+            for i in range(2):
+                self.scheduler.runDue()
+                self.now += 101
+            upload.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual('', self.log.getvalue())
+        self.assertEqual(['async'] * 2, self.harvested)
+        self.assertEqual(8, len(requests))
+
+
+class _Observer(object):
+    def __init__(self, name, test, harvestingReady, downloadBatch):
+        self._name = name
+        self._test = test
+        self._harvestingReady = harvestingReady
+        self._downloadBatch = downloadBatch
+
+    def downloadBatch(self, resumptionAttributes):
+        with self._test.lock:
+            self._test.harvested.append(self._name)
+        if self._downloadBatch is not None:
+            self._downloadBatch(self._name)
+        batch = Batch()
+        batch.records = [Record('id', 'data')]
+        batch.harvestingReady = self._harvestingReady
+        batch.quitForSleep = not self._harvestingReady
+        return batch
+
+    def convert(self, record):
+        return record.data
+
+    def uploadRecord(self, identifier, data):
+        pass
+
+class _Source(object):
+    def __init__(self, name, test):
+        self._name = name
+        self._test = test
+
+    def downloadBatch(self, resumptionAttributes):
+        self._test.harvested.append(self._name)
+        batch = Batch()
+        batch.records = [Record('id%d' % i, 'data%d.%d' % (i, len(self._test.harvested))) for i in range(4)]
+        batch.harvestingReady = True
+        return batch
+
+    def convert(self, record):
+        return record.data
+
+
+def _raises(name):
+    raise IOError('help!')
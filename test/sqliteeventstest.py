@@ -0,0 +1,134 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+from os.path import join, isfile
+from hashlib import md5
+
+from seecr.test import SeecrTestCase
+
+from meresco.fetch._sqliteevents import SqliteEvents
+
+
+class SqliteEventsTest(SeecrTestCase):
+    def testAlreadyAddedOrDeleted(self):
+        events = SqliteEvents(self.tempdir)
+        events.markHarvestStart()
+        events.markEvent('id0', uploadData='data0')
+        events.markEvent('id1', delete=True)
+        events.markHarvestReady()
+        self.assertTrue(events.alreadyAdded('id0', 'data0'))
+        self.assertFalse(events.alreadyAdded('id0', 'data0.changed'))
+        self.assertFalse(events.alreadyAdded('id1', 'data1'))
+        self.assertFalse(events.alreadyAdded('id2', 'data2'))
+        self.assertTrue(events.alreadyDeleted('id1'))
+        self.assertFalse(events.alreadyDeleted('id0'))
+        self.assertFalse(events.alreadyDeleted('id2'))
+
+    def testLookupsConsultCurrentEventsOfInterruptedHarvest(self):
+        events = SqliteEvents(self.tempdir)
+        events.markHarvestStart()
+        events.markEvent('id0', uploadData='data0')
+        events.markEvent('id1', uploadData='data1', sourceFingerprint='2020-01-01')
+        events.markHarvestReady()
+        events.markHarvestStart()
+        events.markEvent('id0', delete=True)
+        events.markEvent('id2', uploadData='data2')
+        events.flush()
+        events.markEvent('id3', uploadData='data3')
+        events = SqliteEvents(self.tempdir)
+        self.assertTrue(events.alreadyDeleted('id0'))
+        self.assertFalse(events.alreadyAdded('id0', 'data0'))
+        self.assertTrue(events.alreadyAdded('id2', 'data2'))
+        self.assertFalse(events.alreadyAdded('id3', 'data3'))
+        self.assertTrue(events.sourceUnchanged('id1', '2020-01-01'))
+        events.markHarvestStart()
+        events.markSourceUnchanged('id1')
+        events.markHarvestReady()
+        self.assertEqual(['id1', 'id2'], list(events.remainingAdds()))
+
+    def testToBeDeleted(self):
+        events = SqliteEvents(self.tempdir)
+        events.markHarvestStart()
+        for identifier in ['id3', 'id0', 'id1', 'id2']:
+            events.markEvent(identifier, uploadData='data')
+        events.markEvent('id4', delete=True)
+        events.markHarvestReady()
+        self.assertEqual([], list(events.toBeDeleted()))
+        events.markHarvestStart()
+        events.markEvent('id1', uploadData='data')
+        events.markEvent('id2', delete=True)
+        self.assertEqual(['id0', 'id3'], list(events.toBeDeleted()))
+
+    def testRemainingAdds(self):
+        events = SqliteEvents(self.tempdir)
+        events.markHarvestStart()
+        events.markEvent('id0', uploadData='data')
+        events.markEvent('id1', uploadData='data')
+        events.markEvent('id9', uploadData='data')
+        events.markHarvestReady()
+        self.assertEqual(['id0', 'id1', 'id9'], list(events.remainingAdds()))
+        events.markHarvestStart()
+        events.markEvent('id1', delete=True)
+        events.markEvent('id2', uploadData='data')
+        events.markEvent('id9', uploadData='data.changed')
+        self.assertEqual(['id0', 'id2', 'id9'], list(events.remainingAdds()))
+
+    def testMergeIntoPrevious(self):
+        events = SqliteEvents(self.tempdir)
+        events.markHarvestStart()
+        events.markEvent('id0', uploadData='data0')
+        events.markEvent('id1', uploadData='data1')
+        events.markHarvestReady()
+        events.markHarvestStart()
+        events.markEvent('id1', delete=True)
+        events.markEvent('id2', uploadData='data2')
+        events.markHarvestReady(merge=True)
+        self.assertEqual(['id0', 'id2'], list(events.remainingAdds()))
+        self.assertTrue(events.alreadyAdded('id0', 'data0'))
+        self.assertTrue(events.alreadyDeleted('id1'))
+
+    def testDiscardedEventsAreNotPersisted(self):
+        events = SqliteEvents(self.tempdir)
+        events.markHarvestStart()
+        events.markEvent('id0', uploadData='data')
+        events.flush()
+        events.markEvent('id1', uploadData='data')
+        events.discard()
+        events.markHarvestReady()
+        self.assertEqual(['id0'], list(SqliteEvents(self.tempdir).remainingAdds()))
+
+    def testImportFiles(self):
+        with open(join(self.tempdir, 'previous'), 'w') as f:
+            f.write("id:1\tA\t%s\n" % md5(b'data1').hexdigest())
+            f.write("id:2\tD\t\n")
+            f.write("id:3\tA\tdatahash\n")
+        with open(join(self.tempdir, 'current'), 'w') as f:
+            f.write("id:3\tA\tdatahash\n")
+        events = SqliteEvents(self.tempdir)
+        self.assertFalse(isfile(join(self.tempdir, 'previous')))
+        self.assertTrue(isfile(join(self.tempdir, 'previous.imported')))
+        self.assertTrue(isfile(join(self.tempdir, 'current.imported')))
+        self.assertTrue(events.alreadyAdded('id:1', 'data1'))
+        self.assertTrue(events.alreadyDeleted('id:2'))
+        self.assertEqual(['id:1'], list(events.toBeDeleted()))
@@ -0,0 +1,185 @@
+## begin license ##
+#
+# "Meresco Fetch" is a small framework to build simple, custom harvesters.
+#
+# Copyright (C) 2026 Seecr (Seek You Too B.V.) https://seecr.nl
+#
+# This file is part of "Meresco Fetch"
+#
+# "Meresco Fetch" is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# "Meresco Fetch" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "Meresco Fetch"; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+#
+## end license ##
+
+import asyncio
+from io import StringIO
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from time import sleep
+from re import search, findall
+
+from seecr.test import SeecrTestCase
+
+from meresco.fetch import Upload, AsyncUpload
+from meresco.fetch._sruupdate import SruUpdateException
+
+
+class UploadTest(SeecrTestCase):
+    def setUp(self):
+        SeecrTestCase.setUp(self)
+        self.requests = []
+        self.server = _SruUpdateServer(self.requests)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.log = StringIO()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        SeecrTestCase.tearDown(self)
+
+    def prepareUpload(self, **kwargs):
+        return Upload(baseUrl='http://127.0.0.1:%s/update' % self.server.server_address[1], log=self.log, **kwargs)
+
+    def testConcurrentUploadsKeepOrderPerIdentifier(self):
+        upload = self.prepareUpload(concurrency=4)
+        for i in range(20):
+            upload.uploadRecord(identifier='id%d' % i, data='<data>%s</data>' % ('slow' if i == 3 else i))
+        upload.deleteRecord(identifier='id3')
+        upload.flushUploads()
+        self.assertEqual(21, len(self.requests))
+        id3Actions = [action for clientPort, action, identifier in self.requests if identifier == 'id3']
+        self.assertEqual(['replace', 'delete'], id3Actions)
+        self.assertTrue(len(set(clientPort for clientPort, _, _ in self.requests)) <= 4)
+        self.assertTrue('Deleted: id3\n' in self.log.getvalue())
+        self.assertEqual(20, self.log.getvalue().count('Uploaded: '))
+
+    def testConcurrentUploadErrorRaisedOnFlush(self):
+        upload = self.prepareUpload(concurrency=2)
+        upload.uploadRecord(identifier='id0', data='<data/>')
+        upload.uploadRecord(identifier='id1', data='<data>fail</data>')
+        upload.uploadRecord(identifier='id2', data='<data/>')
+        self.assertRaises(SruUpdateException, upload.flushUploads)
+        self.assertEqual(3, len(self.requests))
+        upload.flushUploads()
+        self.assertFalse('Uploaded: id1' in self.log.getvalue())
+
+    def testCloseStopsWorkersUntilNextUse(self):
+        upload = self.prepareUpload(concurrency=2)
+        upload.uploadRecord(identifier='id0', data='<data/>')
+        upload.uploadRecord(identifier='id1', data='<data/>')
+        upload.flushUploads()
+        workers = upload._pool._workers
+        upload.close()
+        self.assertEqual([False, False], [worker.is_alive() for worker in workers])
+        self.assertEqual([None, None], [connection._connection for connection in upload._pool._connections])
+        upload.uploadRecord(identifier='id2', data='<data/>')
+        upload.flushUploads()
+        self.assertEqual(3, len(self.requests))
+        upload.closeUploads()
+        self.assertEqual(None, upload._pool._workers)
+
+    def testStalledUploadTimesOut(self):
+        upload = self.prepareUpload(concurrency=2, timeout=0.1)
+        upload.uploadRecord(identifier='id0', data='<data>stall</data>')
+        self.assertRaises(TimeoutError, upload.flushUploads)
+        upload.close()
+
+    def testUploadBatchPacksOperations(self):
+        upload = self.prepareUpload(bulk=True, maxBatchRecords=3, maxBatchBytes=100)
+        operations = [dict(action='add', identifier='id%d' % i, data='<data/>') for i in range(7)]
+        operations.append(dict(action='add', identifier='big', data='<data>%s</data>' % ('x' * 200)))
+        operations.append(dict(action='delete', identifier='id0'))
+        upload.uploadBatch(operations)
+        self.assertEqual([
+                [('replace', 'id0'), ('replace', 'id1'), ('replace', 'id2')],
+                [('replace', 'id3'), ('replace', 'id4'), ('replace', 'id5')],
+                [('replace', 'id6')],
+                [('replace', 'big')],
+                [('delete', 'id0')],
+            ], [identifiers for _, action, identifiers in self.requests])
+        self.assertEqual(1, len(set(clientPort for clientPort, _, _ in self.requests)))
+        self.assertTrue(self.log.getvalue().endswith('Uploaded: id6\nUploaded: big\nDeleted: id0\n'), self.log.getvalue())
+
+    def testConcurrentUploadBatchKeepsOrderPerIdentifier(self):
+        upload = self.prepareUpload(concurrency=3, bulk=True, maxBatchRecords=2)
+        operations = [dict(action='add', identifier='id%d' % i, data='<data/>') for i in range(10)]
+        operations += [dict(action='delete', identifier='id%d' % i) for i in range(10)]
+        upload.uploadBatch(operations)
+        performed = [operation for _, _, identifiers in self.requests for operation in identifiers]
+        self.assertEqual(20, len(performed))
+        for i in range(10):
+            self.assertEqual(['replace', 'delete'], [action for action, identifier in performed if identifier == 'id%d' % i])
+
+    def testAsyncUploadKeepsOrderPerIdentifier(self):
+        upload = AsyncUpload(baseUrl='http://127.0.0.1:%s/update' % self.server.server_address[1], log=self.log, concurrency=3, bulk=True)
+        async def harvest():
+            tasks = [asyncio.ensure_future(upload.uploadRecord(identifier='id%d' % i, data='<data>%s</data>' % ('slow' if i == 3 else i))) for i in range(10)]
+            tasks.append(asyncio.ensure_future(upload.deleteRecord(identifier='id3')))
+            await asyncio.gather(*tasks)
+            await upload.uploadBatch([dict(action='add', identifier='id%d' % i, data='<data/>') for i in range(4)])
+        asyncio.run(harvest())
+        upload.close()
+        self.assertEqual(None, upload._executor)
+        self.assertEqual(['replace', 'delete'], [action for _, action, identifier in self.requests if identifier == 'id3'])
+        self.assertEqual(['id0', 'id1', 'id2', 'id3'], sorted(identifier for _, action, identifiers in self.requests if action == 'bulk' for _, identifier in identifiers))
+        self.assertEqual(14, self.log.getvalue().count('Uploaded: id'))
+        self.assertTrue('Deleted: id3\n' in self.log.getvalue())
+
+    def testUploadBatchOnlyWhenBulkEnabled(self):
+        self.assertFalse(hasattr(self.prepareUpload(), 'uploadBatch'))
+        self.assertFalse(hasattr(AsyncUpload(baseUrl=None, log=self.log), 'uploadBatch'))
+        self.assertTrue(hasattr(self.prepareUpload(bulk=True), 'uploadBatch'))
+
+
+class _SruUpdateServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, requests):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), _SruUpdateHandler)
+        self.requests = requests
+        self.lock = Lock()
+
+
+class _SruUpdateHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        if 'slow' in body:
+            sleep(0.1)
+        if 'stall' in body:
+            sleep(0.5)
+        if 'bulkUpdateRequest' in body:
+            action = 'bulk'
+            identifier = findall(r'info:srw/action/1/(\w+)</ucp:action>\s*<ucp:recordIdentifier>(.*?)</ucp:recordIdentifier>', body)
+        else:
+            action = search(r'info:srw/action/1/(\w+)', body).group(1)
+            identifier = search(r'<ucp:recordIdentifier>(.*)</ucp:recordIdentifier>', body).group(1)
+        with self.server.lock:
+            self.server.requests.append((self.client_address[1], action, identifier))
+        response = RESPONSE % (b'fail' if 'fail' in body else b'success')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+RESPONSE = b"""<srw:updateResponse xmlns:srw="http://www.loc.gov/zing/srw/" xmlns:ucp="info:lc/xmlns/update-v1">
+    <srw:version>1.0</srw:version>
+    <ucp:operationStatus>%s</ucp:operationStatus>
+</srw:updateResponse>"""